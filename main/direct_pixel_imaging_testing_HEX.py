@@ -0,0 +1,109 @@
+import numpy as NP
+import antenna_array as AA
+import sim_observe as SIM
+import my_DSP_modules as DSP
+import aperture as APR
+import antenna_layout as AL
+
+# Compares the holographic image obtained by the direct transform at a few
+# pixels (NewImage.evalHolographicPixels) with the holographic image of
+# imagr() at the same pixels. Both must agree up to the sub-pixel offsets of
+# the antennas from the grid points since both are normalized by the sum of
+# the weights of imagr()
+
+lat = -30.7224 # Latitude of HERA in degrees
+f0 = 150e6 # Center frequency
+nts = 8
+nchan = 2 * nts
+channel_width = 40e3
+bandwidth = nchan * channel_width
+dt = 1/bandwidth
+ant_diameter = 4.0
+tol = 0.05 # Tolerance on the difference relative to the peak of the pixels
+
+ant_locs, ant_id = AL.hexagon_generator(ant_diameter, n_total=37)
+ant_locs = ant_locs - NP.mean(ant_locs, axis=0, keepdims=True)
+n_antennas = ant_locs.shape[0]
+
+src_seed = 50
+rstate = NP.random.RandomState(src_seed)
+n_src = 4
+lmrad = rstate.uniform(low=0.0, high=0.2, size=n_src).reshape(-1,1)
+lmang = rstate.uniform(low=0.0, high=2*NP.pi, size=n_src).reshape(-1,1)
+skypos = NP.hstack((lmrad * NP.cos(lmang), lmrad * NP.sin(lmang))).reshape(-1,2)
+skypos = NP.hstack((skypos, NP.sqrt(1.0-(skypos[:,0]**2 + skypos[:,1]**2)).reshape(-1,1)))
+src_flux = 10.0*NP.ones(n_src)
+
+ant_kerntype = {pol: 'func' for pol in ['P1','P2']}
+ant_kernshape = {pol: 'circular' for pol in ['P1','P2']}
+ant_kernshapeparms = {pol: {'xmax':0.5*ant_diameter, 'ymax':0.5*ant_diameter, 'rmin': 0.0, 'rmax': 0.5*ant_diameter, 'rotangle':0.0} for pol in ['P1','P2']}
+ant_aprtr = APR.Aperture(pol_type='dual', kernel_type=ant_kerntype,
+                         shape=ant_kernshape, parms=ant_kernshapeparms,
+                         lkpinfo=None, load_lookup=True)
+
+aar = AA.AntennaArray()
+for i in xrange(n_antennas):
+    ant = AA.Antenna('{0:0d}'.format(int(ant_id[i])), lat, ant_locs[i,:], f0, nsamples=nts, aperture=ant_aprtr)
+    ant.f = ant.f0 + DSP.spectax(2*nts, dt, shift=True)
+    aar = aar + ant
+
+aar.grid(xypad=2*ant_diameter)
+antpos_info = aar.antenna_positions(sort=True, centering=True)
+
+E_timeseries_dict = SIM.stochastic_E_timeseries(f0, nchan/2, 2*channel_width,
+                                                flux_ref=src_flux, skypos=skypos,
+                                                antpos=antpos_info['positions'],
+                                                tshift=False)
+update_info = {}
+update_info['antennas'] = []
+update_info['antenna_array'] = {}
+update_info['antenna_array']['timestamp'] = 0.0
+for label in aar.antennas:
+    adict = {}
+    adict['label'] = label
+    adict['action'] = 'modify'
+    adict['timestamp'] = 0.0
+    ind = antpos_info['labels'].index(label)
+    adict['t'] = E_timeseries_dict['t']
+    adict['gridfunc_freq'] = 'scale'
+    adict['gridmethod'] = 'NN'
+    adict['distNN'] = 3.0
+    adict['tol'] = 1.0e-6
+    adict['maxmatch'] = 1
+    adict['Et'] = {}
+    adict['flags'] = {}
+    for pol in ['P1', 'P2']:
+        adict['flags'][pol] = False
+        adict['Et'][pol] = E_timeseries_dict['Et'][:,ind]
+    update_info['antennas'] += [adict]
+
+aar.update(update_info, parallel=False, verbose=False)
+aar.genMappingMatrix(pol='P1', method='NN', distNN=0.5*ant_diameter, identical_antennas=True, gridfunc_freq='scale', wts_change=False, parallel=False)
+
+efimgobj = AA.NewImage(antenna_array=aar, pol='P1')
+efimgobj.imagr(pol='P1', weighting='natural', pad=0, grid_map_method='sparse', cal_loop=False)
+
+# Pixels of the image nearest to the sources
+
+pixind = NP.asarray([NP.unravel_index(NP.argmin((efimgobj.gridl-l)**2 + (efimgobj.gridm-m)**2), efimgobj.gridl.shape) for l, m in skypos[:,:2]])
+lm = NP.hstack((efimgobj.gridl[pixind[:,0],pixind[:,1]].reshape(-1,1), efimgobj.gridm[pixind[:,0],pixind[:,1]].reshape(-1,1)))
+
+holimg_pixels = efimgobj.holimg['P1'][pixind[:,0],pixind[:,1],:]
+direct_pixels = efimgobj.evalHolographicPixels(lm, pol='P1')['P1']
+
+reldiff = NP.abs(direct_pixels - holimg_pixels).max(axis=0) / NP.abs(holimg_pixels).max(axis=0)
+print 'Maximum difference relative to the peak of the pixels per channel: {0}'.format(reldiff)
+if NP.any(reldiff > tol):
+    raise ValueError('Direct transform at the pixels deviates from the holographic image')
+print 'Direct transform at the pixels matches the holographic image'
+
+# The normalization of the direct transform is that of imagr() which is not
+# applicable with uniform weighting
+
+efimgobj.imagr(pol='P1', weighting='uniform', pad=0, grid_map_method='sparse', cal_loop=False)
+try:
+    efimgobj.evalHolographicPixels(lm, pol='P1')
+except ValueError:
+    print 'Direct transform at the pixels refused after imaging with uniform weighting'
+else:
+    raise ValueError('Direct transform at the pixels must not be applicable after imaging with uniform weighting')
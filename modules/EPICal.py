@@ -109,7 +109,14 @@ class cal:
     update_model_vis:   Updates the model visibilities and cal pixel.
 
     update_cal:         Updates the calibration solution given the curr_gains, sky_model,
-                        and input data.
+                        and input data. If direct is True, the holographic image at the
+                        cal pixels is computed directly from the E-fields rather than
+                        taken from the image (see NewImage.evalHolographicPixels). In
+                        either case imgobj.imagr() must have run at least once, with
+                        natural weighting if direct is True. The direct values are
+                        normalized as the image of the latest imagr() call and match
+                        it up to the sub-pixel offsets of the antennas from the grid
+                        points and to changes of the flags since that call.
 
     calc_corr:           Calculate correlation needed for calibration.
 
@@ -303,15 +310,23 @@ class cal:
 
     ######
 
-    def update_cal(self, Edata, imgobj):
+    def update_cal(self, Edata, imgobj, direct=False):
+        # The pixel locations of the cal sources (and the phase fix) are taken from the image grid
+        if (not isinstance(imgobj.gridl, NP.ndarray)) or (not isinstance(imgobj.gridm, NP.ndarray)):
+            raise ValueError('The l and m grids of the image are not set. imgobj.imagr() must have run at least once before calibration, also with direct=True.')
+
         # Check if correlation pixel is known
         if self.cal_pix_inds is None:
             self.update_model_vis(imgobj.gridl, imgobj.gridm)
 
         #imgdata = imgobj.holimg[self.pol][self.cal_pix_ind[0],self.cal_pix_ind[1],:].flatten()
-        imgdata = NP.zeros((self.n_cal_sources,self.n_chan),dtype=NP.complex64)
-        for i in xrange(self.n_cal_sources):
-            imgdata[i,:] = imgobj.holimg[self.pol][self.cal_pix_inds[i,0],self.cal_pix_inds[i,1],:].flatten()
+        if direct:
+            # Direct transform at the cal pixels only. Once imagr() has run at least once, the imaging of later timestamps can then be skipped.
+            imgdata = imgobj.evalHolographicPixels(self.cal_pix_locs[:,0:2], pol=self.pol, cal_loop=True)[self.pol].astype(NP.complex64)
+        else:
+            imgdata = NP.zeros((self.n_cal_sources,self.n_chan),dtype=NP.complex64)
+            for i in xrange(self.n_cal_sources):
+                imgdata[i,:] = imgobj.holimg[self.pol][self.cal_pix_inds[i,0],self.cal_pix_inds[i,1],:].flatten()
 
         self.calc_corr(Edata,imgdata)
 
@@ -1,7 +1,11 @@
 import numpy as NP
 import multiprocessing as MP
+from multiprocessing.pool import ThreadPool
 import itertools as IT
 import copy
+import os
+import tempfile
+import hashlib
 import scipy.constants as FCNST
 import scipy.sparse as SM
 from astropy.io import fits
@@ -14,6 +18,10 @@ import my_operations as OPS
 import lookup_operations as LKP
 import aperture as APR
 
+# FFT backends (and their plans) of the imaging worker processes (see 
+# member function setImagingPool() of class NewImage)
+imaging_worker_backends = {}
+
 ################### Routines essential for parallel processing ################
 
 def unwrap_antenna_FT(arg, **kwarg):
@@ -92,25 +100,986 @@ def baseline_grid_mapper(gridind_raveled, values, bins, label, outq):
 def find_1NN_arg_splitter(args, **kwargs):
     return LKP.find_1NN(*args, **kwargs)
 
-def genMatrixMapper_arg_splitter(args, **kwargs):
-    return genMatrixMapper(*args, **kwargs)
-
-def genMatrixMapper(val, ind, shape):
-    if not isinstance(val, NP.ndarray):
-        raise TypeError('Input parameter val must be a numpy array')
-    if not isinstance(ind, (list,tuple)):
-        raise TypeError('Input parameter ind must be a list or tuple containing numpy arrays')
-    if val.size != ind[0].size:
-        raise ValueError('Input parameters val and ind must have the same size')
-    if not isinstance(shape, (tuple,list)):
-        raise TypeError('Input parameter shape must be a tuple or list')
-    if len(ind) != len(shape):
-        raise ValueError('Number of index groups in input parameter must match the number of dimensions specified in input parameter shape')
-    if len(ind) > 1:
-        for i in range(len(ind)-1):
-            if ind[i+1].size != ind[i].size:
-                raise ValueError('All index groups must have same size')
-    return SM.csr_matrix((val, ind), shape=shape)
+def grouped_aperture_kernel(apertures, locs, wavelength, bounds, pol,
+                            rmaxNN=None):
+
+    # Estimates the kernel at locations locs ordered by element where the
+    # locations of element i lie within bounds[i]:bounds[i+1]. Elements with
+    # equivalent apertures (equal Aperture.signature()) are estimated 
+    # together in a single call and the results written into a preallocated
+    # buffer
+
+    groups = {}
+    for i, aprtr in enumerate(apertures):
+        if bounds[i+1] > bounds[i]:
+            groups.setdefault(aprtr.signature(pol=pol), []).append(i)
+
+    list_of_ind = []
+    list_of_krn = []
+    for elements in groups.itervalues():
+        ind = NP.concatenate([NP.arange(bounds[i], bounds[i+1]) for i in elements])
+        krndict = apertures[elements[0]].compute(locs[ind,:], wavelength=wavelength[ind], pol=pol, rmaxNN=rmaxNN, load_lookup=False)
+        list_of_ind += [ind]
+        list_of_krn += [NP.asarray(krndict[pol])]
+
+    if len(list_of_krn) == 0:
+        return None
+    krn = NP.empty(locs.shape[0], dtype=NP.result_type(*list_of_krn))
+    for ind, grpkrn in IT.izip(list_of_ind, list_of_krn):
+        krn[ind] = grpkrn
+    return krn
+
+def aperture_voltage_pattern(aprtr, lm, du, dv, wavelength, pol):
+
+    # Voltage pattern of aperture aprtr for polarization pol at the direction
+    # cosines lm (n_pix x 2) and wavelengths (nchan) as obtained from the 
+    # imaging FFT of its kernel gridded on the uv-grid with spacings du and 
+    # dv, i.e. the direct Fourier transform of the kernel sampled at the grid
+    # offsets from the element normalized by the sum of these samples. The 
+    # element is assumed to lie on a grid point. Returns an array of size 
+    # n_pix x nchan
+
+    reach = max(NP.sqrt(aprtr.xmax[pol]**2 + aprtr.ymax[pol]**2), aprtr.rmax[pol])
+    vpattern = NP.empty((lm.shape[0], wavelength.size), dtype=NP.complex128)
+    for ch, wl in enumerate(wavelength):
+        nu = int(NP.ceil(reach / (du*wl)))
+        nv = int(NP.ceil(reach / (dv*wl)))
+        offu, offv = NP.meshgrid(du*NP.arange(-nu,nu+1), dv*NP.arange(-nv,nv+1))
+        offu = offu.ravel()
+        offv = offv.ravel()
+        krn = aprtr.compute(NP.hstack(((offu*wl).reshape(-1,1), (offv*wl).reshape(-1,1))), wavelength=wl, pol=pol, rmaxNN=0.5*NP.sqrt(du**2+dv**2)*wl, load_lookup=False)
+        krn = NP.asarray(krn[pol]).ravel()
+        vpattern[:,ch] = NP.dot(NP.exp(-1j * 2 * NP.pi * (lm[:,0].reshape(-1,1)*offu + lm[:,1].reshape(-1,1)*offv)), krn) / NP.sum(krn)
+    return vpattern
+
+def mapping_matrix_block(kernel, elem_xy, ind, fvu_gridind, bounds, gridu,
+                         gridv, wavelength, pol, eltbeg, eltend):
+
+    # Determines the grid indices, the kernel and its per-element per-channel
+    # normalization for the contributions of elements eltbeg:eltend (which
+    # lie within bounds[eltbeg]:bounds[eltend] of ind and fvu_gridind) and
+    # the block of columns of the sparse mapping matrix in CSR format they
+    # make up. kernel(dxy, wavelength, eltbeg, eltend) returns a dictionary
+    # of kernels under polarization keys (which may include polarizations 
+    # other than pol). The work is done in NumPy and SciPy routines that 
+    # release the GIL so that blocks can be processed by threads
+
+    nchan = wavelength.size
+    beg = bounds[eltbeg]
+    end = bounds[eltend]
+    f_gridind, v_gridind, u_gridind = NP.unravel_index(fvu_gridind[beg:end], (nchan,)+gridu.shape)
+    wl = wavelength[f_gridind]
+    dxy = NP.hstack((gridu[v_gridind,u_gridind].reshape(-1,1), gridv[v_gridind,u_gridind].reshape(-1,1))) * wl.reshape(-1,1) - elem_xy[ind[beg:end],:]
+    krndict = kernel(dxy, wl, eltbeg, eltend)
+    colind = (ind[beg:end] - eltbeg) * nchan + f_gridind
+    kernel_sum = grid_scatter_add(colind, krndict[pol], (eltend-eltbeg)*nchan)
+    norm_wts = (1.0 / kernel_sum[colind]).astype(NP.complex64)
+    gridind_raveled = NP.ravel_multi_index((v_gridind, u_gridind, f_gridind), gridu.shape+(nchan,))
+    spmat = SM.csr_matrix((norm_wts * krndict[pol], (gridind_raveled, colind)), shape=(gridu.size*nchan, (eltend-eltbeg)*nchan))
+    return {'f_gridind': f_gridind, 'v_gridind': v_gridind, 'u_gridind': u_gridind, 'gridind_raveled': gridind_raveled, 'krn': krndict, 'norm_wts': norm_wts, 'spmat': spmat}
+
+def mapping_matrix_block_arg_splitter(args, **kwargs):
+    return mapping_matrix_block(*args, **kwargs)
+
+def mapping_matrix_rows(colblocks, beg, end):
+
+    # Rows beg:end of the sparse matrix made of the CSR column blocks 
+
+    return SM.hstack([spmat[beg:end,:] for spmat in colblocks], format='csr')
+
+def mapping_matrix_rows_arg_splitter(args, **kwargs):
+    return mapping_matrix_rows(*args, **kwargs)
+
+def threaded_mapping_matrix(kernel, elem_xy, ind, fvu_gridind, bounds, gridu,
+                            gridv, wavelength, pol, nthreads):
+
+    # Determines the sparse element-to-grid mapping matrix in CSR format 
+    # along with the grid indices, kernel and normalization of the 
+    # contributions (ordered as ind) with threads. In the first stage each 
+    # thread handles a block of elements (see mapping_matrix_block()) 
+    # yielding a block of columns. In the second stage each thread assembles
+    # a block of rows from the column blocks and the row blocks are stacked 
+    # by concatenating their CSR arrays
+
+    n_elem = bounds.size - 1
+    nblocks = max(min(4*nthreads, n_elem), 1)
+    eltbounds = NP.unique(NP.linspace(0, n_elem, nblocks+1).astype(NP.int))
+    pool = ThreadPool(processes=nthreads)
+    list_of_args = [(kernel, elem_xy, ind, fvu_gridind, bounds, gridu, gridv, wavelength, pol, eltbeg, eltend) for eltbeg, eltend in IT.izip(eltbounds[:-1], eltbounds[1:])]
+    list_of_blocks = pool.map(mapping_matrix_block_arg_splitter, list_of_args)
+    nrows = gridu.size * wavelength.size
+    rowbounds = NP.unique(NP.linspace(0, nrows, max(min(4*nthreads, nrows), 1)+1).astype(NP.int))
+    colblocks = [block['spmat'] for block in list_of_blocks]
+    list_of_args = [(colblocks, beg, end) for beg, end in IT.izip(rowbounds[:-1], rowbounds[1:])]
+    rowblocks = pool.map(mapping_matrix_rows_arg_splitter, list_of_args)
+    pool.close()
+    pool.join()
+
+    outdict = {'spmat': SM.vstack(rowblocks, format='csr'), 'krn': {}}
+    for key in ['f_gridind', 'v_gridind', 'u_gridind', 'gridind_raveled', 'norm_wts']:
+        outdict[key] = NP.concatenate([block[key] for block in list_of_blocks])
+    for key in list_of_blocks[0]['krn']:
+        outdict['krn'][key] = NP.concatenate([NP.asarray(block['krn'][key]) for block in list_of_blocks])
+    return outdict
+
+def grid_scatter_add(gridind_raveled, values, size):
+
+    # Accumulates values onto a flattened grid of given size in a single pass.
+    # Unlike fancy-indexed +=, repeated indices are summed and not dropped
+
+    if NP.iscomplexobj(values):
+        retval = NP.bincount(gridind_raveled, weights=values.real, minlength=size).astype(NP.complex_)
+        retval += 1j * NP.bincount(gridind_raveled, weights=values.imag, minlength=size)
+    else:
+        retval = NP.bincount(gridind_raveled, weights=values, minlength=size)
+    return retval
+
+def stencil_find_NN(ant_xy, gridu, gridv, wavelength, distance_ULIM,
+                    chunk_channels=None):
+
+    # Finds grid locations (nchan x nv x nu flattened) within distance_ULIM
+    # of each antenna without a tree search over all channels and grid cells.
+    # The footprint of integer pixel offsets that can lie within 
+    # distance_ULIM of any sub-pixel position is determined around the 
+    # origin and translated to the pixel containing each antenna in all 
+    # channels of a chunk of chunk_channels channels at once. Output is 
+    # ordered by antenna as in LKP.find_NN(..., flatten=True) and includes 
+    # the separations of the grid locations from the antennas in units of 
+    # the grid spacings (N x 2) used by stencil_kernel()
+
+    nchan = wavelength.size
+    if chunk_channels is None:
+        chunk_channels = nchan
+    chunk_channels = max(int(chunk_channels), 1)
+    nv, nu = gridu.shape
+    u_1D = gridu[0,:]
+    v_1D = gridv[:,0]
+    du = u_1D[1] - u_1D[0]
+    dv = v_1D[1] - v_1D[0]
+    list_antind = []
+    list_fvu_gridind = []
+    list_sep = []
+    for cbeg in xrange(0, nchan, chunk_channels):
+        cend = min(cbeg+chunk_channels, nchan)
+        wl = wavelength[cbeg:cend].reshape(-1,1,1)
+        offu_max = int(NP.ceil(distance_ULIM / (du * wl.min()))) + 1
+        offv_max = int(NP.ceil(distance_ULIM / (dv * wl.min()))) + 1
+        offu, offv = NP.meshgrid(NP.arange(-offu_max, offu_max+1), NP.arange(-offv_max, offv_max+1))
+        offu = offu.ravel()
+        offv = offv.ravel()
+        gapu = NP.maximum(0, NP.maximum(-offu, offu-1)) * du * wl.min()
+        gapv = NP.maximum(0, NP.maximum(-offv, offv-1)) * dv * wl.min()
+        in_footprint = gapu**2 + gapv**2 <= distance_ULIM**2
+        offu = offu[in_footprint].reshape(1,1,-1)
+        offv = offv[in_footprint].reshape(1,1,-1)
+
+        # Antennas along the first axis and the footprint ordered by v and 
+        # u make the selected locations ordered by antenna and grid index
+        wl = wl.reshape(1,-1,1)
+        ant_u = ant_xy[:,0].reshape(-1,1,1) / wl   # n_ant x nchunk x 1
+        ant_v = ant_xy[:,1].reshape(-1,1,1) / wl
+        u_ind = NP.floor((ant_u - u_1D[0]) / du).astype(NP.int) + offu   # n_ant x nchunk x nfootprint
+        v_ind = NP.floor((ant_v - v_1D[0]) / dv).astype(NP.int) + offv
+        sepu = (u_1D[NP.clip(u_ind, 0, nu-1)] - ant_u) / du
+        sepv = (v_1D[NP.clip(v_ind, 0, nv-1)] - ant_v) / dv
+        select = (u_ind >= 0) & (u_ind < nu) & (v_ind >= 0) & (v_ind < nv) & ((sepu*du*wl)**2 + (sepv*dv*wl)**2 <= distance_ULIM**2)
+        antind, chanind, footind = NP.nonzero(select)
+        list_antind += [antind]
+        list_fvu_gridind += [NP.ravel_multi_index((chanind+cbeg, v_ind[select], u_ind[select]), (nchan, nv, nu))]
+        list_sep += [NP.hstack((sepu[select].reshape(-1,1), sepv[select].reshape(-1,1)))]
+
+    antind = NP.concatenate(list_antind)
+    fvu_gridind = NP.concatenate(list_fvu_gridind)
+    sep = NP.concatenate(list_sep)
+    if len(list_antind) > 1:
+        # Chunks follow one another in channels
+        sortind = NP.argsort(antind, kind='mergesort')
+        antind = antind[sortind]
+        fvu_gridind = fvu_gridind[sortind]
+        sep = sep[sortind,:]
+    return (antind, fvu_gridind, sep)
+
+def stencil_kernel(aperture, sep, f_gridind, du, dv, wavelength, distance_ULIM,
+                   pol, rmaxNN=None, oversampling=None):
+
+    # Estimates the kernel of aperture (identical for all elements) at the 
+    # separations sep (N x 2, in units of the grid spacings du and dv as 
+    # returned by stencil_find_NN()) in channels f_gridind. If oversampling
+    # is None, the kernel is evaluated exactly at sep. Otherwise, per 
+    # channel, the kernel is evaluated once on the footprint around the 
+    # origin sampled oversampling times finer than the grid and is 
+    # interpolated bilinearly at sep, i.e. from the integer sample offsets 
+    # and the sub-sample weights. Returns a dictionary of the kernels under
+    # polarizations pol
+
+    if not isinstance(pol, list):
+        pol = [pol]
+    if oversampling is None:
+        wl = wavelength[f_gridind]
+        dxy = NP.hstack(((sep[:,0]*du*wl).reshape(-1,1), (sep[:,1]*dv*wl).reshape(-1,1)))
+        return aperture.compute(dxy, wavelength=wl, pol=pol, rmaxNN=rmaxNN, load_lookup=False)
+    oversampling = int(oversampling)
+    nsamp_u = int(NP.ceil(distance_ULIM / (du * wavelength.min()) * oversampling)) + 1
+    nsamp_v = int(NP.ceil(distance_ULIM / (dv * wavelength.min()) * oversampling)) + 1
+    tu, tv = NP.meshgrid(NP.arange(-nsamp_u, nsamp_u+1) / float(oversampling), NP.arange(-nsamp_v, nsamp_v+1) / float(oversampling))
+    wl = wavelength.reshape(-1,1,1)
+    locu = tu * du * wl   # nchan x nsamples_v x nsamples_u
+    locv = tv * dv * wl
+    # Only the samples bordering separations within distance_ULIM are evaluated
+    needed = locu**2 + locv**2 <= (distance_ULIM + NP.sqrt(2.0) * max(du, dv) * wl / oversampling)**2
+    krndict = aperture.compute(NP.hstack((locu[needed].reshape(-1,1), locv[needed].reshape(-1,1))), wavelength=NP.broadcast_to(wl, needed.shape)[needed], pol=pol, rmaxNN=rmaxNN, load_lookup=False)
+    rowsize = needed.shape[2]
+
+    ku = sep[:,0] * oversampling + nsamp_u
+    kv = sep[:,1] * oversampling + nsamp_v
+    iu = NP.clip(NP.floor(ku).astype(NP.int), 0, rowsize-2)
+    iv = NP.clip(NP.floor(kv).astype(NP.int), 0, needed.shape[1]-2)
+    corner = NP.ravel_multi_index((f_gridind, iv, iu), needed.shape)
+    krn = {}
+    for p in pol:
+        table = NP.zeros(needed.shape, dtype=NP.asarray(krndict[p]).dtype)
+        table[needed] = krndict[p]
+        table = table.ravel()
+        wu = (ku - iu).astype(NP.finfo(table.dtype).dtype)
+        wv = (kv - iv).astype(wu.dtype)
+        lower = table[corner]
+        lower += wu * (table[corner+1] - lower)
+        upper = table[corner+rowsize]
+        upper += wu * (table[corner+rowsize+1] - upper)
+        upper -= lower
+        upper *= wv
+        lower += upper
+        krn[p] = lower
+    return krn
+
+def chunked_find_NN(ant_xy, gridu, gridv, wavelength, distance_ULIM,
+                    chunk_channels=None):
+
+    # Equivalent of LKP.find_NN(ant_xy, grid_xy, flatten=True) where grid_xy
+    # is the grid scaled by wavelength for all channels (nchan x nv x nu) but
+    # the scaled grid is built and searched for chunk_channels channels at a
+    # time which bounds the size of the temporary arrays. Output is ordered
+    # by antenna and by channel within each antenna
+
+    nchan = wavelength.size
+    if chunk_channels is None:
+        chunk_channels = nchan
+    chunk_channels = max(int(chunk_channels), 1)
+    gridlocs = NP.hstack((gridu.reshape(-1,1), gridv.reshape(-1,1)))
+    list_antind = []
+    list_fvu_gridind = []
+    for cbeg in xrange(0, nchan, chunk_channels):
+        cend = min(cbeg+chunk_channels, nchan)
+        grid_xy = gridlocs[NP.newaxis,:,:] * wavelength[cbeg:cend].reshape(-1,1,1)   # nchunk x nv x nu
+        indNN_list, antind, fvu_gridind = LKP.find_NN(ant_xy, grid_xy.reshape(-1,2), distance_ULIM=distance_ULIM, flatten=True, parallel=False)
+        list_antind += [NP.asarray(antind, dtype=NP.int)]
+        list_fvu_gridind += [NP.asarray(fvu_gridind, dtype=NP.int) + cbeg*gridu.size]
+
+    antind = NP.concatenate(list_antind)
+    fvu_gridind = NP.concatenate(list_fvu_gridind)
+    sortind = NP.argsort(antind, kind='mergesort')
+    antind = antind[sortind]
+    fvu_gridind = fvu_gridind[sortind]
+    antbounds = NP.concatenate(([0], NP.cumsum(NP.bincount(antind, minlength=ant_xy.shape[0]))))
+    indNN_list = [fvu_gridind[antbounds[ai]:antbounds[ai+1]] for ai in xrange(ant_xy.shape[0])]
+    return (indNN_list, antind, fvu_gridind)
+
+def fft2_on_backend(inp, s=None, axes=(0,1), inverse=False, backend=None):
+
+    # Two-dimensional forward (or inverse if inverse is True) FFT of inp 
+    # along axes using the FFT backend described by dictionary backend (see 
+    # member function setFFTBackend() of class NewImage). If backend is None,
+    # numpy FFT is used. Plans created by pyFFTW are cached in the backend 
+    # under key 'plans' and reused for inputs of the same shape and type. 
+    # The precision of the transform follows that of inp with either 
+    # backend, so inputs to transforms that must be accurate in double 
+    # precision have to be upcast by the caller. axes may also hold a single
+    # axis for a one-dimensional FFT
+
+    if backend is None:
+        backend = {'name': 'numpy'}
+
+    if backend['name'] == 'numpy':
+        # numpy FFT always computes in double precision. Single precision 
+        # inputs get single precision outputs as with pyFFTW at the cost of
+        # a cast, hence single precision gives no FFT speedup here
+        if inverse:
+            out = NP.fft.ifftn(inp, s=s, axes=axes)
+        else:
+            out = NP.fft.fftn(inp, s=s, axes=axes)
+        if NP.asarray(inp).dtype in (NP.float32, NP.complex64):
+            out = out.astype(NP.complex64)
+        return out
+    elif backend['name'] == 'pyfftw':
+        import pyfftw.builders as FFTW
+        inp = NP.asarray(inp)
+        if s is not None:
+            s = tuple(s)
+        plankey = (inp.shape, inp.dtype.str, s, tuple(axes), inverse)
+        if plankey not in backend['plans']:
+            if inverse:
+                builder = FFTW.ifftn
+            else:
+                builder = FFTW.fftn
+            backend['plans'][plankey] = builder(NP.empty(inp.shape, dtype=inp.dtype), s=s, axes=axes, threads=backend['workers'], planner_effort=backend['planner_effort'])
+        # The output array of a plan is overwritten by its next execution 
+        return NP.copy(backend['plans'][plankey](inp))
+    else:
+        raise ValueError('Invalid FFT backend specified')
+
+################################################################################
+
+def pruned_fft2(inp, s, bounds, axes=(0,1), backend=None):
+
+    # Equivalent of fft2_on_backend(inp, s=s, axes=axes) for inp which is 
+    # zero outside the index ranges bounds[0] and bounds[1] (lower bound 
+    # inclusive, upper bound exclusive) along axes[0] and axes[1]. The FFT is
+    # done as two one-dimensional passes where the first pass transforms 
+    # only the occupied block along axes[0] and hence skips the all-zero 
+    # lines. The offsets of the block are applied as phase ramps in place on
+    # the output
+
+    outshape = list(inp.shape)
+    outshape[axes[0]] = s[0]
+    outshape[axes[1]] = s[1]
+    if any([hi <= lo for lo, hi in bounds]):
+        return NP.zeros(outshape, dtype=NP.result_type(inp.dtype, NP.complex64))
+
+    select = [slice(None)] * inp.ndim
+    for ax, (lo, hi) in IT.izip(axes, bounds):
+        select[ax] = slice(lo, hi)
+    out = fft2_on_backend(inp[tuple(select)], s=[s[0]], axes=(axes[0],), backend=backend)
+    out = fft2_on_backend(out, s=[s[1]], axes=(axes[1],), backend=backend)
+    for ax, n, (lo, hi) in IT.izip(axes, s, bounds):
+        if lo != 0:
+            bshape = [1] * out.ndim
+            bshape[ax] = n
+            out *= NP.exp(-2j*NP.pi*NP.arange(n)*lo/float(n)).astype(out.dtype).reshape(bshape)
+    return out
+
+################################################################################
+
+def checkerboard(shape, axes=(0,1), ndim=None, offset=None):
+
+    # Returns the +1/-1 checkerboard (-1)**(i+j+...) over the indices along 
+    # axes whose lengths are in shape, with offset added to the indices, 
+    # reshaped to broadcast against an array with ndim dimensions. For an even
+    # transform length, multiplying the input by it is equivalent to shifting
+    # the transform output by half its length (fftshift) and vice versa
+
+    if ndim is None:
+        ndim = max(axes) + 1
+    if offset is None:
+        offset = [0] * len(axes)
+    chk = NP.ones((1,)*ndim, dtype=NP.int8)
+    for ax, n, off in IT.izip(axes, shape, offset):
+        bshape = [1] * ndim
+        bshape[ax] = n
+        chk = chk * (1 - 2 * ((NP.arange(n) + off) % 2)).astype(NP.int8).reshape(bshape)
+    return chk
+
+################################################################################
+
+def centered_padding_phase(shape, padding, axes=(0,1), ndim=None):
+
+    # Returns the phase factor which turns the transform along axes of an 
+    # uncentered grid multiplied by checkerboard() and zero-padded at the end
+    # to shape+2*padding (through the FFT size argument) into the fftshift of
+    # the transform of the ifftshift of the grid zero-padded by padding on 
+    # either side, i.e. the centered transform of a centered padded grid. The
+    # padded lengths must be even. The phase factor is a product of 1D phase 
+    # ramps along axes and broadcasts against an array with ndim dimensions
+
+    if ndim is None:
+        ndim = max(axes) + 1
+    phase = NP.ones((1,)*ndim, dtype=NP.complex128)
+    for ax, n, npad in IT.izip(axes, shape, padding):
+        m = n + 2*npad
+        k = NP.arange(m)
+        bshape = [1] * ndim
+        bshape[ax] = m
+        phase = phase * ((-1.0)**(k + m/2 + npad) * NP.exp(-2j*NP.pi*k*npad/m)).reshape(bshape)
+    return phase
+
+################################################################################
+
+def centered_fft2(grid, padding, axes=(0,1), overwrite=False, bounds=None,
+                  backend=None):
+
+    # Returns the centered transform of the centered grid zero-padded by 
+    # padding on either side along axes, i.e. the equivalent of 
+    # fftshift(fft2(ifftshift(pad(grid)))) without materializing the padded
+    # and shifted copies. If overwrite is True, grid is multiplied in place
+    # by the checkerboard and hence modified. If bounds is not None, grid is
+    # zero outside the index ranges in bounds along axes and the FFT skips 
+    # the all-zero lines (see pruned_fft2())
+
+    shape = [grid.shape[ax] for ax in axes]
+    padded_shape = [n + 2*npad for n, npad in IT.izip(shape, padding)]
+    chk = checkerboard(shape, axes=axes, ndim=grid.ndim)
+    if overwrite:
+        grid *= chk
+    else:
+        grid = grid * chk
+    if bounds is None:
+        out = fft2_on_backend(grid, s=padded_shape, axes=axes, backend=backend)
+    else:
+        out = pruned_fft2(grid, padded_shape, bounds, axes=axes, backend=backend)
+    out *= centered_padding_phase(shape, padding, axes=axes, ndim=grid.ndim).astype(out.dtype)
+    return out
+
+################################################################################
+
+def imag_tolerance(arr):
+
+    # Largest imaginary part of the transform arr of a Hermitian grid that is
+    # attributable to rounding in the precision of arr, i.e. 100 times the
+    # machine epsilon relative to the peak magnitude of arr. It is never 
+    # smaller than the absolute tolerance 1e-10 used in double precision
+
+    return max(1e-10, 100 * NP.finfo(arr.dtype).eps * NP.abs(arr).max())
+
+################################################################################
+
+def image_to_uvgrid(img, halfsize, axes=(0,1), backend=None):
+
+    # Transforms the centered image cube img along axes back to the uv-plane 
+    # and returns the central 2*halfsize[0] x 2*halfsize[1] part of the
+    # centered uv-grid. Inverse of the imaging transform in NewImage.imagr().
+    # The input and output shifts are folded into checkerboard phases which 
+    # for the output is applied only to the selected part
+
+    shape = [img.shape[ax] for ax in axes]
+    qty_vuf = fft2_on_backend(img * checkerboard(shape, axes=axes, ndim=img.ndim), axes=axes, inverse=True, backend=backend)
+    select = [slice(None)] * qty_vuf.ndim
+    for ax, hsize in IT.izip(axes, halfsize):
+        select[ax] = slice(qty_vuf.shape[ax]/2-hsize, qty_vuf.shape[ax]/2+hsize)
+    return qty_vuf[tuple(select)] * checkerboard([2*hsize for hsize in halfsize], axes=axes, ndim=img.ndim, offset=halfsize)
+
+def imaging_weights(illumination, weighting='natural', grid_wts=None):
+
+    # Imaging weights of the nv x nu x nchan grid illumination cube and the 
+    # sum of the weighted illumination magnitudes over the grid (of shape 
+    # 1 x 1 x nchan). If grid_wts is not None, the weights are written into 
+    # this zero-filled array
+
+    abs_illumination = NP.abs(illumination)
+    occupied = abs_illumination > 0.0
+    if grid_wts is None:
+        grid_wts = NP.zeros(illumination.shape, dtype=abs_illumination.dtype)
+    if weighting == 'uniform':
+        grid_wts[occupied] = 1.0/abs_illumination[occupied]
+    else:
+        grid_wts[occupied] = 1.0
+    abs_illumination *= grid_wts
+    sum_wts = NP.sum(abs_illumination, axis=(0,1), keepdims=True)
+    return (grid_wts, sum_wts)
+
+def new_shared_array(shape, dtype, dirname=None):
+
+    # Creates a zero-filled array backed by a new file in directory dirname
+    # which other processes can map by name (see open_shared_array()). 
+    # Returns the array and its description (filename, shape, dtype string)
+
+    fd, filename = tempfile.mkstemp(prefix='imaging_', suffix='.dat', dir=dirname)
+    os.close(fd)
+    shape = tuple(shape)
+    dtype = NP.dtype(dtype)
+    arr = NP.memmap(filename, dtype=dtype, mode='w+', shape=shape)
+    return (NP.asarray(arr), (filename, shape, dtype.str))
+
+def open_shared_array(spec):
+
+    # Maps the array described by spec = (filename, shape, dtype string) 
+    # created by new_shared_array()
+
+    filename, shape, dtype = spec
+    return NP.memmap(filename, dtype=dtype, mode='r+', shape=shape)
+
+def fill_shared_array(arr, qty):
+
+    # Writes the gridded quantity qty (numpy array or sparse column matrix
+    # over the raveled grid) into the shared array arr. Sparse matrices of 
+    # the same type are densified directly into arr
+
+    if SM.issparse(qty):
+        if qty.dtype == arr.dtype:
+            qty.toarray(out=arr.reshape(qty.shape))
+        else:
+            arr[...] = qty.A.reshape(arr.shape)
+    else:
+        arr[...] = qty.reshape(arr.shape)
+
+def init_imaging_worker():
+
+    # Initializer of the imaging worker processes
+
+    imaging_worker_backends.clear()
+
+def image_channels(measured_type, arrays, s, chan_range, weighting='natural',
+                   padding=None, bounds=None, backend=None):
+
+    # Runs in the imaging worker processes. Determines the imaging weights of
+    # channels chan_range[0]:chan_range[1] of the nv x nu x nchan gridded 
+    # cubes, weights the grids, transforms them to the image plane and 
+    # writes the images and beams into the same channels of the output 
+    # arrays. The cubes are mapped in place from the shared arrays (see 
+    # new_shared_array()) described in dictionary arrays under keys 
+    # 'illumination' and 'grid' (inputs), 'grid_wts', 'sum_wts', 'img' and
+    # optionally 'beam' (outputs) and for MOFF also 'holimg' and 'holbeam'.
+    # MOFF images are of size s along the first two axes. FX images are 
+    # centered and padded by padding (see centered_fft2()). Mirrors the 
+    # serial imaging in member function imagr() of class NewImage
+
+    if backend is None:
+        backend = {'name': 'numpy'}
+    if backend['name'] not in imaging_worker_backends:
+        imaging_worker_backends[backend['name']] = {'name': backend['name'], 'workers': 1, 'planner_effort': backend.get('planner_effort'), 'plans': {}}
+    backend = imaging_worker_backends[backend['name']]
+
+    beg, end = chan_range
+    views = {}
+    for key in arrays:
+        views[key] = open_shared_array(arrays[key])[:,:,beg:end]
+    grid_wts, sum_wts = imaging_weights(views['illumination'], weighting=weighting, grid_wts=views['grid_wts'])
+    views['sum_wts'][...] = sum_wts
+
+    if measured_type == 'E-field':
+        chk = checkerboard(views['grid'].shape[:2], axes=(0,1), ndim=3)
+        for inkey, outkey, holkey in [('grid', 'img', 'holimg'), ('illumination', 'beam', 'holbeam')]:
+            if outkey in views:
+                wtd_grid = grid_wts * views[inkey]
+                wtd_grid *= chk
+                if bounds is None:
+                    out = fft2_on_backend(wtd_grid, s=s, axes=(0,1), backend=backend)
+                else:
+                    out = pruned_fft2(wtd_grid, s, bounds, axes=(0,1), backend=backend)
+                del wtd_grid
+                NP.divide(out, sum_wts, out=views[holkey])
+                NP.abs(out, out=views[outkey])
+                views[outkey] **= 2
+                views[outkey] /= sum_wts**2
+    else:
+        for inkey, outkey in [('grid', 'img'), ('illumination', 'beam')]:
+            if outkey in views:
+                out = centered_fft2(grid_wts * views[inkey], padding, axes=(0,1), overwrite=True, bounds=bounds, backend=backend)
+                NP.divide(out.real, sum_wts, out=views[outkey])
+
+def image_channels_arg_splitter(args, **kwargs):
+    return image_channels(*args, **kwargs)
+
+def new_stack_buffer(nslots, shape, dtype, filename=None, extend=None):
+
+    # Returns a buffer for nslots quantities of the given shape and dtype 
+    # stacked along the first axis. If filename is None, the buffer is a 
+    # numpy array in memory. Otherwise it is a DiskStack instance stored in
+    # file filename which is created afresh or, if extend is the DiskStack 
+    # buffer of the same file, extended without copying the stacked data
+
+    if filename is None:
+        return NP.empty((nslots,)+tuple(shape), dtype=dtype)
+    if extend is None:
+        return DiskStack(filename, nslots, shape, dtype, create=True)
+    return extend.resize(nslots)
+
+def stack_rows(buf, beg, end):
+
+    # Returns the stack of quantities beg to end (exclusive) of the buffer 
+    # buf, a view into a numpy array or a DiskStack instance
+
+    if isinstance(buf, DiskStack):
+        return buf.rows(beg, end)
+    return buf[beg:end]
+
+def new_stack(stackbuf, nts, shape, dtype, filename=None, init=None):
+
+    # Sets up in dictionary stackbuf (see append_to_stack()) a new buffer for 
+    # a stack of nts quantities of the given shape and dtype and returns the
+    # stack to be filled by the caller. If init is not None, its quantities
+    # are copied in chunks to the start of the buffer. If filename is not 
+    # None, the buffer is stored in a new file named after it (see 
+    # new_stack_buffer()). The file of the previous buffer is removed once 
+    # init has been copied
+
+    fname = None
+    if filename is not None:
+        stackbuf['gen'] = stackbuf.get('gen', -1) + 1
+        fname = '{0}.{1:0d}'.format(filename, stackbuf['gen'])
+    buf = new_stack_buffer(max(nts, 1), shape, dtype, filename=fname)
+    if init is not None:
+        chunksize = stack_chunksize(init)
+        for beg in xrange(0, init.shape[0], chunksize):
+            end = min(beg+chunksize, init.shape[0])
+            buf[beg:end] = init[beg:end]
+    oldfile = stackbuf.get('file')
+    if (oldfile is not None) and os.path.exists(oldfile):
+        os.remove(oldfile)
+    view = stack_rows(buf, 0, nts)
+    stackbuf['buf'] = buf
+    stackbuf['start'] = 0
+    stackbuf['view'] = view
+    stackbuf['file'] = fname
+    return view
+
+def stack_chunksize(stack, chunkbytes=64*2**20):
+
+    # Returns the number of timestamps of the stack (quantities along the 
+    # first axis) in a chunk of about chunkbytes bytes, at least one
+
+    rowbytes = int(NP.prod(stack.shape[1:])) * stack.dtype.itemsize
+    return max(1, chunkbytes // max(rowbytes, 1))
+
+def chunked_stack(func, nts, chunksize, stackbuf, filename=None, shape=None,
+                  dtype=None):
+
+    # Evaluates a stack of nts quantities along the first axis in chunks of 
+    # chunksize timestamps where func(beg, end) returns the quantities of 
+    # timestamps beg to end (exclusive), and stacks them in a new buffer set
+    # up in dictionary stackbuf (stored in a file if filename is not None, 
+    # see new_stack()). Neither the inputs nor the stack need to be held in 
+    # memory as a whole. shape and dtype of the quantities are used for the
+    # empty stack returned if nts is zero. Returns the stack
+
+    if nts == 0:
+        return new_stack(stackbuf, 0, shape, dtype, filename=filename)
+    out = None
+    for beg in xrange(0, nts, chunksize):
+        end = min(beg+chunksize, nts)
+        chunk = NP.asarray(func(beg, end))
+        if out is None:
+            out = new_stack(stackbuf, nts, chunk.shape[1:], chunk.dtype, filename=filename)
+        out[beg:end] = chunk
+    return out
+
+def append_to_stack(stack, qty, stackbuf, capacity=None, window=None,
+                    filename=None):
+
+    # Appends array qty to stack (quantities stacked along the first axis or 
+    # None) and returns the updated stack. The stack returned is a view into 
+    # a preallocated buffer held with its start index and the view under keys
+    # 'buf', 'start' and 'view' of dictionary stackbuf. qty is copied into 
+    # the buffer and hence callers need not copy it. The buffer doubles in
+    # size when full so that appending is amortized O(1) instead of O(n) with
+    # NP.concatenate(). capacity is the minimum number of slots allocated. 
+    # If window is not None, only the latest window entries are kept in a 
+    # buffer of 2*window slots which is shifted once every window appends 
+    # (ring buffer with a contiguous view in time order). If filename is not
+    # None, the buffer is a DiskStack stored in a file named after it so 
+    # that the appended quantities go to disk (see new_stack()) and the file
+    # is extended in place when full. If stack is not the view returned 
+    # previously, the buffer is set up afresh from stack
+
+    qty = NP.asarray(qty)
+    buf = stackbuf.get('buf')
+    if (stack is None) or (stackbuf.get('view') is not stack) or (buf.shape[1:] != qty.shape) or (NP.result_type(buf.dtype, qty.dtype) != buf.dtype) or ((window is not None) and (buf.shape[0] != 2*window)) or (isinstance(buf, DiskStack) != (filename is not None)):
+        if stack is None:
+            stack = NP.empty((0,)+qty.shape, dtype=qty.dtype)
+        if window is not None:
+            stack = stack_rows(stack, max(stack.shape[0]-window+1, 0), stack.shape[0])
+            nslots = 2 * window
+        else:
+            nslots = max(2*stack.shape[0], stack.shape[0]+1, 0 if capacity is None else capacity)
+        new_stack(stackbuf, nslots, qty.shape, NP.result_type(stack.dtype, qty.dtype), filename=filename, init=stack)
+        buf = stackbuf['buf']
+        start = 0
+    else:
+        start = stackbuf['start']
+    n = stack.shape[0]
+
+    if start + n == buf.shape[0]:
+        if window is None:
+            if isinstance(buf, DiskStack):
+                buf = new_stack_buffer(2*buf.shape[0], buf.shape[1:], buf.dtype, filename=stackbuf['file'], extend=buf)
+            else:
+                newbuf = NP.empty((2*buf.shape[0],)+buf.shape[1:], dtype=buf.dtype)
+                newbuf[:n] = buf[start:start+n]
+                buf = newbuf
+                start = 0
+        else:
+            n = min(n, window-1)
+            buf[:n] = buf[buf.shape[0]-n:]
+            start = 0
+
+    buf[start+n] = qty
+    n += 1
+    if (window is not None) and (n > window):
+        start += n - window
+        n = window
+
+    view = stack_rows(buf, start, start+n)
+    stackbuf['buf'] = buf
+    stackbuf['start'] = start
+    stackbuf['view'] = view
+    return view
+
+def time_bins(timestamps, tbinsize=None, wts=None):
+
+    # Groups the timestamps into time bins of size tbinsize which start at 
+    # the earliest timestamp, the last bin edge being placed just beyond the 
+    # latest timestamp. If tbinsize is None, all timestamps fall in one bin. 
+    # Timestamps with zero weights (boolean or numeric array wts) are left 
+    # out. The timestamps are sorted by bin once and the returned dictionary
+    # holds under key 'ind' the indices of the timestamps in that order (None
+    # if no reordering or selection is required), under 'starts' the offsets
+    # in that order where each non-empty bin starts, under 'nonempty' the 
+    # numbers of the non-empty bins and under 'counts' the number of 
+    # timestamps in each bin. Used with binned_sum() 
+
+    timestamps = NP.asarray(timestamps, dtype=NP.float).reshape(-1)
+    if (tbinsize is None) or (timestamps.size == 0):
+        binnum = NP.zeros(timestamps.size, dtype=NP.int)
+        nbins = 1
+    else:
+        eps = 1e-10
+        tbins = NP.arange(timestamps.min(), timestamps.max(), tbinsize)
+        tbins = NP.append(tbins, timestamps.max()+eps)
+        nbins = max(tbins.size-1, 1)
+        binnum = NP.clip(NP.searchsorted(tbins, timestamps, side='right') - 1, 0, nbins-1)
+
+    order = NP.argsort(binnum, kind='mergesort')
+    if wts is not None:
+        order = order[NP.asarray(wts).reshape(-1)[order] > 0]
+    counts = NP.bincount(binnum[order], minlength=nbins)
+    nonempty = NP.flatnonzero(counts)
+    starts = (NP.cumsum(counts) - counts)[nonempty]
+    if (order.size == timestamps.size) and NP.all(order == NP.arange(order.size)):
+        order = None
+
+    return {'ind': order, 'starts': starts, 'nonempty': nonempty, 'counts': counts}
+
+def remove_stack_file(stackbuf):
+
+    # Removes the file of the buffer set up in dictionary stackbuf (see 
+    # append_to_stack()) if the buffer is stored on disk and empties 
+    # stackbuf. Returns True if a file was removed and False otherwise
+
+    fname = stackbuf.get('file')
+    stackbuf.clear()
+    if fname is None:
+        return False
+    if os.path.exists(fname):
+        os.remove(fname)
+    return True
+
+def stack_file(stack_dir, prefix, qtyname, pol):
+
+    # Returns the name of the file in directory stack_dir in which the stack
+    # of quantity qtyname and polarization pol of an object whose files are
+    # named with prefix is stored (new_stack() appends the buffer 
+    # generation), and None if stack_dir is None (stacks held in memory)
+
+    if stack_dir is None:
+        return None
+    return os.path.join(stack_dir, '{0}_{1}_{2}.dat'.format(prefix, qtyname, pol))
+
+def discard_stacks(obj):
+
+    # Discards the stacks of obj whose buffers are held under keys (quantity,
+    # polarization) in its attribute stack_buffers and which are set in its
+    # attributes <quantity>_stack, removes the files of those stored on disk
+    # (see remove_stack_file()) and empties its list of stacked timestamps
+
+    for qtyname, pol in obj.stack_buffers.keys():
+        remove_stack_file(obj.stack_buffers.pop((qtyname, pol)))
+        getattr(obj, qtyname+'_stack')[pol] = None
+    obj.timestamps = []
+
+def binned_sum(stack, bininfo, chunksize=None):
+
+    # Sums the stack (quantities of the timestamps along the first axis) in
+    # the time bins in dictionary bininfo obtained from time_bins() with 
+    # NP.add.reduceat() over all bins in a chunk of timestamps at a time. 
+    # NaN values are excluded from the sums as in NP.nansum() and the sums 
+    # of empty bins are zero. The stack is read (for a DiskStack, see 
+    # append_to_stack()) and copied in chunks of chunksize timestamps (by 
+    # default see stack_chunksize()) so that no copy of the whole stack is 
+    # made. Returns a numpy array of size nbins x stack.shape[1:]
+
+    if chunksize is None:
+        chunksize = stack_chunksize(stack)
+
+    out = NP.zeros((bininfo['counts'].size,)+stack.shape[1:], dtype=stack.dtype)
+    sorted_binnum = NP.repeat(NP.arange(bininfo['counts'].size), bininfo['counts'])
+    for beg in xrange(0, sorted_binnum.size, chunksize):
+        end = min(beg+chunksize, sorted_binnum.size)
+        if bininfo['ind'] is None:
+            chunk = NP.asarray(stack[beg:end])
+        else:
+            chunk = NP.asarray(stack[bininfo['ind'][beg:end]])
+        if NP.issubdtype(chunk.dtype, NP.inexact):
+            nanind = NP.isnan(chunk)
+            if NP.any(nanind):
+                chunk = NP.where(nanind, NP.zeros(1, dtype=chunk.dtype), chunk)
+        binnum = sorted_binnum[beg:end]
+        starts = NP.flatnonzero(NP.concatenate(([True], binnum[1:] != binnum[:-1])))
+        out[binnum[starts]] += NP.add.reduceat(chunk, starts, axis=0)
+    return out
+
+################################################################################
+
+class DiskStack(object):
+
+    """
+    ----------------------------------------------------------------------------
+    Class to manage a stack of quantities (along the first axis) stored in a 
+    binary file on disk. The file is memory-mapped only for the duration of 
+    each read or write so that no file descriptors or memory maps are held 
+    between accesses, no matter how many stacks are stored on disk. Indexing
+    returns numpy arrays read from the file and assignment to an index writes
+    to the file. A DiskStack can be a view of a range of the quantities in 
+    the file, which is how the stacks are held in the attributes of classes 
+    Antenna, Interferometer and NewImage
+
+    Attributes:
+
+    filename    [string] Name of the file
+
+    dtype       [numpy dtype] Data type of the stacked quantities
+
+    shape       [tuple] Shape of the stack, the first axis denoting the 
+                stacked quantities (timestamps)
+
+    offset      [integer] Index in the file of the first quantity of the stack
+
+    Member functions:
+
+    __init__()  Initializes an instance of class DiskStack
+
+    __getitem__()
+                Reads the indexed part of the stack from the file
+
+    __setitem__()
+                Writes to the indexed part of the stack in the file
+
+    __array__() Reads the whole stack from the file
+
+    __len__()   Returns the number of stacked quantities
+
+    rows()      Returns a DiskStack view of a range of stacked quantities
+
+    resize()    Changes the number of quantities in the file
+
+    Read the member function docstrings for details.
+    ----------------------------------------------------------------------------
+    """
+
+    def __init__(self, filename, nslots, shape, dtype, offset=0, create=False):
+
+        """
+        ------------------------------------------------------------------------
+        Initializes an instance of class DiskStack
+
+        Inputs:
+
+        filename [string] Name of the file
+
+        nslots   [integer] Number of stacked quantities
+
+        shape    [tuple] Shape of each stacked quantity
+
+        dtype    [numpy dtype] Data type of the stacked quantities
+
+        offset   [integer] Index in the file of the first quantity of the 
+                 stack. Default=0
+
+        create   [boolean] If True, the file is created afresh with room for 
+                 offset+nslots quantities. If False (default), the file must
+                 exist
+        ------------------------------------------------------------------------
+        """
+
+        self.filename = filename
+        self.dtype = NP.dtype(dtype)
+        self.shape = (int(nslots),) + tuple(shape)
+        self.offset = int(offset)
+        if create:
+            with open(filename, 'wb') as fileobj:
+                fileobj.truncate((self.offset+self.shape[0]) * self.rowbytes)
+
+    @property
+    def rowbytes(self):
+        return int(NP.prod(self.shape[1:])) * self.dtype.itemsize
+
+    @property
+    def ndim(self):
+        return len(self.shape)
+
+    @property
+    def size(self):
+        return int(NP.prod(self.shape))
+
+    @property
+    def nbytes(self):
+        return self.size * self.dtype.itemsize
+
+    def __len__(self):
+        return self.shape[0]
+
+    def _map(self, mode):
+
+        # Maps the part of the file holding the stack. An empty stack cannot
+        # be mapped and is returned as an empty array
+
+        if self.size == 0:
+            return NP.empty(self.shape, dtype=self.dtype)
+        return NP.memmap(self.filename, dtype=self.dtype, mode=mode, offset=self.offset*self.rowbytes, shape=self.shape)
+
+    def __getitem__(self, key):
+        mm = self._map('r')
+        out = NP.array(mm[key])
+        del mm
+        return out
+
+    def __setitem__(self, key, value):
+        mm = self._map('r+')
+        mm[key] = value
+        if isinstance(mm, NP.memmap):
+            mm.flush()
+        del mm
+
+    def __array__(self, dtype=None):
+        if dtype is None:
+            return self[...]
+        return self[...].astype(dtype)
+
+    ############################################################################
+
+    def rows(self, beg, end):
+
+        """
+        ------------------------------------------------------------------------
+        Returns a DiskStack view of the stacked quantities beg to end 
+        (exclusive) stored in the same file
+
+        Inputs:
+
+        beg      [integer] Index of the first quantity
+
+        end      [integer] Index beyond the last quantity
+        ------------------------------------------------------------------------
+        """
+
+        return DiskStack(self.filename, end-beg, self.shape[1:], self.dtype, offset=self.offset+beg)
+
+    ############################################################################
+
+    def resize(self, nslots):
+
+        """
+        ------------------------------------------------------------------------
+        Changes the number of stacked quantities in the file to nslots by 
+        truncating or extending the file in place, and returns the resized 
+        DiskStack. The stacked quantities kept are not copied
+
+        Inputs:
+
+        nslots   [integer] New number of stacked quantities
+        ------------------------------------------------------------------------
+        """
+
+        with open(self.filename, 'r+b') as fileobj:
+            fileobj.truncate((self.offset+nslots) * self.rowbytes)
+        return DiskStack(self.filename, nslots, self.shape[1:], self.dtype, offset=self.offset)
 
 ################################################################################
 
@@ -371,6 +1340,20 @@ class Interferometer:
                 under the polarization key is stored as numpy array with 
                 number of elements equal to the number of timestamps
 
+    stack_buffers
+                [dictionary] holds under keys (quantity, polarization) the 
+                preallocated buffers of which Vt_stack and Vf_stack are 
+                views. The buffers double in size when full so that stacking 
+                a timestamp does not copy the stacks
+
+    stack_dir   [string] if not None, directory of the files in which the 
+                buffers of Vt_stack and Vf_stack are stored (see class 
+                DiskStack) so that the stacks are written to disk rather than
+                held in memory and are computed and averaged in chunks of 
+                timestamps. None (default) means the stacks are held in 
+                memory. Set through update(). The files are removed by 
+                removeStackFiles()
+
     Vf_avg      [dictionary] holds in keys 'P11', 'P12', 'P21', 'P22' for each
                 polarization the stacked and averaged complex visibility spectra
                 as a numpy array where the number of rows is the number of time
@@ -502,6 +1485,13 @@ class Interferometer:
                  polarization flags and also overrides with flags if provided 
                  as input parameters
 
+    stackFile()  Returns the name of the file in which a stack is stored if
+                 stored on disk
+
+    removeStackFiles()
+                 Discards all stacks and removes the files of those stored on
+                 disk
+
     update():    Updates the interferometer instance with newer attribute values
                  Updates the visibility spectrum and timeseries and applies FX
                  or XF operation.
@@ -535,7 +1525,8 @@ class Interferometer:
         Class attributes initialized are:
         label, latitude, location, pol, t, timestamp, f0, f, wts, wtspos, 
         wtspos_scale, gridinfo, blc, trc, timestamps, Vt_stack, Vf_stack, 
-        flag_stack, Vf_avg, twts, tbinsize, aperture
+        flag_stack, stack_buffers, stack_dir, Vf_avg, twts, tbinsize, 
+        aperture
      
         Read docstring of class Antenna for details on these attributes.
         ------------------------------------------------------------------------
@@ -592,6 +1583,8 @@ class Interferometer:
         self.Vt_stack = {}
         self.Vf_stack = {}
         self.flag_stack = {}
+        self.stack_buffers = {}
+        self.stack_dir = None
 
         self.Vf_avg = {}
         self.twts = {}
@@ -767,10 +1760,19 @@ class Interferometer:
         ind1 = NP.in1d(ts1, common_ts, assume_unique=True)
         ind2 = NP.in1d(ts2, common_ts, assume_unique=True)
 
-        self.Vf_stack['P11'] = self.A1.Ef_stack['P1'][ind1,:] * self.A2.Ef_stack['P1'][ind2,:].conjugate()
-        self.Vf_stack['P12'] = self.A1.Ef_stack['P1'][ind1,:] * self.A2.Ef_stack['P2'][ind2,:].conjugate()
-        self.Vf_stack['P21'] = self.A1.Ef_stack['P2'][ind1,:] * self.A2.Ef_stack['P1'][ind2,:].conjugate()
-        self.Vf_stack['P22'] = self.A1.Ef_stack['P2'][ind1,:] * self.A2.Ef_stack['P2'][ind2,:].conjugate()
+        if self.stack_dir is None:
+            self.Vf_stack['P11'] = self.A1.Ef_stack['P1'][ind1,:] * self.A2.Ef_stack['P1'][ind2,:].conjugate()
+            self.Vf_stack['P12'] = self.A1.Ef_stack['P1'][ind1,:] * self.A2.Ef_stack['P2'][ind2,:].conjugate()
+            self.Vf_stack['P21'] = self.A1.Ef_stack['P2'][ind1,:] * self.A2.Ef_stack['P1'][ind2,:].conjugate()
+            self.Vf_stack['P22'] = self.A1.Ef_stack['P2'][ind1,:] * self.A2.Ef_stack['P2'][ind2,:].conjugate()
+        else:
+            # Computed in chunks of timestamps straight to the disk
+            ind1 = NP.flatnonzero(ind1)
+            ind2 = NP.flatnonzero(ind2)
+            for pol, apol1, apol2 in [('P11', 'P1', 'P1'), ('P12', 'P1', 'P2'), ('P21', 'P2', 'P1'), ('P22', 'P2', 'P2')]:
+                Ef1 = self.A1.Ef_stack[apol1]
+                Ef2 = self.A2.Ef_stack[apol2]
+                self.Vf_stack[pol] = chunked_stack(lambda beg, end: Ef1[ind1[beg:end],:] * Ef2[ind2[beg:end],:].conjugate(), ind1.size, stack_chunksize(Ef1), self.stack_buffers.setdefault(('Vf', pol), {}), filename=self.stackFile('Vf', pol), shape=Ef1.shape[1:], dtype=NP.result_type(Ef1.dtype, Ef2.dtype))
 
         self.f2t_on_stack()
 
@@ -845,9 +1847,13 @@ class Interferometer:
         ------------------------------------------------------------------------
         """
         for pol in ['P11', 'P12', 'P21', 'P22']:
-            self.Vt_stack[pol] = DSP.FT1D(NP.fft.fftshift(self.Vf_stack[pol]),
-                                          ax=1, inverse=True, shift=True,
-                                          verbose=False)
+            if self.stack_dir is None:
+                self.Vt_stack[pol] = DSP.FT1D(NP.fft.fftshift(self.Vf_stack[pol], axes=1),
+                                              ax=1, inverse=True, shift=True,
+                                              verbose=False)
+            else:
+                Vf = self.Vf_stack[pol]
+                self.Vt_stack[pol] = chunked_stack(lambda beg, end: DSP.FT1D(NP.fft.fftshift(NP.asarray(Vf[beg:end]), axes=1), ax=1, inverse=True, shift=True, verbose=False), Vf.shape[0], stack_chunksize(Vf), self.stack_buffers.setdefault(('Vt', pol), {}), filename=self.stackFile('Vt', pol), shape=Vf.shape[1:], dtype=NP.result_type(Vf.dtype, NP.complex64))
 
     ############################################################################
 
@@ -861,8 +1867,12 @@ class Interferometer:
         """
 
         for pol in ['P11', 'P12', 'P21', 'P22']:
-            self.Vf_stack[pol] = DSP.FT1D(NP.fft.ifftshift(self.Vt_stack[pol]),
-                                          ax=1, shift=True, verbose=False)
+            if self.stack_dir is None:
+                self.Vf_stack[pol] = DSP.FT1D(NP.fft.ifftshift(self.Vt_stack[pol], axes=1),
+                                              ax=1, shift=True, verbose=False)
+            else:
+                Vt = self.Vt_stack[pol]
+                self.Vf_stack[pol] = chunked_stack(lambda beg, end: DSP.FT1D(NP.fft.ifftshift(NP.asarray(Vt[beg:end]), axes=1), ax=1, shift=True, verbose=False), Vt.shape[0], stack_chunksize(Vt), self.stack_buffers.setdefault(('Vf', pol), {}), filename=self.stackFile('Vf', pol), shape=Vt.shape[1:], dtype=NP.result_type(Vt.dtype, NP.complex64))
 
     ############################################################################
 
@@ -1293,16 +2303,12 @@ class Interferometer:
     
             self.update_flags(flags=None, stack=stack, verify=True)  # Re-check flags and stack
             for pol in ['P11', 'P12', 'P21', 'P22']:
-                if self.Vt_stack[pol] is None:
-                    self.Vt_stack[pol] = copy.deepcopy(self.crosspol.Vt[pol].reshape(1,-1))
-                    self.Vf_stack[pol] = copy.deepcopy(self.crosspol.Vf[pol].reshape(1,-1))
+                if (self.Vt_stack[pol] is None) or stack:
+                    self.Vt_stack[pol] = append_to_stack(self.Vt_stack[pol], self.crosspol.Vt[pol].reshape(-1), self.stack_buffers.setdefault(('Vt', pol), {}), filename=self.stackFile('Vt', pol))
+                    self.Vf_stack[pol] = append_to_stack(self.Vf_stack[pol], self.crosspol.Vf[pol].reshape(-1), self.stack_buffers.setdefault(('Vf', pol), {}), filename=self.stackFile('Vf', pol))
                 else:
-                    if stack:
-                        self.Vt_stack[pol] = NP.vstack((self.Vt_stack[pol], self.crosspol.Vt[pol].reshape(1,-1)))
-                        self.Vf_stack[pol] = NP.vstack((self.Vf_stack[pol], self.crosspol.Vf[pol].reshape(1,-1)))
-                    else:
-                        self.Vt_stack[pol][-1,:] = copy.deepcopy(self.crosspol.Vt[pol].reshape(1,-1))
-                        self.Vf_stack[pol][-1,:] = copy.deepcopy(self.crosspol.Vf[pol].reshape(1,-1))
+                    self.Vt_stack[pol][-1,:] = self.crosspol.Vt[pol].reshape(-1)
+                    self.Vf_stack[pol][-1,:] = self.crosspol.Vf[pol].reshape(-1)
 
             blc_orig = NP.copy(self.blc)
             trc_orig = NP.copy(self.trc)
@@ -1373,6 +2379,34 @@ class Interferometer:
 
     ############################################################################
 
+    def stackFile(self, qtyname, pol):
+
+        """
+        ------------------------------------------------------------------------
+        Returns the name of the file of the stack of quantity qtyname ('Vt' 
+        or 'Vf') and polarization pol if stored on disk (see stack_file())
+        ------------------------------------------------------------------------
+        """
+
+        return stack_file(self.stack_dir, 'interferometer_{0}_{1}'.format(self.A1.label, self.A2.label), qtyname, pol)
+
+    ############################################################################
+
+    def removeStackFiles(self):
+
+        """
+        ------------------------------------------------------------------------
+        Discards all stacks, stacked timestamps and flags and removes the 
+        files of the stacks stored on disk (see discard_stacks())
+        ------------------------------------------------------------------------
+        """
+
+        discard_stacks(self)
+        for pol in self.flag_stack:
+            self.flag_stack[pol] = NP.asarray([])
+
+    ############################################################################
+
     def update(self, update_dict=None, verbose=False):
 
         """
@@ -1473,6 +2507,11 @@ class Interferometer:
                        timestamp. If False, updates the last flag and data in 
                        the stack and does not append
 
+            stack_dir  [string] directory (which must exist) of the files in
+                       which the visibility stacks are stored (see 
+                       attribute stack_dir). Takes effect with the next 
+                       timestamp stacked
+
             verify_flags     
                        [boolean] If True, verify and update the flags, if 
                        necessary. Visibilities are checked for NaN values and if 
@@ -1492,6 +2531,7 @@ class Interferometer:
         t = None
         flags = None
         stack = False
+        stack_dir = None
         verify_flags = True
         Vt = None
         do_correlate = None
@@ -1511,6 +2551,7 @@ class Interferometer:
             if 'Vt' in update_dict: Vt = update_dict['Vt']
             if 'flags' in update_dict: flags = update_dict['flags']
             if 'stack' in update_dict: stack = update_dict['stack']
+            if 'stack_dir' in update_dict: stack_dir = update_dict['stack_dir']
             if 'verify_flags' in update_dict: verify_flags = update_dict['verify_flags']            
             if 'do_correlate' in update_dict: do_correlate = update_dict['do_correlate']
             if 'wtsinfo' in update_dict: wtsinfo = update_dict['wtsinfo']
@@ -1518,6 +2559,11 @@ class Interferometer:
             if 'ref_freq' in update_dict: ref_freq = update_dict['ref_freq']
             if 'aperture' in update_dict: aperture = update_dict['aperture']
 
+        if stack_dir is not None:
+            if not os.path.isdir(stack_dir):
+                raise ValueError('Directory {0} specified in stack_dir not found'.format(stack_dir))
+            self.stack_dir = stack_dir
+
         if label is not None: self.label = label
         if location is not None: self.location = location
         if timestamp is not None: self.timestamp = timestamp
@@ -1546,17 +2592,12 @@ class Interferometer:
 
             for pol in ['P11', 'P12', 'P21', 'P22']:
                 if not self.crosspol._init_data_on:
-                    if self.Vt_stack[pol] is None:
-                        if stack:
-                            self.Vt_stack[pol] = copy.deepcopy(self.crosspol.Vt[pol].reshape(1,-1))
-                            self.Vf_stack[pol] = copy.deepcopy(self.crosspol.Vf[pol].reshape(1,-1))
-                    else:
-                        if stack:
-                            self.Vt_stack[pol] = NP.vstack((self.Vt_stack[pol], self.crosspol.Vt[pol].reshape(1,-1)))
-                            self.Vf_stack[pol] = NP.vstack((self.Vf_stack[pol], self.crosspol.Vf[pol].reshape(1,-1)))
-                        else:
-                            self.Vt_stack[pol][-1,:] = copy.deepcopy(self.crosspol.Vt[pol].reshape(1,-1))
-                            self.Vf_stack[pol][-1,:] = copy.deepcopy(self.crosspol.Vf[pol].reshape(1,-1))
+                    if stack:
+                        self.Vt_stack[pol] = append_to_stack(self.Vt_stack[pol], self.crosspol.Vt[pol].reshape(-1), self.stack_buffers.setdefault(('Vt', pol), {}), filename=self.stackFile('Vt', pol))
+                        self.Vf_stack[pol] = append_to_stack(self.Vf_stack[pol], self.crosspol.Vf[pol].reshape(-1), self.stack_buffers.setdefault(('Vf', pol), {}), filename=self.stackFile('Vf', pol))
+                    elif self.Vt_stack[pol] is not None:
+                        self.Vt_stack[pol][-1,:] = self.crosspol.Vt[pol].reshape(-1)
+                        self.Vf_stack[pol][-1,:] = self.crosspol.Vf[pol].reshape(-1)
 
             blc_orig = NP.copy(self.blc)
             trc_orig = NP.copy(self.trc)
@@ -1800,16 +2841,12 @@ class Interferometer:
     
             self.update_flags(flags=None, stack=stack, verify=True)  # Re-check flags and stack
             for pol in ['P11', 'P12', 'P21', 'P22']:
-                if self.Vt_stack[pol] is None:
-                    self.Vt_stack[pol] = copy.deepcopy(self.crosspol.Vt[pol].reshape(1,-1))
-                    self.Vf_stack[pol] = copy.deepcopy(self.crosspol.Vf[pol].reshape(1,-1))
+                if (self.Vt_stack[pol] is None) or stack:
+                    self.Vt_stack[pol] = append_to_stack(self.Vt_stack[pol], self.crosspol.Vt[pol].reshape(-1), self.stack_buffers.setdefault(('Vt', pol), {}), filename=self.stackFile('Vt', pol))
+                    self.Vf_stack[pol] = append_to_stack(self.Vf_stack[pol], self.crosspol.Vf[pol].reshape(-1), self.stack_buffers.setdefault(('Vf', pol), {}), filename=self.stackFile('Vf', pol))
                 else:
-                    if stack:
-                        self.Vt_stack[pol] = NP.vstack((self.Vt_stack[pol], self.crosspol.Vt[pol].reshape(1,-1)))
-                        self.Vf_stack[pol] = NP.vstack((self.Vf_stack[pol], self.crosspol.Vf[pol].reshape(1,-1)))
-                    else:
-                        self.Vt_stack[pol][-1,:] = copy.deepcopy(self.crosspol.Vt[pol].reshape(1,-1))
-                        self.Vf_stack[pol][-1,:] = copy.deepcopy(self.crosspol.Vf[pol].reshape(1,-1))
+                    self.Vt_stack[pol][-1,:] = self.crosspol.Vt[pol].reshape(-1)
+                    self.Vf_stack[pol][-1,:] = self.crosspol.Vf[pol].reshape(-1)
     
             blc_orig = NP.copy(self.blc)
             trc_orig = NP.copy(self.trc)
@@ -1980,72 +3017,30 @@ class Interferometer:
         ------------------------------------------------------------------------
         """
 
+        if (tbinsize is not None) and (not isinstance(tbinsize, (int, float, dict))):
+            raise TypeError('Input tbinsize must be a scalar or dictionary')
+
+        # All time bins are summed at once over the unflagged timestamps
         timestamps = NP.asarray(self.timestamps).astype(NP.float)
         Vf_acc = {}
         twts = {}
         Vf_avg = {}
+        tbsize = {}
         for pol in ['P11', 'P12', 'P21', 'P22']:
-            Vf_acc[pol] = None
-            Vf_avg[pol] = None
-            twts[pol] = []
-
-        if tbinsize is None:   # Average visibilities across all timestamps
-            for pol in ['P11', 'P12', 'P21', 'P22']:
-                unflagged_ind = NP.logical_not(self.flag_stack[pol])
-                Vf_acc[pol] = NP.nansum(self.Vf_stack[pol][unflagged_ind,:], axis=0, keepdims=True)
-                twts[pol] = NP.sum(unflagged_ind).astype(NP.float).reshape(-1,1)
-                # twts[pol] = NP.asarray(len(self.timestamps) - NP.sum(self.flag_stack[pol])).reshape(-1,1)
-            self.tbinsize = tbinsize
-        elif isinstance(tbinsize, (int, float)): # Apply same time bin size to all polarizations 
-            eps = 1e-10
-            tbins = NP.arange(timestamps.min(), timestamps.max(), tbinsize)
-            tbins = NP.append(tbins, timestamps.max()+eps)
-            for pol in ['P11', 'P12', 'P21', 'P22']:
-                counts, tbin_edges, tbinnum, ri = OPS.binned_statistic(timestamps, statistic='count', bins=tbins)
-                for binnum in range(counts.size):
-                    ind = ri[ri[binnum]:ri[binnum+1]]
-                    unflagged_ind = NP.logical_not(self.flag_stack[pol][ind])
-                    twts[pol] += [NP.sum(unflagged_ind)]
-                    # twts[pol] += [counts[binnum] - NP.sum(self.flag_stack[pol][ind])]
-                    if Vf_acc[pol] is None:
-                        Vf_acc[pol] = NP.nansum(self.Vf_stack[pol][ind[unflagged_ind],:], axis=0, keepdims=True)
-                    else:
-                        Vf_acc[pol] = NP.vstack((Vf_acc[pol], NP.nansum(self.Vf_stack[pol][ind[unflagged_ind],:], axis=0, keepdims=True)))
-                twts[pol] = NP.asarray(twts[pol]).astype(NP.float).reshape(-1,1)
-            self.tbinsize = tbinsize
-        elif isinstance(tbinsize, dict): # Apply different time binsizes to corresponding polarizations
-            tbsize = {}
-            for pol in ['P11', 'P12', 'P21', 'P22']:
-                if pol not in tbinsize:
-                    unflagged_ind = NP.logical_not(self.flag_stack[pol])
-                    Vf_acc[pol] = NP.nansum(self.Vf_stack[pol][unflagged_ind,:], axis=0, keepdims=True)
-                    twts[pol] = NP.sum(unflagged_ind).astype(NP.float).reshape(-1,1)
-                    # twts[pol] = NP.asarray(len(self.timestamps) - NP.sum(self.flag_stack[pol])).reshape(-1,1)
-                    tbsize[pol] = None
-                elif isinstance(tbinsize[pol], (int,float)):
-                    eps = 1e-10
-                    tbins = NP.arange(timestamps.min(), timestamps.max(), tbinsize[pol])
-                    tbins = NP.append(tbins, timestamps.max()+eps)
-                    
-                    counts, tbin_edges, tbinnum, ri = OPS.binned_statistic(timestamps, statistic='count', bins=tbins)
-                    for binnum in range(counts.size):
-                        ind = ri[ri[binnum]:ri[binnum+1]]
-                        unflagged_ind = NP.logical_not(self.flag_stack[pol][ind])
-                        twts[pol] += [NP.sum(unflagged_ind)]
-                        # twts[pol] += [counts[binnum] - NP.sum(self.flag_stack[pol][ind])]
-                        if Vf_acc[pol] is None:
-                            Vf_acc[pol] = NP.nansum(self.Vf_stack[pol][ind[unflagged_ind],:], axis=0, keepdims=True)
-                        else:
-                            Vf_acc[pol] = NP.vstack((Vf_acc[pol], NP.nansum(self.Vf_stack[pol][ind[unflagged_ind],:], axis=0, keepdims=True)))
-                    twts[pol] = NP.asarray(twts[pol]).astype(NP.float).reshape(-1,1)
-                    tbsize[pol] = tbinsize[pol]
-                else:
-                    unflagged_ind = NP.logical_not(self.flag_stack[pol])
-                    Vf_acc[pol] = NP.nansum(self.Vf_stack[pol][unflagged_ind,:], axis=0, keepdims=True)
-                    twts[pol] = NP.sum(unflagged_ind).astype(NP.float).reshape(-1,1)
-                    # twts[pol] = NP.asarray(len(self.timestamps) - NP.sum(self.flag_stack[pol])).reshape(-1,1)
+            if isinstance(tbinsize, dict):
+                tbsize[pol] = tbinsize.get(pol)
+                if not isinstance(tbsize[pol], (int, float)):
                     tbsize[pol] = None
+            else:
+                tbsize[pol] = tbinsize
+            bininfo = time_bins(timestamps, tbinsize=tbsize[pol], wts=NP.logical_not(self.flag_stack[pol]))
+            Vf_acc[pol] = binned_sum(self.Vf_stack[pol], bininfo)
+            twts[pol] = bininfo['counts'].astype(NP.float).reshape(-1,1)
+
+        if isinstance(tbinsize, dict):
             self.tbinsize = tbsize
+        else:
+            self.tbinsize = tbinsize
 
         # Compute the average from the accumulated visibilities
         for pol in ['P11', 'P12', 'P21', 'P22']:
@@ -2346,6 +3341,17 @@ class InterferometerArray:
                   visibilities and interferometer array illumination 
                   respectively
 
+    grid_illumination_state
+                  [dictionary] contains under each polarization the state that
+                  determines the gridded illumination in attribute 
+                  grid_illumination, namely a dictionary with keys 'mapper' 
+                  (the baseline-to-grid mapping object used) and 'wts' 
+                  (boolean array of the baselines, or baselines and channels,
+                  contributing to the grid). Set by make_grid_cube_new() and 
+                  applyMappingMatrix(). Used by class NewImage to reuse the 
+                  imaging weights and synthesized beam while the state is 
+                  unchanged
+
     Member Functions:
 
     __init__()      Initializes an instance of class InterferometerArray
@@ -2486,6 +3492,7 @@ class InterferometerArray:
         self.ordered_labels = [] # Usually output from member function baseline_vectors() or get_visibilities()
         self.grid_mapper = {}
         self.bl2grid_mapper = {}  # contains the sparse mapping matrix
+        self.grid_illumination_state = {}
 
         for pol in ['P11', 'P12', 'P21', 'P22']:
             self.grid_mapper[pol] = {}
@@ -4212,35 +5219,22 @@ class InterferometerArray:
                         pass
                         
                     # Determine weights that can normalize sum of kernel per interferometer per frequency to unity
-                    # per_bl_per_freq_norm_wts = NP.ones(blind.size, dtype=NP.complex64)
-                    per_bl_per_freq_norm_wts = NP.zeros(blind.size, dtype=NP.complex64)
-                    
-                    runsum = 0
-                    for bi,gi in enumerate(indNN_list):
-                        if len(gi) > 0:
-                            fvu_ind = NP.asarray(gi)
-                            unraveled_fvu_ind = NP.unravel_index(fvu_ind, (self.f.size,)+self.gridu.shape)
-                            f_ind = unraveled_fvu_ind[0]
-                            v_ind = unraveled_fvu_ind[1]
-                            u_ind = unraveled_fvu_ind[2]
-                            chanhist, chanbe, chanbn, chanri = OPS.binned_statistic(f_ind, statistic='count', bins=NP.arange(self.f.size+1))
-                            for ci in xrange(self.f.size):
-                                if chanhist[ci] > 0.0:
-                                    select_chan_ind = chanri[chanri[ci]:chanri[ci+1]]
-                                    per_bl_per_freq_kernel_sum = NP.sum(krn[cpol][runsum:runsum+len(gi)][select_chan_ind])
-                                    per_bl_per_freq_norm_wts[runsum:runsum+len(gi)][select_chan_ind] = 1.0 / per_bl_per_freq_kernel_sum
+                    # as a single grouped reduction over the combined (baseline, channel) key
+                    blfreq_ind = blind * self.f.size + fvu_gridind_unraveled[0]
+                    per_bl_per_freq_kernel_sum = grid_scatter_add(blfreq_ind, krn[cpol], n_bl*self.f.size)
+                    per_bl_per_freq_norm_wts = (1.0 / per_bl_per_freq_kernel_sum[blfreq_ind]).astype(NP.complex64)
 
+                    blbounds = NP.concatenate(([0], NP.cumsum(NP.bincount(blind, minlength=n_bl))))
+                    for bi in xrange(n_bl):
                         per_bl2grid_info = {}
                         per_bl2grid_info['label'] = self.ordered_labels[bi]
                         per_bl2grid_info['twts'] = twts[bi]
-                        per_bl2grid_info['f_gridind'] = NP.copy(f_ind)
-                        per_bl2grid_info['u_gridind'] = NP.copy(u_ind)
-                        per_bl2grid_info['v_gridind'] = NP.copy(v_ind)
-                        # per_bl2grid_info['fvu_gridind'] = NP.copy(gi)
-                        per_bl2grid_info['per_bl_per_freq_norm_wts'] = per_bl_per_freq_norm_wts[runsum:runsum+len(gi)]
-                        per_bl2grid_info['illumination'] = krn[cpol][runsum:runsum+len(gi)]
+                        per_bl2grid_info['f_gridind'] = fvu_gridind_unraveled[0][blbounds[bi]:blbounds[bi+1]]
+                        per_bl2grid_info['u_gridind'] = fvu_gridind_unraveled[2][blbounds[bi]:blbounds[bi+1]]
+                        per_bl2grid_info['v_gridind'] = fvu_gridind_unraveled[1][blbounds[bi]:blbounds[bi+1]]
+                        per_bl2grid_info['per_bl_per_freq_norm_wts'] = per_bl_per_freq_norm_wts[blbounds[bi]:blbounds[bi+1]]
+                        per_bl2grid_info['illumination'] = krn[cpol][blbounds[bi]:blbounds[bi+1]]
                         self.grid_mapper[cpol]['per_bl2grid'] += [copy.deepcopy(per_bl2grid_info)]
-                        runsum += len(gi)
 
                     self.grid_mapper[cpol]['all_bl2grid']['per_bl_per_freq_norm_wts'] = NP.copy(per_bl_per_freq_norm_wts)
 
@@ -4319,9 +5313,15 @@ class InterferometerArray:
                    be determined.
 
         parallel   [boolean] specifies if parallelization is to be invoked. 
-                   False (default) means only serial processing
-
-        nproc      [integer] specifies number of independent processes to spawn.
+                   False (default) means only serial processing. If True, the 
+                   grid indices, the kernel and its normalization are 
+                   determined by threads over blocks of baselines which also 
+                   convert their contributions to blocks of columns of the 
+                   sparse mapping matrix in CSR format. These are then 
+                   assembled by threads into blocks of rows which are 
+                   stacked into the mapping matrix
+
+        nproc      [integer] specifies number of threads to spawn.
                    Default = None, means automatically determines the number of 
                    process cores in the system and use one less than that to 
                    avoid locking the system for other processes. Applies only 
@@ -4332,11 +5332,6 @@ class InterferometerArray:
                    for other processes
         verbose    [boolean] If True, prints diagnostic and progress messages. 
                    If False (default), suppress printing such messages.
-
-        NOTE: Although certain portions are parallelizable, the overheads in 
-        these processes seem to make it worse than serial processing. It is 
-        advisable to stick to serialized version unless testing with larger
-        data sets clearly indicates otherwise.
         ------------------------------------------------------------------------
         """
 
@@ -4379,101 +5374,92 @@ class InterferometerArray:
                         grid_xy = grid_xy.reshape(-1,2)
                         wl = wl.reshape(-1)
                         indNN_list, blind, fvu_gridind = LKP.find_NN(bl_xy, grid_xy, distance_ULIM=2.0*distNN, flatten=True, parallel=False)
-                        dxy = grid_xy[fvu_gridind,:] - bl_xy[blind,:]
-                        fvu_gridind_unraveled = NP.unravel_index(fvu_gridind, (self.f.size,)+self.gridu.shape)   # f-v-u order since temporary grid was created as nchan x nv x nu
+                        blind = NP.asarray(blind, dtype=NP.int)
+                        fvu_gridind = NP.asarray(fvu_gridind, dtype=NP.int)
+                        blbounds = NP.concatenate(([0], NP.cumsum(NP.bincount(blind, minlength=n_bl))))
+                        threaded = parallel or (nproc is not None)
+                        if threaded:
+                            # Grid indices, kernel, its normalization and the
+                            # sparse mapping matrix are all determined by 
+                            # threads over blocks of baselines
+                            if nproc is None:
+                                nproc = max(MP.cpu_count()-1, 1) 
+                            else:
+                                nproc = min(nproc, max(MP.cpu_count()-1, 1))
+                            if identical_interferometers:
+                                arbitrary_interferometer_aperture = self.interferometers.itervalues().next().aperture
+                                krnfunc = lambda dxy, wl, eltbeg, eltend: arbitrary_interferometer_aperture.compute(dxy, wavelength=wl, pol=cpol, rmaxNN=rmaxNN, load_lookup=False)
+                            else:
+                                apertures = [self.interferometers[label].aperture for label in self.ordered_labels]
+                                krnfunc = lambda dxy, wl, eltbeg, eltend: {cpol: grouped_aperture_kernel(apertures[eltbeg:eltend], dxy, wl, blbounds[eltbeg:eltend+1]-blbounds[eltbeg], cpol, rmaxNN=rmaxNN)}
+                            mapping = threaded_mapping_matrix(krnfunc, bl_xy, blind, fvu_gridind, blbounds, self.gridu, self.gridv, wavelength, cpol, nproc)
+                            fvu_gridind_unraveled = (mapping['f_gridind'], mapping['v_gridind'], mapping['u_gridind'])
+                            krn.update(mapping['krn'])
+                        else:
+                            dxy = grid_xy[fvu_gridind,:] - bl_xy[blind,:]
+                            fvu_gridind_unraveled = NP.unravel_index(fvu_gridind, (self.f.size,)+self.gridu.shape)   # f-v-u order since temporary grid was created as nchan x nv x nu
                         self.grid_mapper[cpol]['all_bl2grid']['blind'] = NP.copy(blind)
                         self.grid_mapper[cpol]['all_bl2grid']['u_gridind'] = NP.copy(fvu_gridind_unraveled[2])
                         self.grid_mapper[cpol]['all_bl2grid']['v_gridind'] = NP.copy(fvu_gridind_unraveled[1])                            
                         self.grid_mapper[cpol]['all_bl2grid']['f_gridind'] = NP.copy(fvu_gridind_unraveled[0])
                         # self.grid_mapper[cpol]['all_bl2grid']['indNN_list'] = copy.deepcopy(indNN_list)
 
-                        if identical_interferometers:
-                            arbitrary_interferometer_aperture = self.interferometers.itervalues().next().aperture
-                            krn = arbitrary_interferometer_aperture.compute(dxy, wavelength=wl[fvu_gridind], pol=cpol, rmaxNN=rmaxNN, load_lookup=False)
-                        else:
-                            # This block #1 is one way to go about per interferometer
-                            for ai,gi in enumerate(indNN_list):
-                                if len(gi) > 0:
-                                    label = self.ordered_labels[ai]
-                                    ind = NP.asarray(gi)
-                                    diffxy = grid_xy[ind,:].reshape(-1,2) - bl_xy[ai,:].reshape(-1,2)
-                                    krndict = self.interferometers[label].aperture.compute(diffxy, wavelength=wl[ind], pol=cpol, rmaxNN=rmaxNN, load_lookup=False)
-                                    if krn[cpol] is None:
-                                        krn[cpol] = NP.copy(krndict[cpol])
-                                    else:
-                                        krn[cpol] = NP.append(krn[cpol], krndict[cpol])
+                        if not threaded:
+                            if identical_interferometers:
+                                arbitrary_interferometer_aperture = self.interferometers.itervalues().next().aperture
+                                krn = arbitrary_interferometer_aperture.compute(dxy, wavelength=wl[fvu_gridind], pol=cpol, rmaxNN=rmaxNN, load_lookup=False)
+                            else:
+                                # This block #1 is one way to go about per interferometer
+                                for ai,gi in enumerate(indNN_list):
+                                    if len(gi) > 0:
+                                        label = self.ordered_labels[ai]
+                                        ind = NP.asarray(gi)
+                                        diffxy = grid_xy[ind,:].reshape(-1,2) - bl_xy[ai,:].reshape(-1,2)
+                                        krndict = self.interferometers[label].aperture.compute(diffxy, wavelength=wl[ind], pol=cpol, rmaxNN=rmaxNN, load_lookup=False)
+                                        if krn[cpol] is None:
+                                            krn[cpol] = NP.copy(krndict[cpol])
+                                        else:
+                                            krn[cpol] = NP.append(krn[cpol], krndict[cpol])
                                     
-                            # # This block #2 is another way equivalent to above block #1
-                            # uniq_blind = NP.unique(blind)
-                            # blhist, blbe, blbn, blri = OPS.binned_statistic(blind, statistic='count', bins=NP.append(uniq_blind, uniq_blind.max()+1))
-                            # for i,ublind in enumerate(uniq_blind):
-                            #     label = self.ordered_labels[ublind]
-                            #     ind = blri[blri[i]:blri[i+1]]
-                            #     krndict = self.interferometers[label].aperture.compute(dxy[ind,:], wavelength=wl[ind], pol=cpol, rmaxNN=rmaxNN, load_lookup=False)
-                            #     if krn[cpol] is None:
-                            #         krn[cpol] = NP.copy(krndict[cpol])
-                            #     else:
-                            #         krn[cpol] = NP.append(krn[cpol], krndict[cpol])
+                                # # This block #2 is another way equivalent to above block #1
+                                # uniq_blind = NP.unique(blind)
+                                # blhist, blbe, blbn, blri = OPS.binned_statistic(blind, statistic='count', bins=NP.append(uniq_blind, uniq_blind.max()+1))
+                                # for i,ublind in enumerate(uniq_blind):
+                                #     label = self.ordered_labels[ublind]
+                                #     ind = blri[blri[i]:blri[i+1]]
+                                #     krndict = self.interferometers[label].aperture.compute(dxy[ind,:], wavelength=wl[ind], pol=cpol, rmaxNN=rmaxNN, load_lookup=False)
+                                #     if krn[cpol] is None:
+                                #         krn[cpol] = NP.copy(krndict[cpol])
+                                #     else:
+                                #         krn[cpol] = NP.append(krn[cpol], krndict[cpol])
 
                         self.grid_mapper[cpol]['all_bl2grid']['illumination'] = NP.copy(krn[cpol])
                     else: # Weights do not scale with frequency (needs serious development)
                         pass
                         
                     # Determine weights that can normalize sum of kernel per interferometer per frequency to unity
-                    per_bl_per_freq_norm_wts = NP.zeros(blind.size, dtype=NP.complex64)
-                    # per_bl_per_freq_norm_wts = NP.ones(blind.size, dtype=NP.complex64)                    
-                    
-                    if parallel or (nproc is not None):
-                        list_of_val = []
-                        list_of_rowcol_tuple = []
+                    # as a single grouped reduction over the combined (baseline, channel) key
+                    if threaded:
+                        per_bl_per_freq_norm_wts = mapping['norm_wts']
                     else:
-                        spval = []
-                        sprow = []
-                        spcol = []
-                        
-                    runsum = 0
+                        blfreq_ind = blind * self.f.size + fvu_gridind_unraveled[0]
+                        per_bl_per_freq_kernel_sum = grid_scatter_add(blfreq_ind, krn[cpol], n_bl*self.f.size)
+                        per_bl_per_freq_norm_wts = (1.0 / per_bl_per_freq_kernel_sum[blfreq_ind]).astype(NP.complex64)
+                        vuf_gridind_raveled = NP.ravel_multi_index((fvu_gridind_unraveled[1], fvu_gridind_unraveled[2], fvu_gridind_unraveled[0]), self.gridu.shape+(self.f.size,))
+
                     if verbose:
                         progress = PGB.ProgressBar(widgets=[PGB.Percentage(), PGB.Bar(marker='-', left=' |', right='| '), PGB.Counter(), '/{0:0d} Baselines '.format(n_bl), PGB.ETA()], maxval=n_bl).start()
 
-                    for bi,gi in enumerate(indNN_list):
-                        if len(gi) > 0:
-                            fvu_ind = NP.asarray(gi)
-                            unraveled_fvu_ind = NP.unravel_index(fvu_ind, (self.f.size,)+self.gridu.shape)
-                            f_ind = unraveled_fvu_ind[0]
-                            v_ind = unraveled_fvu_ind[1]
-                            u_ind = unraveled_fvu_ind[2]
-                            chanhist, chanbe, chanbn, chanri = OPS.binned_statistic(f_ind, statistic='count', bins=NP.arange(self.f.size+1))
-                            for ci in xrange(self.f.size):
-                                if chanhist[ci] > 0.0:
-                                    select_chan_ind = chanri[chanri[ci]:chanri[ci+1]]
-                                    per_bl_per_freq_kernel_sum = NP.sum(krn[cpol][runsum:runsum+len(gi)][select_chan_ind])
-                                    per_bl_per_freq_norm_wts[runsum:runsum+len(gi)][select_chan_ind] = 1.0 / per_bl_per_freq_kernel_sum
-
+                    for bi in xrange(n_bl):
                         per_bl2grid_info = {}
                         per_bl2grid_info['label'] = self.ordered_labels[bi]
-                        per_bl2grid_info['f_gridind'] = NP.copy(f_ind)
-                        per_bl2grid_info['u_gridind'] = NP.copy(u_ind)
-                        per_bl2grid_info['v_gridind'] = NP.copy(v_ind)
-                        # per_bl2grid_info['fvu_gridind'] = NP.copy(gi)
-                        per_bl2grid_info['per_bl_per_freq_norm_wts'] = per_bl_per_freq_norm_wts[runsum:runsum+len(gi)]
-                        per_bl2grid_info['illumination'] = krn[cpol][runsum:runsum+len(gi)]
+                        per_bl2grid_info['f_gridind'] = fvu_gridind_unraveled[0][blbounds[bi]:blbounds[bi+1]]
+                        per_bl2grid_info['u_gridind'] = fvu_gridind_unraveled[2][blbounds[bi]:blbounds[bi+1]]
+                        per_bl2grid_info['v_gridind'] = fvu_gridind_unraveled[1][blbounds[bi]:blbounds[bi+1]]
+                        per_bl2grid_info['per_bl_per_freq_norm_wts'] = per_bl_per_freq_norm_wts[blbounds[bi]:blbounds[bi+1]]
+                        per_bl2grid_info['illumination'] = krn[cpol][blbounds[bi]:blbounds[bi+1]]
                         self.grid_mapper[cpol]['per_bl2grid'] += [copy.deepcopy(per_bl2grid_info)]
-                        runsum += len(gi)
-
-                        # determine the sparse interferometer-to-grid mapping matrix pre-requisites
 
-                        val = per_bl2grid_info['per_bl_per_freq_norm_wts']*per_bl2grid_info['illumination']
-                        vuf_gridind_unraveled = (per_bl2grid_info['v_gridind'],per_bl2grid_info['u_gridind'],per_bl2grid_info['f_gridind'])
-                        vuf_gridind_raveled = NP.ravel_multi_index(vuf_gridind_unraveled, (self.gridu.shape+(self.f.size,)))
-                        
-                        if (not parallel) and (nproc is None):
-                            spval += val.tolist()
-                            sprow += vuf_gridind_raveled.tolist()
-                            spcol += (per_bl2grid_info['f_gridind'] + bi*self.f.size).tolist()
-                        else:
-                            list_of_val += [per_bl2grid_info['per_bl_per_freq_norm_wts']*per_bl2grid_info['illumination']]
-                            list_of_rowcol_tuple += [(vuf_gridind_raveled, per_bl2grid_info['f_gridind'])]
-                    
                         if verbose:
                             progress.update(bi+1)
 
@@ -4481,18 +5467,11 @@ class InterferometerArray:
                         progress.finish()
 
                     # determine the sparse interferometer-to-grid mapping matrix
-                    if parallel or (nproc is not None):
-                        list_of_shapes = [(self.gridu.size*self.f.size, self.f.size)] * n_bl
-                        if nproc is None:
-                            nproc = max(MP.cpu_count()-1, 1) 
-                        else:
-                            nproc = min(nproc, max(MP.cpu_count()-1, 1))
-                        pool = MP.Pool(processes=nproc)
-                        list_of_spmat = pool.map(genMatrixMapper_arg_splitter, IT.izip(list_of_val, list_of_rowcol_tuple, list_of_shapes))
-                        self.bl2grid_mapper[cpol] = SM.hstack(list_of_spmat, format='csr')
+                    if threaded:
+                        self.bl2grid_mapper[cpol] = mapping['spmat']
                     else:
-                        spval = NP.asarray(spval)
-                        sprowcol = (NP.asarray(sprow), NP.asarray(spcol))
+                        spval = per_bl_per_freq_norm_wts * krn[cpol]
+                        sprowcol = (vuf_gridind_raveled, fvu_gridind_unraveled[0] + blind*self.f.size)
                         self.bl2grid_mapper[cpol] = SM.csr_matrix((spval, sprowcol), shape=(self.gridu.size*self.f.size, n_bl*self.f.size))
                     
                     self.grid_mapper[cpol]['all_bl2grid']['per_bl_per_freq_norm_wts'] = NP.copy(per_bl_per_freq_norm_wts)
@@ -4555,6 +5534,7 @@ class InterferometerArray:
             # Store as sparse matrices
             self.grid_illumination[cpol] = self.bl2grid_mapper[cpol].dot(sparse_wts.T)
             self.grid_Vf[cpol] = self.bl2grid_mapper[cpol].dot(sparse_Vf.T)
+            self.grid_illumination_state[cpol] = {'mapper': self.bl2grid_mapper[cpol], 'wts': wts > 0.0}
 
             # # Store as dense matrices
             # self.grid_illumination[cpol] = self.bl2grid_mapper[cpol].dot(wts).reshape(self.gridu.shape+(self.f.size,))
@@ -4693,6 +5673,8 @@ class InterferometerArray:
                     loopcount += 1
             if verbose:
                 progress.finish()
+
+            self.grid_illumination_state[cpol] = {'mapper': self.grid_mapper[cpol]['per_bl2grid'], 'wts': NP.asarray([per_bl2grid_info['twts'] > 0.0 for per_bl2grid_info in self.grid_mapper[cpol]['per_bl2grid']])}
             # self.grid_illumination[cpol] *= num_unflagged/sum_twts
             # self.grid_Vf[cpol] *= num_unflagged/sum_twts
 
@@ -6329,6 +7311,121 @@ class NewImage:
     img_P2       [Numpy array] 3D image cube obtained by squaring the absolute 
                  value of holograph_P2. The third dimension is along frequency.
 
+    fftbackend   [dictionary] FFT backend used by imagr(), evalPowerPattern() 
+                 and removeAutoCorr(). Contains keys 'name' ('numpy' (default)
+                 or 'pyfftw'), 'workers' (number of threads), 
+                 'wisdom_file', 'planner_effort' and 'plans' (cached pyFFTW 
+                 plans). Set by member function setFFTBackend()
+
+    dtype        [numpy dtype] Complex data type used in gridding, imaging, 
+                 stacking and accumulation. complex128 (default) for double 
+                 precision or complex64 for single precision where real 
+                 quantities (weights, images, beams) are float32. Single 
+                 precision halves the memory and size of the stacks. On a 
+                 simulated array (256 identical 3 m antennas with E-fields 
+                 of 5 point sources and noise, 256 x 256 grid, 32 channels, 
+                 8 timestamps, numpy FFT backend), the single precision 
+                 images, beams and their averages differ from the double 
+                 precision ones by at most 1.7e-5 and by 1.8e-7 rms of 
+                 their peak (1.6e-6 and 1.4e-8 with 128 antennas on a 128 x 
+                 128 grid). With the numpy FFT backend the transforms are 
+                 done in double precision for either dtype and the outputs 
+                 are cast to single precision, so complex64 gives no FFT 
+                 speedup and the cast adds about 7 percent to the FFT time 
+                 (imagr() was still 14 percent faster in the above 
+                 simulation owing to the gridding and squaring in single 
+                 precision). The pyfftw backend transforms natively in 
+                 single precision, about 1.8 times faster than in double 
+                 precision (see setFFTBackend())
+
+    wts_cache    [dictionary] Holds under each polarization the imaging weights
+                 grid_wts, their sum and the synthesized beams of the latest 
+                 imaging along with the grid illumination state of the 
+                 antenna or interferometer array (see attribute 
+                 grid_illumination_state of classes AntennaArray and 
+                 InterferometerArray) and the imaging parameters they were 
+                 obtained with. imagr() reuses them while these are unchanged
+
+    imaging_pool [dictionary] Holds the persistent pool of worker processes 
+                 used in parallel imaging under key 'pool', their number 
+                 under 'nproc' and the directory holding the files of the 
+                 shared grid and image cubes under 'dirname'. Set by 
+                 setImagingPool() and closed by closeImagingPool() or on 
+                 leaving a with-block on the instance. None if parallel 
+                 imaging has not been set up
+
+    compact_pixels
+                 [dictionary] If not None, the stacks and averages of images 
+                 and beams are stored in a compact npix x nchan layout (with
+                 preceding axis for time) holding only the selected pixels. 
+                 Set by setCompactStorage(). Has keys 'radius', 'lbox' and 
+                 'mbox' specifying the selection and 'ind' and 'shape' 
+                 holding the indices of the selected pixels in the raveled 
+                 image plane and the shape of the image plane respectively 
+                 (see evalCompactPixels())
+
+    uvgrid_avg_cropped
+                 [dictionary] Under each polarization key, a boolean that is 
+                 True if the averaged uv-plane quantities grid_vis_avg and 
+                 grid_illumination_avg were obtained by accumulate() from the
+                 averaged images and beams in the compact layout (the 
+                 uv-plane quantities having been deferred by imagr(), see its
+                 input lazy_uv). They then lack the pixels not kept in the 
+                 compact layout and cannot be used by removeAutoCorr()
+
+    stack_buffers
+                 [dictionary] Holds under keys (quantity, polarization) the 
+                 preallocated buffers of the stacks img_stack, beam_stack, 
+                 holimg_stack, holbeam_stack, grid_illumination_stack and 
+                 grid_vis_stack. The stacks are views into these buffers (see
+                 member function appendToStack())
+
+    stack_capacity
+                 [integer] Number of timestamps for which the stack buffers are
+                 preallocated. None (default) means the buffers start small 
+                 and double in size when full. Set by setStackBuffers()
+
+    stack_window [integer] If not None, the stacks hold only the latest 
+                 stack_window timestamps as a sliding window. None (default)
+                 means all timestamps are kept. Set by setStackBuffers()
+
+    stack_dir    [string] If not None, directory of the files in which the 
+                 stack buffers are stored (see class DiskStack). None 
+                 (default) means the stacks are held in memory. Set by 
+                 setStackBuffers(). The files are removed by 
+                 removeStackFiles()
+
+    accumulate_on_the_fly
+                 [dictionary] If not None, images, beams and uv-plane 
+                 quantities of each timestamp are added to running sums per 
+                 time bin by imagr() instead of being stacked. Has keys 
+                 'tbinsize' (time bin size), 't0' and 'tmax' (first and 
+                 latest timestamps accumulated) and 'acc' holding under each
+                 polarization the running sums per time bin under keys 'img', 
+                 'beam', 'grid_vis' and 'grid_illumination' and the number of
+                 timestamps per time bin under keys 'counts' and 'uvcounts'. 
+                 Set by setAccumulateOnTheFly()
+
+    holimg_norm  [dictionary] Under each polarization key of MOFF imaging, 
+                 the weighting ('weighting') and the normalization of the 
+                 holographic image per channel ('sum_wts') of the latest 
+                 call of imagr(). Used by evalHolographicPixels()
+
+    pixel_dft_cache
+                 [dictionary] Holds under key 'phase' the phase matrix of size 
+                 n_pix x n_ant x nchan used by evalHolographicPixels(), under
+                 key 'vpattern' the voltage patterns of size n_pix x nchan of
+                 the groups of equivalent antenna apertures per polarization
+                 and under key 'key' the hash of the pixel locations, antenna
+                 positions and apertures, frequencies and options they were 
+                 obtained with. It is reused while these are unchanged
+
+    uvgrid_pending
+                 [dictionary] Under each polarization key, a boolean that is 
+                 True if the uv-plane quantities wts_vuf and vis_vuf of the 
+                 current timestamp have been deferred by imagr() and not yet 
+                 evaluated (see member function evalUVGrids())
+
     Member Functions:
 
     __init__()   Initializes an instance of class Image which manages 
@@ -6341,6 +7438,85 @@ class NewImage:
                  appropriate electric field quantities associated with the 
                  antenna array.
 
+    evalUVGrids()
+                 Evaluates the uv-plane quantities wts_vuf and vis_vuf from 
+                 the beam and image if deferred by imagr()
+
+    evalFullPolImages()
+                 Forms the cross-power images and beams 'P11', 'P12', 'P21' 
+                 and 'P22' from the holographic images of 'P1' and 'P2'
+
+    evalImagingWeights()
+                 Computes the imaging weights and their sum from the grid
+                 illumination
+
+    getCachedImagingWeights()
+                 Returns the cached imaging weights and synthesized beams if
+                 still valid
+
+    updateImagingWeightsCache()
+                 Caches the imaging weights and synthesized beams along with
+                 the grid illumination state they were obtained from
+
+    setCompactStorage()
+                 Sets up the compact storage of stacked, averaged and saved
+                 images and beams keeping only pixels inside the horizon or a
+                 specified region
+
+    evalCompactPixels()
+                 Determines the pixels kept in the compact storage
+
+    compactImage()
+                 Converts an image plane quantity to the compact layout
+
+    expandCompactImage()
+                 Expands an image plane quantity in compact layout to the 
+                 full image plane
+
+    setStackBuffers()
+                 Sets the preallocated capacity, the sliding window or the
+                 on-disk storage of the stacks
+
+    appendToStack()
+                 Appends a quantity of the current timestamp to its stack
+
+    removeStackFiles()
+                 Discards all stacks and removes the files of those stored on
+                 disk
+
+    setAccumulateOnTheFly()
+                 Sets up the accumulation of running sums per time bin in 
+                 place of the stacks
+
+    accumulateOnTheFly()
+                 Adds the quantities of the current timestamp to the running
+                 sums per time bin
+
+    evalHolographicPixels()
+                 Computes the holographic image at specified pixel locations
+                 directly from the electric fields of the antennas without
+                 gridding and FFT
+
+    occupiedGridBounds()
+                 Returns the bounding box of the occupied grid cells used by
+                 the pruned FFT in imagr()
+
+    setFFTBackend()
+                 Sets the FFT backend (numpy or pyFFTW) used in imaging
+
+    saveFFTWisdom()
+                 Saves the accumulated pyFFTW wisdom to disk
+
+    setImagingPool()
+                 Sets up the persistent worker pool for parallel imaging
+
+    closeImagingPool()
+                 Closes the worker pool used for parallel imaging
+
+    imagrChannelsParallel()
+                 Weights and transforms the gridded cubes of a polarization 
+                 with the channels split across the worker pool
+
     save()       Saves the image information to disk
 
     Read the member function docstrings for more details
@@ -6349,7 +7525,7 @@ class NewImage:
 
     def __init__(self, f0=None, f=None, pol=None, antenna_array=None,
                  interferometer_array=None, infile=None, timestamp=None,
-                 verbose=True):
+                 dtype='complex128', verbose=True):
         
         """
         ------------------------------------------------------------------------
@@ -6367,6 +7543,10 @@ class NewImage:
         holograph_PB_P1, img_P1, PB_P1, lf_P1, and mf_P1
 
         Read docstring of class Image for details on these attributes.
+
+        Input dtype ('complex128' (default) or 'complex64') sets attribute 
+        dtype, the precision used in gridding, imaging, stacking and 
+        accumulation.
         ------------------------------------------------------------------------
         """
 
@@ -6374,6 +7554,10 @@ class NewImage:
             print '\nInitializing an instance of class Image...\n'
             print '\tVerifying for compatible arguments...'
 
+        self.dtype = NP.dtype(dtype)
+        if self.dtype not in (NP.complex64, NP.complex128):
+            raise ValueError('Input dtype must be complex64 or complex128')
+
         if timestamp is not None:
             self.timestamp = timestamp
             if verbose:
@@ -6554,6 +7738,19 @@ class NewImage:
         self.nzsp_beam_avg = {}
         self.nzsp_img = {}
         self.nzsp_beam = {}
+        self.fftbackend = {'name': 'numpy', 'workers': None, 'wisdom_file': None, 'planner_effort': None, 'plans': {}}
+        self.uvgrid_pending = {}
+        self.wts_cache = {}
+        self.imaging_pool = None
+        self.compact_pixels = None
+        self.pixel_dft_cache = {}
+        self.holimg_norm = {}
+        self.uvgrid_avg_cropped = {}
+        self.stack_buffers = {}
+        self.stack_capacity = None
+        self.stack_window = None
+        self.stack_dir = None
+        self.accumulate_on_the_fly = None
 
         if antenna_array is not None:
             if verbose:
@@ -6719,6 +7916,7 @@ class NewImage:
         self.grid_Vf = {}
         self.wts_vuf = {}
         self.vis_vuf = {}
+        self.uvgrid_pending = {}
 
         if self.measured_type == 'E-field':
             for apol in ['P1', 'P2']:
@@ -6805,8 +8003,288 @@ class NewImage:
 
     ############################################################################
 
+    def setFFTBackend(self, backend='numpy', workers=None, wisdom_file=None,
+                      planner_effort='FFTW_MEASURE'):
+
+        """
+        ------------------------------------------------------------------------
+        Sets the FFT backend used by member functions imagr(), 
+        evalPowerPattern() and removeAutoCorr()
+
+        Inputs:
+
+        backend   [string] FFT backend. Accepted values are 'numpy' (default,
+                  single-threaded) and 'pyfftw' (pyFFTW, multi-threaded with 
+                  plans cached and reused for inputs of same shape and type).
+                  scipy.fft is not offered as it requires scipy >= 1.4 which
+                  does not support Python 2
+
+        workers   [integer] number of threads to be used by the 'pyfftw' 
+                  backend. Default = None, means automatically 
+                  determines the number of process cores in the system and 
+                  use one less than that to avoid locking the system for other
+                  processes. Ignored by the 'numpy' backend
+
+        wisdom_file
+                  [string] Full path to the file containing pyFFTW wisdom. If 
+                  the file exists, the wisdom is loaded from it so that plans 
+                  are not determined afresh. The accumulated wisdom can be 
+                  saved to this file with member function saveFFTWisdom(). 
+                  Applicable only to the 'pyfftw' backend. Default=None
+
+        planner_effort
+                  [string] Planning effort for pyFFTW. Accepted values are 
+                  'FFTW_ESTIMATE', 'FFTW_MEASURE' (default), 'FFTW_PATIENT' 
+                  and 'FFTW_EXHAUSTIVE'. Applicable only to the 'pyfftw' 
+                  backend
+        ------------------------------------------------------------------------
+        """
+
+        if backend not in ['numpy', 'pyfftw']:
+            raise ValueError('Input backend must be set to "numpy" or "pyfftw"')
+
+        if workers is None:
+            workers = max(MP.cpu_count()-1, 1)
+        elif not isinstance(workers, (int, long, NP.integer)):
+            raise TypeError('Input workers must be an integer')
+        elif workers <= 0:
+            raise ValueError('Input workers must be positive')
+
+        if backend == 'pyfftw':
+            if planner_effort not in ['FFTW_ESTIMATE', 'FFTW_MEASURE', 'FFTW_PATIENT', 'FFTW_EXHAUSTIVE']:
+                raise ValueError('Invalid value specified for input planner_effort')
+            try:
+                import pyfftw
+            except ImportError:
+                raise ImportError('Module pyfftw not found. It is required for FFT backend "pyfftw"')
+            if wisdom_file is not None:
+                if os.path.isfile(wisdom_file):
+                    import cPickle
+                    with open(wisdom_file, 'rb') as fhandle:
+                        pyfftw.import_wisdom(cPickle.load(fhandle))
+
+        self.fftbackend = {'name': backend, 'workers': workers, 'wisdom_file': wisdom_file, 'planner_effort': planner_effort, 'plans': {}}
+
+    ############################################################################
+
+    def saveFFTWisdom(self, wisdom_file=None):
+
+        """
+        ------------------------------------------------------------------------
+        Saves the wisdom accumulated by pyFFTW to disk so that it can be loaded
+        by member function setFFTBackend() in later runs
+
+        Inputs:
+
+        wisdom_file
+                  [string] Full path to the file to which the wisdom is to be 
+                  saved. If set to None (default), the file specified in 
+                  setFFTBackend() is used
+        ------------------------------------------------------------------------
+        """
+
+        if self.fftbackend['name'] != 'pyfftw':
+            raise ValueError('FFT wisdom is applicable only to FFT backend "pyfftw"')
+
+        if wisdom_file is None:
+            wisdom_file = self.fftbackend['wisdom_file']
+        if wisdom_file is None:
+            raise ValueError('File to save the FFT wisdom has not been specified')
+
+        import pyfftw
+        import cPickle
+        with open(wisdom_file, 'wb') as fhandle:
+            cPickle.dump(pyfftw.export_wisdom(), fhandle, protocol=2)
+
+    ############################################################################
+
+    def setImagingPool(self, nproc=None, dirname=None):
+
+        """
+        ------------------------------------------------------------------------
+        Sets up the persistent pool of worker processes used for parallel 
+        imaging in imagr(). The channels of the gridded cubes are split 
+        across the workers which map the cubes in place from files shared by
+        name and write the images and beams directly into the output arrays 
+        (see member function imagrChannelsParallel()). Any existing pool is
+        closed. The pool persists until closeImagingPool() is called or a 
+        with-block on the instance is left, e.g.
+
+            with NewImage(antenna_array=aar) as img:
+                img.setImagingPool(nproc=4)
+                img.imagr(parallel=True)
+
+        Inputs:
+
+        nproc     [integer] Number of worker processes. If set to None 
+                  (default), it is set to one less than the number of cores
+                  (at least one) 
+
+        dirname   [string] Directory in which the files of the shared grid
+                  and image cubes are created. The files are removed once 
+                  the workers are done and the cubes remain mapped in this 
+                  process. If set to None (default), /dev/shm is used if 
+                  present so that the cubes stay in memory, otherwise the 
+                  default directory for temporary files
+        ------------------------------------------------------------------------
+        """
+
+        if nproc is None:
+            nproc = max(MP.cpu_count()-1, 1)
+        elif not isinstance(nproc, int):
+            raise TypeError('Input nproc must be an integer')
+        elif nproc < 1:
+            raise ValueError('Input nproc must be positive')
+
+        if dirname is None:
+            if os.path.isdir('/dev/shm'):
+                dirname = '/dev/shm'
+            else:
+                dirname = tempfile.gettempdir()
+        elif not os.path.isdir(dirname):
+            raise ValueError('Directory {0} for the shared imaging cubes not found'.format(dirname))
+
+        self.closeImagingPool()
+        pool = MP.Pool(processes=nproc, initializer=init_imaging_worker)
+        self.imaging_pool = {'pool': pool, 'nproc': nproc, 'dirname': dirname}
+
+    ############################################################################
+
+    def closeImagingPool(self):
+
+        """
+        ------------------------------------------------------------------------
+        Closes the pool of worker processes used for parallel imaging
+        ------------------------------------------------------------------------
+        """
+
+        if self.imaging_pool is not None:
+            self.imaging_pool['pool'].close()
+            self.imaging_pool['pool'].join()
+            self.imaging_pool = None
+
+    ############################################################################
+
+    def __enter__(self):
+        return self
+
+    ############################################################################
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.closeImagingPool()
+
+    ############################################################################
+
+    def imagrChannelsParallel(self, pol, weighting='natural', pad=0,
+                              pruned_fft=False, beam=True):
+
+        """
+        ------------------------------------------------------------------------
+        Images the gridded quantities of the specified polarization with the
+        channels split across the worker processes in attribute imaging_pool
+        (see setImagingPool()). The gridded illumination and electric fields
+        (or visibilities) are densified directly into cubes shared with the 
+        workers. Each worker determines the imaging weights of its channels,
+        weights the grids, transforms them and writes the images and beams 
+        directly into the output cubes, so that no cubes are copied or 
+        pickled. Sets attributes grid_illumination, grid_Ef (or grid_Vf), 
+        grid_wts, img and holimg and, if beam is True, beam and holbeam 
+        (holimg and holbeam only for MOFF). Called by imagr()
+
+        Inputs:
+
+        pol       [string] polarization. Allowed values are 'P1', 'P2' in case
+                  of MOFF or 'P11', 'P12', 'P21', 'P22' in case of FX
+
+        weighting [string] indicates weighting scheme. Default='natural'. 
+                  Accepted values are 'natural' and 'uniform'
+
+        pad       [integer] padding as in imagr(). Default=0
+
+        pruned_fft
+                  [boolean] If True, the FFTs skip the all-zero lines of the
+                  padded grid as in imagr(). Default=False
+
+        beam      [boolean] If True (default), the synthesized beams are 
+                  also determined
+
+        Output:
+
+        Sum of the weighted illumination magnitudes over the grid of shape
+        1 x 1 x nchan
+        ------------------------------------------------------------------------
+        """
+
+        if self.imaging_pool is None:
+            raise ValueError('Pool of imaging worker processes has not been set up. Use member function setImagingPool()')
+
+        if self.measured_type == 'E-field':
+            array = self.antenna_array
+            array_grid = array.grid_Ef
+            grid_attr = self.grid_Ef
+            imgshape = (2**(pad+1) * self.gridu.shape[0], 2**(pad+1) * self.gridv.shape[1])
+            padding = None
+        else:
+            array = self.interferometer_array
+            array_grid = array.grid_Vf
+            grid_attr = self.grid_Vf
+            padding = ((2**pad-1)*self.gridv.shape[0]/2, (2**pad-1)*self.gridu.shape[1]/2)
+            imgshape = (self.gridv.shape[0] + 2*padding[0], self.gridu.shape[1] + 2*padding[1])
+
+        nchan = self.f.size
+        cubeshape = self.gridu.shape + (nchan,)
+        cdtype = NP.result_type(self.dtype, NP.complex64)
+        rdtype = NP.finfo(cdtype).dtype
+        dirname = self.imaging_pool['dirname']
+        arrays = {}
+        outputs = {}
+        try:
+            for key, qtydict, attr in [('illumination', array.grid_illumination, self.grid_illumination), ('grid', array_grid, grid_attr)]:
+                if pol in qtydict:
+                    qty = qtydict[pol]
+                else:
+                    qty = attr[pol]
+                cube, arrays[key] = new_shared_array(cubeshape, self.dtype, dirname=dirname)
+                fill_shared_array(cube, qty)
+                attr[pol] = cube
+            outkeys = [('grid_wts', cubeshape, rdtype), ('sum_wts', (1,1,nchan), rdtype), ('img', imgshape+(nchan,), rdtype)]
+            if beam:
+                outkeys += [('beam', imgshape+(nchan,), rdtype)]
+            if self.measured_type == 'E-field':
+                outkeys += [('holimg', imgshape+(nchan,), cdtype)]
+                if beam:
+                    outkeys += [('holbeam', imgshape+(nchan,), cdtype)]
+            for key, shape, dtype in outkeys:
+                outputs[key], arrays[key] = new_shared_array(shape, dtype, dirname=dirname)
+
+            bounds = None
+            if pruned_fft:
+                bounds = self.occupiedGridBounds(pol)
+            backend = {'name': self.fftbackend['name'], 'planner_effort': self.fftbackend['planner_effort']}
+            chanbounds = NP.linspace(0, nchan, min(self.imaging_pool['nproc'], nchan)+1).astype(NP.int)
+            list_of_args = [(self.measured_type, arrays, imgshape, (beg, end), weighting, padding, bounds, backend) for beg, end in IT.izip(chanbounds[:-1], chanbounds[1:]) if end > beg]
+            self.imaging_pool['pool'].map(image_channels_arg_splitter, list_of_args)
+        finally:
+            # The arrays stay mapped in this process after their files are removed
+            for filename, shape, dtype in arrays.itervalues():
+                os.remove(filename)
+
+        self.grid_wts[pol] = outputs['grid_wts']
+        self.img[pol] = outputs['img']
+        if beam:
+            self.beam[pol] = outputs['beam']
+        if self.measured_type == 'E-field':
+            self.holimg[pol] = outputs['holimg']
+            if beam:
+                self.holbeam[pol] = outputs['holbeam']
+        return outputs['sum_wts']
+
+    ############################################################################
+
     def imagr(self, pol=None, weighting='natural', pad=0, stack=True,
-              grid_map_method='sparse', cal_loop=False, verbose=True):
+              grid_map_method='sparse', cal_loop=False, lazy_uv=False,
+              pruned_fft=False, fullpol=False, cache_wts=True,
+              parallel=False, verbose=True):
 
         """
         ------------------------------------------------------------------------
@@ -6833,7 +8311,10 @@ class NewImage:
                   padding for FX)
 
         stack     [boolean] If True (default), stacks the imaged and uv-gridded
-                  data to the stack for batch processing later
+                  data to the stack for batch processing later. If the 
+                  accumulation on the fly is set up (see member function 
+                  setAccumulateOnTheFly()), they are added to the running 
+                  sums instead and not stacked
 
         grid_map_method
                   [string] Accepted values are 'regular' and 'sparse' (default).
@@ -6850,6 +8331,49 @@ class NewImage:
                   of electric fields are assumed to be the calibrated data to 
                   be mapped to the grid 
 
+        lazy_uv   [boolean] If False (default), the uv-plane quantities 
+                  wts_vuf and vis_vuf are obtained by inverse transforming 
+                  the beam and image right away. If True, these inverse 
+                  transforms are deferred until requested by member functions
+                  evalUVGrids() or removeAutoCorr(). In this case, stack() 
+                  does not stack them and accumulate() derives the averaged 
+                  uv-plane quantities from the averaged beam and image, 
+                  which is equivalent since the transform is linear
+
+        pruned_fft
+                  [boolean] If True, the 2D FFT is done as two 1D passes where
+                  the first pass skips the all-zero lines of the padded grid 
+                  outside the bounding box of the occupied grid cells (see 
+                  member function occupiedGridBounds()). This reduces the FFT
+                  work for compact arrays and padded grids. If False (default)
+                  the full 2D FFT is performed. The results are identical up
+                  to rounding errors
+
+        fullpol   [boolean] Applicable only in case when attribute 
+                  measured_type is set to 'E-field' (MOFF imaging). If True, 
+                  the cross-power images and beams under polarizations 'P11', 
+                  'P12', 'P21' and 'P22' are also formed from the holographic 
+                  images and beams of 'P1' and 'P2' without additional FFTs 
+                  (see member function evalFullPolImages()). Both 'P1' and 
+                  'P2' must be imaged. If False (default), only the power 
+                  images of 'P1' and 'P2' are formed
+
+        cache_wts [boolean] If True (default), the imaging weights, their 
+                  sum and the synthesized beam are reused from attribute 
+                  wts_cache if the grid illumination state (mapping and 
+                  flags) of the antenna or interferometer array and the 
+                  imaging parameters are unchanged since they were cached, 
+                  which saves the weighting passes and the FFT of the grid 
+                  illumination. If False, they are recomputed and not cached
+
+        parallel  [boolean] If True, the weighting and FFTs of the gridded 
+                  cubes are split along the channel axis across the pool of 
+                  worker processes which read the gridded cubes and write 
+                  the images and beams in place (see member function 
+                  imagrChannelsParallel()). The pool must have been set up 
+                  with setImagingPool(). If False (default), imaging is 
+                  performed in this process
+
         verbose   [boolean] If True (default), prints diagnostic and progress
                   messages. If False, suppress printing such messages.
         ------------------------------------------------------------------------
@@ -6885,56 +8409,99 @@ class NewImage:
             for apol in pol:
                 if apol in ['P1', 'P2']:
                     if grid_map_method == 'regular':
-                        self.antenna_array.make_grid_cube_new(pol=apol, verbose=verbose)
+                        self.antenna_array.make_grid_cube_new(pol=apol, dtype=self.dtype, verbose=verbose)
                     elif grid_map_method == 'sparse':
-                        self.antenna_array.applyMappingMatrix(pol=apol, cal_loop=cal_loop, verbose=verbose)
+                        self.antenna_array.applyMappingMatrix(pol=apol, cal_loop=cal_loop, dtype=self.dtype, verbose=verbose)
                     else:
                         raise ValueError('Invalid value specified for input parameter grid_map_method')
 
-                    self.grid_wts[apol] = NP.zeros(self.gridu.shape+(self.f.size,))
-                    if apol in self.antenna_array.grid_illumination:
+                    if (not parallel) and (apol in self.antenna_array.grid_illumination):
                         if SM.issparse(self.antenna_array.grid_illumination[apol]):
-                            self.grid_illumination[apol] = self.antenna_array.grid_illumination[apol].A.reshape(self.gridu.shape+(self.f.size,))
-                            self.grid_Ef[apol] = self.antenna_array.grid_Ef[apol].A.reshape(self.gridu.shape+(self.f.size,))
+                            self.grid_illumination[apol] = self.antenna_array.grid_illumination[apol].A.reshape(self.gridu.shape+(self.f.size,)).astype(self.dtype, copy=False)
+                            self.grid_Ef[apol] = self.antenna_array.grid_Ef[apol].A.reshape(self.gridu.shape+(self.f.size,)).astype(self.dtype, copy=False)
                         else:
-                            self.grid_illumination[apol] = self.antenna_array.grid_illumination[apol]
-                            self.grid_Ef[apol] = self.antenna_array.grid_Ef[apol]
+                            self.grid_illumination[apol] = self.antenna_array.grid_illumination[apol].astype(self.dtype, copy=False)
+                            self.grid_Ef[apol] = self.antenna_array.grid_Ef[apol].astype(self.dtype, copy=False)
                     
                     if verbose: print 'Preparing to Inverse Fourier Transform...'
-                    if weighting == 'uniform':
-                        self.grid_wts[apol][NP.abs(self.grid_illumination[apol]) > 0.0] = 1.0/NP.abs(self.grid_illumination[apol][NP.abs(self.grid_illumination[apol]) > 0.0])
-                    else:
-                        self.grid_wts[apol][NP.abs(self.grid_illumination[apol]) > 0.0] = 1.0
-
-                    sum_wts = NP.sum(NP.abs(self.grid_wts[apol] * self.grid_illumination[apol]), axis=(0,1), keepdims=True)
-
-                    syn_beam = NP.fft.fft2(self.grid_wts[apol]*self.grid_illumination[apol], s=[2**(pad+1) * self.gridu.shape[0], 2**(pad+1) * self.gridv.shape[1]], axes=(0,1))
-                    dirty_image = NP.fft.fft2(self.grid_wts[apol]*self.grid_Ef[apol], s=[2**(pad+1) * self.gridu.shape[0], 2**(pad+1) * self.gridv.shape[1]], axes=(0,1))
+                    wts_params = (weighting, pad, pruned_fft, self.dtype.str)
+                    cached = None
+                    if cache_wts:
+                        cached = self.getCachedImagingWeights(apol, wts_params)
                     self.gridl, self.gridm = NP.meshgrid(NP.fft.fftshift(NP.fft.fftfreq(2**(pad+1) * self.gridu.shape[1], du)), NP.fft.fftshift(NP.fft.fftfreq(2**(pad+1) * self.gridv.shape[0], dv)))
 
-                    # if pad == 'on':
-                    #     syn_beam = NP.fft.fft2(self.grid_wts[apol]*self.grid_illumination[apol], s=[4*self.gridu.shape[0], 4*self.gridv.shape[1]], axes=(0,1))
-                    #     dirty_image = NP.fft.fft2(self.grid_wts[apol]*self.grid_Ef[apol], s=[4*self.gridu.shape[0], 4*self.gridv.shape[1]], axes=(0,1))
-                    #     self.gridl, self.gridm = NP.meshgrid(NP.fft.fftshift(NP.fft.fftfreq(4*grid_shape[1], du)), NP.fft.fftshift(NP.fft.fftfreq(4*grid_shape[0], dv)))
-                    # else:
-                    #     syn_beam = NP.fft.fft2(self.grid_wts[apol]*self.grid_illumination[apol], axes=(0,1))
-                    #     dirty_image = NP.fft.fft2(self.grid_wts[apol]*self.grid_Ef[apol], axes=(0,1))
-                    #     self.gridl, self.gridm = NP.meshgrid(NP.fft.fftshift(NP.fft.fftfreq(grid_shape[1], du)), NP.fft.fftshift(NP.fft.fftfreq(grid_shape[0], dv)))
-
-                    self.holbeam[apol] = NP.fft.fftshift(syn_beam/sum_wts, axes=(0,1))
-                    self.holimg[apol] = NP.fft.fftshift(dirty_image/sum_wts, axes=(0,1))
-                    syn_beam = NP.abs(syn_beam)**2
-                    sum_wts2 = sum_wts**2
-                    dirty_image = NP.abs(dirty_image)**2
-                    self.beam[apol] = NP.fft.fftshift(syn_beam/sum_wts2, axes=(0,1))
-                    self.img[apol] = NP.fft.fftshift(dirty_image/sum_wts2, axes=(0,1))
-                    qty_vuf = NP.fft.ifft2(syn_beam/sum_wts2, axes=(0,1)) # Inverse FT
-                    qty_vuf = NP.fft.ifftshift(qty_vuf, axes=(0,1)) # Shift array to be centered
-                    # self.wts_vuf[apol] = qty_vuf[self.gridv.shape[0]:3*self.gridv.shape[0],self.gridu.shape[1]:3*self.gridu.shape[1],:]
-                    self.wts_vuf[apol] = qty_vuf[qty_vuf.shape[0]/2-self.gridv.shape[0]:qty_vuf.shape[0]/2+self.gridv.shape[0], qty_vuf.shape[1]/2-self.gridu.shape[1]:qty_vuf.shape[1]/2+self.gridu.shape[1], :]
-                    qty_vuf = NP.fft.ifft2(dirty_image/sum_wts2, axes=(0,1)) # Inverse FT
-                    qty_vuf = NP.fft.ifftshift(qty_vuf, axes=(0,1)) # Shift array to be centered
-                    self.vis_vuf[apol] = qty_vuf[qty_vuf.shape[0]/2-self.gridv.shape[0]:qty_vuf.shape[0]/2+self.gridv.shape[0], qty_vuf.shape[1]/2-self.gridu.shape[1]:qty_vuf.shape[1]/2+self.gridu.shape[1], :]
+                    if parallel:
+                        sum_wts = self.imagrChannelsParallel(apol, weighting=weighting, pad=pad, pruned_fft=pruned_fft, beam=(cached is None))
+                        if cached is None:
+                            if cache_wts:
+                                self.updateImagingWeightsCache(apol, wts_params, sum_wts)
+                        else:
+                            self.holbeam[apol] = cached['holbeam']
+                            self.beam[apol] = cached['beam']
+                    else:
+                        if cached is None:
+                            self.grid_wts[apol], sum_wts = self.evalImagingWeights(apol, weighting=weighting)
+                        else:
+                            self.grid_wts[apol] = cached['grid_wts']
+                            sum_wts = cached['sum_wts']
+
+                        # The checkerboard on the weighted grids centers the 
+                        # transforms, which replaces fftshift() of the outputs. 
+                        # Padding is through the FFT size argument
+                        chk = checkerboard(self.gridu.shape, axes=(0,1), ndim=3)
+                        wtd_Ef = self.grid_wts[apol] * self.grid_Ef[apol]
+                        wtd_Ef *= chk
+                        if cached is None:
+                            wtd_illumination = self.grid_wts[apol] * self.grid_illumination[apol]
+                            wtd_illumination *= chk
+
+                        if pruned_fft:
+                            bounds = self.occupiedGridBounds(apol)
+                            if cached is None:
+                                syn_beam = pruned_fft2(wtd_illumination, [2**(pad+1) * self.gridu.shape[0], 2**(pad+1) * self.gridv.shape[1]], bounds, axes=(0,1), backend=self.fftbackend)
+                            dirty_image = pruned_fft2(wtd_Ef, [2**(pad+1) * self.gridu.shape[0], 2**(pad+1) * self.gridv.shape[1]], bounds, axes=(0,1), backend=self.fftbackend)
+                        else:
+                            if cached is None:
+                                syn_beam = fft2_on_backend(wtd_illumination, s=[2**(pad+1) * self.gridu.shape[0], 2**(pad+1) * self.gridv.shape[1]], axes=(0,1), backend=self.fftbackend)
+                            dirty_image = fft2_on_backend(wtd_Ef, s=[2**(pad+1) * self.gridu.shape[0], 2**(pad+1) * self.gridv.shape[1]], axes=(0,1), backend=self.fftbackend)
+                        del wtd_Ef
+                        if cached is None:
+                            del wtd_illumination
+
+                        # if pad == 'on':
+                        #     syn_beam = NP.fft.fft2(self.grid_wts[apol]*self.grid_illumination[apol], s=[4*self.gridu.shape[0], 4*self.gridv.shape[1]], axes=(0,1))
+                        #     dirty_image = NP.fft.fft2(self.grid_wts[apol]*self.grid_Ef[apol], s=[4*self.gridu.shape[0], 4*self.gridv.shape[1]], axes=(0,1))
+                        #     self.gridl, self.gridm = NP.meshgrid(NP.fft.fftshift(NP.fft.fftfreq(4*grid_shape[1], du)), NP.fft.fftshift(NP.fft.fftfreq(4*grid_shape[0], dv)))
+                        # else:
+                        #     syn_beam = NP.fft.fft2(self.grid_wts[apol]*self.grid_illumination[apol], axes=(0,1))
+                        #     dirty_image = NP.fft.fft2(self.grid_wts[apol]*self.grid_Ef[apol], axes=(0,1))
+                        #     self.gridl, self.gridm = NP.meshgrid(NP.fft.fftshift(NP.fft.fftfreq(grid_shape[1], du)), NP.fft.fftshift(NP.fft.fftfreq(grid_shape[0], dv)))
+
+                        sum_wts2 = sum_wts**2
+                        if cached is None:
+                            self.holbeam[apol] = syn_beam/sum_wts
+                            syn_beam = NP.abs(syn_beam)**2
+                            syn_beam /= sum_wts2
+                            self.beam[apol] = syn_beam
+                            if cache_wts:
+                                self.updateImagingWeightsCache(apol, wts_params, sum_wts)
+                        else:
+                            self.holbeam[apol] = cached['holbeam']
+                            self.beam[apol] = cached['beam']
+                        self.holimg[apol] = dirty_image/sum_wts
+                        dirty_image = NP.abs(dirty_image)**2
+                        dirty_image /= sum_wts2
+                        self.img[apol] = dirty_image
+                    self.holimg_norm[apol] = {'weighting': weighting, 'sum_wts': sum_wts.ravel()}
+                    self.wts_vuf[apol] = None
+                    self.vis_vuf[apol] = None
+                    self.uvgrid_pending[apol] = True
+
+            if fullpol:
+                if ('P1' not in pol) or ('P2' not in pol):
+                    raise ValueError('Both polarizations P1 and P2 must be imaged for full polarization imaging')
+                self.evalFullPolImages()
+                pol = pol + ['P11', 'P12', 'P21', 'P22']
                        
         if self.measured_type == 'visibility':
             if pol is None: pol = ['P11', 'P12', 'P21', 'P22']
@@ -6948,287 +8515,1039 @@ class NewImage:
                     else:
                         raise ValueError('Invalid value specified for input parameter grid_map_method')
 
-                    self.grid_wts[cpol] = NP.zeros(self.gridu.shape+(self.f.size,))
-                    if cpol in self.interferometer_array.grid_illumination:
+                    if (not parallel) and (cpol in self.interferometer_array.grid_illumination):
                         if SM.issparse(self.interferometer_array.grid_illumination[cpol]):
-                            self.grid_illumination[cpol] = self.interferometer_array.grid_illumination[cpol].A.reshape(self.gridu.shape+(self.f.size,))
-                            self.grid_Vf[cpol] = self.interferometer_array.grid_Vf[cpol].A.reshape(self.gridu.shape+(self.f.size,))
+                            self.grid_illumination[cpol] = self.interferometer_array.grid_illumination[cpol].A.reshape(self.gridu.shape+(self.f.size,)).astype(self.dtype, copy=False)
+                            self.grid_Vf[cpol] = self.interferometer_array.grid_Vf[cpol].A.reshape(self.gridu.shape+(self.f.size,)).astype(self.dtype, copy=False)
                         else:
-                            self.grid_illumination[cpol] = self.interferometer_array.grid_illumination[cpol]
-                            self.grid_Vf[cpol] = self.interferometer_array.grid_Vf[cpol]
+                            self.grid_illumination[cpol] = self.interferometer_array.grid_illumination[cpol].astype(self.dtype, copy=False)
+                            self.grid_Vf[cpol] = self.interferometer_array.grid_Vf[cpol].astype(self.dtype, copy=False)
 
                     if verbose: print 'Preparing to Inverse Fourier Transform...'
-                    if weighting == 'uniform':
-                        self.grid_wts[cpol][NP.abs(self.grid_illumination[cpol]) > 0.0] = 1.0/NP.abs(self.grid_illumination[cpol][NP.abs(self.grid_illumination[cpol]) > 0.0])
-                    else:
-                        self.grid_wts[cpol][NP.abs(self.grid_illumination[cpol]) > 0.0] = 1.0
+                    wts_params = (weighting, pad, pruned_fft, self.dtype.str)
+                    cached = None
+                    if cache_wts:
+                        cached = self.getCachedImagingWeights(cpol, wts_params)
+                    self.gridl, self.gridm = NP.meshgrid(NP.fft.fftshift(NP.fft.fftfreq(2**pad * grid_shape[1], du)), NP.fft.fftshift(NP.fft.fftfreq(2**pad * grid_shape[0], dv)))
 
-                    sum_wts = NP.sum(NP.abs(self.grid_wts[cpol] * self.grid_illumination[cpol]), axis=(0,1), keepdims=True)
+                    if parallel:
+                        sum_wts = self.imagrChannelsParallel(cpol, weighting=weighting, pad=pad, pruned_fft=pruned_fft, beam=(cached is None))
+                        if cached is None:
+                            if cache_wts:
+                                self.updateImagingWeightsCache(cpol, wts_params, sum_wts)
+                        else:
+                            self.beam[cpol] = cached['beam']
+                    else:
+                        if cached is None:
+                            self.grid_wts[cpol], sum_wts = self.evalImagingWeights(cpol, weighting=weighting)
+                        else:
+                            self.grid_wts[cpol] = cached['grid_wts']
+                            sum_wts = cached['sum_wts']
+
+                        padding = ((2**pad-1)*self.gridv.shape[0]/2, (2**pad-1)*self.gridu.shape[1]/2)
+
+                        # if pad == 'on': # Pad it with zeros on either side to be twice the size
+                        #     padded_syn_beam_in_uv = NP.pad(self.grid_wts[cpol]*self.grid_illumination[cpol], ((self.gridv.shape[0]/2,self.gridv.shape[0]/2),(self.gridu.shape[1]/2,self.gridu.shape[1]/2),(0,0)), mode='constant', constant_values=0)
+                        #     padded_grid_Vf = NP.pad(self.grid_wts[cpol]*self.grid_Vf[cpol], ((self.gridv.shape[0]/2,self.gridv.shape[0]/2),(self.gridu.shape[1]/2,self.gridu.shape[1]/2),(0,0)), mode='constant', constant_values=0)
+                        #     self.gridl, self.gridm = NP.meshgrid(NP.fft.fftshift(NP.fft.fftfreq(2*grid_shape[1], du)), NP.fft.fftshift(NP.fft.fftfreq(2*grid_shape[0], dv)))
+                        # else:  # No padding
+                        #     padded_syn_beam_in_uv = self.grid_wts[cpol]*self.grid_illumination[cpol]
+                        #     padded_grid_Vf = self.grid_wts[cpol]*self.grid_Vf[cpol]
+                        #     self.gridl, self.gridm = NP.meshgrid(NP.fft.fftshift(NP.fft.fftfreq(grid_shape[1], du)), NP.fft.fftshift(NP.fft.fftfreq(grid_shape[0], dv)))
+
+                        # Compute the synthesized beam. It is at a finer resolution due to padding
+                        bounds = None
+                        if pruned_fft:
+                            bounds = self.occupiedGridBounds(cpol)
+                        if cached is None:
+                            syn_beam = centered_fft2(self.grid_wts[cpol]*self.grid_illumination[cpol], padding, axes=(0,1), overwrite=True, bounds=bounds, backend=self.fftbackend)
+                        dirty_image = centered_fft2(self.grid_wts[cpol]*self.grid_Vf[cpol], padding, axes=(0,1), overwrite=True, bounds=bounds, backend=self.fftbackend)
+            
+                        # Select only the real part, equivalent to adding conjugate baselines
+                        dirty_image = dirty_image.real
+
+                        if cached is None:
+                            syn_beam = syn_beam.real
+                            self.beam[cpol] = syn_beam/sum_wts
+                            if cache_wts:
+                                self.updateImagingWeightsCache(cpol, wts_params, sum_wts)
+                        else:
+                            self.beam[cpol] = cached['beam']
+                        self.img[cpol] = dirty_image/sum_wts
+                    self.wts_vuf[cpol] = None
+                    self.vis_vuf[cpol] = None
+                    self.uvgrid_pending[cpol] = True
 
-                    padded_syn_beam_in_uv = NP.pad(self.grid_wts[cpol]*self.grid_illumination[cpol], (((2**pad-1)*self.gridv.shape[0]/2,(2**pad-1)*self.gridv.shape[0]/2),((2**pad-1)*self.gridu.shape[1]/2,(2**pad-1)*self.gridu.shape[1]/2),(0,0)), mode='constant', constant_values=0)
-                    padded_grid_Vf = NP.pad(self.grid_wts[cpol]*self.grid_Vf[cpol], (((2**pad-1)*self.gridv.shape[0]/2,(2**pad-1)*self.gridv.shape[0]/2),((2**pad-1)*self.gridu.shape[1]/2,(2**pad-1)*self.gridu.shape[1]/2),(0,0)), mode='constant', constant_values=0)
-                    self.gridl, self.gridm = NP.meshgrid(NP.fft.fftshift(NP.fft.fftfreq(2**pad * grid_shape[1], du)), NP.fft.fftshift(NP.fft.fftfreq(2**pad * grid_shape[0], dv)))
+        if self.compact_pixels is not None:
+            self.evalCompactPixels()
 
-                    # if pad == 'on': # Pad it with zeros on either side to be twice the size
-                    #     padded_syn_beam_in_uv = NP.pad(self.grid_wts[cpol]*self.grid_illumination[cpol], ((self.gridv.shape[0]/2,self.gridv.shape[0]/2),(self.gridu.shape[1]/2,self.gridu.shape[1]/2),(0,0)), mode='constant', constant_values=0)
-                    #     padded_grid_Vf = NP.pad(self.grid_wts[cpol]*self.grid_Vf[cpol], ((self.gridv.shape[0]/2,self.gridv.shape[0]/2),(self.gridu.shape[1]/2,self.gridu.shape[1]/2),(0,0)), mode='constant', constant_values=0)
-                    #     self.gridl, self.gridm = NP.meshgrid(NP.fft.fftshift(NP.fft.fftfreq(2*grid_shape[1], du)), NP.fft.fftshift(NP.fft.fftfreq(2*grid_shape[0], dv)))
-                    # else:  # No padding
-                    #     padded_syn_beam_in_uv = self.grid_wts[cpol]*self.grid_illumination[cpol]
-                    #     padded_grid_Vf = self.grid_wts[cpol]*self.grid_Vf[cpol]
-                    #     self.gridl, self.gridm = NP.meshgrid(NP.fft.fftshift(NP.fft.fftfreq(grid_shape[1], du)), NP.fft.fftshift(NP.fft.fftfreq(grid_shape[0], dv)))
-
-                    # Shift to be centered
-                    padded_syn_beam_in_uv = NP.fft.ifftshift(padded_syn_beam_in_uv, axes=(0,1))
-                    padded_grid_Vf = NP.fft.ifftshift(padded_grid_Vf, axes=(0,1))
-
-                    # Compute the synthesized beam. It is at a finer resolution due to padding
-                    syn_beam = NP.fft.fft2(padded_syn_beam_in_uv, axes=(0,1))
-                    dirty_image = NP.fft.fft2(padded_grid_Vf, axes=(0,1))
-        
-                    # Select only the real part, equivalent to adding conjugate baselines
-                    dirty_image = dirty_image.real
-                    syn_beam = syn_beam.real
-
-                    self.beam[cpol] = NP.fft.fftshift(syn_beam/sum_wts, axes=(0,1))
-                    self.img[cpol] = NP.fft.fftshift(dirty_image/sum_wts, axes=(0,1))
-                    qty_vuf = NP.fft.ifft2(syn_beam/sum_wts, axes=(0,1)) # Inverse FT
-                    qty_vuf = NP.fft.ifftshift(qty_vuf, axes=(0,1)) # Shift array to be centered
-                    # self.wts_vuf[cpol] = qty_vuf[self.gridv.shape[0]/2:3*self.gridv.shape[0]/2,self.gridu.shape[1]/2:3*self.gridu.shape[1]/2,:]
-                    self.wts_vuf[cpol] = qty_vuf[qty_vuf.shape[0]/2-self.gridv.shape[0]/2:qty_vuf.shape[0]/2+self.gridv.shape[0]/2, qty_vuf.shape[1]/2-self.gridu.shape[1]/2:qty_vuf.shape[1]/2+self.gridu.shape[1]/2,:]
-                    qty_vuf = NP.fft.ifft2(dirty_image/sum_wts, axes=(0,1)) # Inverse FT
-                    qty_vuf = NP.fft.ifftshift(qty_vuf, axes=(0,1)) # Shift array to be centered
-                    # self.vis_vuf[cpol] = qty_vuf[self.gridv.shape[0]/2:3*self.gridv.shape[0]/2,self.gridu.shape[1]/2:3*self.gridu.shape[1]/2,:]
-                    self.vis_vuf[cpol] = qty_vuf[qty_vuf.shape[0]/2-self.gridv.shape[0]/2:qty_vuf.shape[0]/2+self.gridv.shape[0]/2, qty_vuf.shape[1]/2-self.gridu.shape[1]/2:qty_vuf.shape[1]/2+self.gridu.shape[1]/2,:]
-
-        nan_ind = NP.where(self.gridl**2 + self.gridm**2 > 1.0)
-        # nan_ind_unraveled = NP.unravel_index(nan_ind, self.gridl.shape)
-        # self.beam[cpol][nan_ind_unraveled,:] = NP.nan
-        # self.img[cpol][nan_ind_unraveled,:] = NP.nan    
+        if not lazy_uv:
+            self.evalUVGrids(pol=pol)
 
         if verbose:
             print 'Successfully imaged.'
 
-        # Call stack() if required
+        # Call stack() or accumulateOnTheFly() if required
         if stack:
-            self.stack(pol=pol)
+            if self.accumulate_on_the_fly is not None:
+                self.accumulateOnTheFly(pol=pol)
+            else:
+                self.stack(pol=pol)
 
     ############################################################################
-        
-    def stack(self, pol=None):
+
+    def evalUVGrids(self, pol=None):
 
         """
         ------------------------------------------------------------------------
-        Stacks current images and UV-grid information onto a stack
+        Evaluates the uv-plane quantities wts_vuf and vis_vuf of the current 
+        timestamp by inverse transforming the beam and image respectively if 
+        they were deferred by imagr() (see its input lazy_uv)
 
         Inputs:
 
-        pol     [string] indicates which polarization information to be saved. 
-                Allowed values are 'P1', 'P2' in case of MOFF or 'P11', 'P12', 
-                'P21', 'P22' in case of FX or None (default). If None, 
-                information on all polarizations appropriate for MOFF or FX 
-                are stacked
+        pol     [string or list] indicates which polarization information to 
+                be evaluated. Allowed values are 'P1', 'P2' in case of MOFF or 
+                'P11', 'P12', 'P21', 'P22' in case of FX or None (default). If 
+                None, all deferred polarizations are evaluated
         ------------------------------------------------------------------------
         """
 
-        if self.timestamp not in self.timestamps:
-            if pol is None:
-                if self.measured_type == 'E-field':
-                    pol = ['P1', 'P2']
-                else:
-                    pol = ['P11', 'P12', 'P21', 'P22']
-            elif isinstance(pol, str):
-                pol = [pol]
-            elif isinstance(pol, list):
-                p = [item for item in pol if item in ['P1', 'P2', 'P11', 'P12', 'P21', 'P22']]
-                pol = p
-            else:
-                raise TypeError('Input pol must be a string or list specifying polarization(s)')
-    
-            for p in pol:
-                if self.img_stack[p] is None:
-                    self.img_stack[p] = self.img[p][NP.newaxis,:,:,:]
-                    self.beam_stack[p] = self.beam[p][NP.newaxis,:,:,:]
-                    self.grid_illumination_stack[p] = self.wts_vuf[p][NP.newaxis,:,:,:]
-                    self.grid_vis_stack[p] = self.vis_vuf[p][NP.newaxis,:,:,:]
-                else:
-                    self.img_stack[p] = NP.concatenate((self.img_stack[p], self.img[p][NP.newaxis,:,:,:]), axis=0)
-                    self.beam_stack[p] = NP.concatenate((self.beam_stack[p], self.beam[p][NP.newaxis,:,:,:]), axis=0)
-                    self.grid_illumination_stack[p] = NP.concatenate((self.grid_illumination_stack[p], self.wts_vuf[p][NP.newaxis,:,:,:]), axis=0)
-                    self.grid_vis_stack[p] = NP.concatenate((self.grid_vis_stack[p], self.vis_vuf[p][NP.newaxis,:,:,:]), axis=0)
-    
-                if self.measured_type == 'E-field':
-                    if self.holimg_stack[p] is None:
-                        self.holimg_stack[p] = self.holimg[p][NP.newaxis,:,:,:]
-                        self.holbeam_stack[p] = self.holbeam[p][NP.newaxis,:,:,:]
-                    else:
-                        self.holimg_stack[p] = NP.concatenate((self.holimg_stack[p], self.holimg[p][NP.newaxis,:,:,:]), axis=0)
-                        self.holbeam_stack[p] = NP.concatenate((self.holbeam_stack[p], self.holbeam[p][NP.newaxis,:,:,:]), axis=0)
+        if pol is None:
+            pol = self.uvgrid_pending.keys()
+        elif isinstance(pol, str):
+            pol = [pol]
 
-            self.timestamps += [self.timestamp]
+        if self.measured_type == 'E-field':
+            halfsize = (self.gridv.shape[0], self.gridu.shape[1])
+        else:
+            halfsize = (self.gridv.shape[0]/2, self.gridu.shape[1]/2)
+
+        for p in pol:
+            if self.uvgrid_pending.get(p, False):
+                self.wts_vuf[p] = image_to_uvgrid(self.beam[p], halfsize, axes=(0,1), backend=self.fftbackend)
+                self.vis_vuf[p] = image_to_uvgrid(self.img[p], halfsize, axes=(0,1), backend=self.fftbackend)
+                self.uvgrid_pending[p] = False
 
     ############################################################################
 
-    def accumulate(self, tbinsize=None, verbose=True):
+    def evalFullPolImages(self):
 
         """
         ------------------------------------------------------------------------
-        Accumulates and averages gridded quantities that are statistically
-        stationary such as images and visibilities
+        Forms the cross-power images and beams of the current timestamp under
+        polarizations 'P11', 'P12', 'P21' and 'P22' from the holographic 
+        images and beams of polarizations 'P1' and 'P2' obtained by imagr() 
+        in case of MOFF imaging. No additional FFTs are required. 'P11' and 
+        'P22' are identical to the power images and beams of 'P1' and 'P2'
+        respectively while 'P12' and 'P21' (complex conjugate of 'P12') are 
+        complex. The uv-plane quantities are deferred and obtained as in 
+        evalUVGrids()
+        ------------------------------------------------------------------------
+        """
 
-        Input:
+        if self.measured_type != 'E-field':
+            raise ValueError('Full polarization images from holographic images are applicable only to MOFF imaging')
 
-        tbinsize [scalar or dictionary] Contains bin size of timestamps while
-                 averaging. Default = None means gridded quantities over all
-                 timestamps are averaged. If scalar, the same (positive) value 
-                 applies to all polarizations. If dictionary, timestamp bin size
-                 (positive) is provided under each key 'P11', 'P12', 'P21', 
-                 'P22'. If any of the keys is missing the gridded quantities 
-                 for that polarization are averaged over all timestamps.
+        for apol in ['P1', 'P2']:
+            if self.holimg.get(apol) is None:
+                raise ValueError('Holographic image for polarization {0} not found. Run imagr() first.'.format(apol))
 
-        verbose  [boolean] If True (default), prints diagnostic and progress
-                 messages. If False, suppress printing such messages.
+        self.img['P11'] = self.img['P1']
+        self.beam['P11'] = self.beam['P1']
+        self.img['P22'] = self.img['P2']
+        self.beam['P22'] = self.beam['P2']
+        self.img['P12'] = self.holimg['P1'] * self.holimg['P2'].conj()
+        self.beam['P12'] = self.holbeam['P1'] * self.holbeam['P2'].conj()
+        self.img['P21'] = self.img['P12'].conj()
+        self.beam['P21'] = self.beam['P12'].conj()
+
+        for cpol in ['P11', 'P12', 'P21', 'P22']:
+            for qty in [self.img_stack, self.beam_stack, self.grid_illumination_stack, self.grid_vis_stack, self.img_avg, self.beam_avg, self.grid_vis_avg, self.grid_illumination_avg, self.twts]:
+                qty.setdefault(cpol, None)
+            self.wts_vuf[cpol] = None
+            self.vis_vuf[cpol] = None
+            self.uvgrid_pending[cpol] = True
+
+    ############################################################################
+
+    def evalHolographicPixels(self, lm, pol=None, cal_loop=False,
+                              gridphase=True):
+
+        """
+        ------------------------------------------------------------------------
+        Computes the holographic image of the current timestamp at the 
+        specified pixel locations by a direct Fourier transform of the 
+        electric fields of the antennas. For each channel it is the product of
+        the n_pix x n_ant phase matrix with the electric fields of the 
+        antennas, which avoids gridding and FFT over the whole image plane 
+        when only a few pixels are needed (for instance the calibrator pixels
+        in the calibration loop). The phase matrix is cached in attribute 
+        pixel_dft_cache and reused while the pixel locations, antenna 
+        positions and frequencies are unchanged. Applicable only in case of
+        MOFF imaging
+
+        The result corresponds to the holographic image holimg of imagr() 
+        at the same pixels. The voltage pattern of the antenna apertures (as
+        obtained from the imaging FFT of the gridded kernel, see 
+        aperture_voltage_pattern()) is applied per group of equivalent 
+        apertures and the result is normalized by the sum of the weights of
+        the latest call of imagr() (attribute holimg_norm) which hence must 
+        have run with natural weighting. It differs from holimg only by the
+        sub-pixel offsets of the antennas from the grid points and by 
+        changes of the flags since that call
+
+        Inputs:
+
+        lm        [numpy array] direction cosines (l,m) of the pixels. It must 
+                  be of size n_pix x 2 (or 2 for a single pixel)
+
+        pol       [string or list] polarization(s) to be imaged. Allowed 
+                  values are 'P1', 'P2' or None (default). If None, both 
+                  polarizations are imaged
+
+        cal_loop  [boolean] If True, the calibration loop is assumed to be ON
+                  and the calibrated electric fields in attribute caldata of 
+                  the antenna array are used (if available). If False 
+                  (default), the current electric fields of the antennas are
+                  used
+
+        gridphase [boolean] If True (default), the phase due to the origin of
+                  the uv-grid not lying at its center is applied so that the
+                  result has the same phase as the holographic image holimg 
+                  of imagr(). If False, the phase is referenced to the center
+                  of the antenna array
+
+        Output:
+
+        Dictionary with the polarizations as keys each holding a complex numpy 
+        array of size n_pix x nchan containing the holographic image at the
+        specified pixels
         ------------------------------------------------------------------------
         """
-        
-        if self.measured_type == 'E-field':
+
+        if self.measured_type != 'E-field':
+            raise ValueError('Holographic images at pixel locations are applicable only to MOFF imaging')
+
+        lm = NP.asarray(lm, dtype=NP.float64)
+        if lm.ndim == 1:
+            lm = lm.reshape(1,-1)
+        if (lm.ndim != 2) or (lm.shape[1] != 2):
+            raise ValueError('Input lm must be of size n_pix x 2')
+
+        if pol is None:
             pol = ['P1', 'P2']
-        else:
-            pol = ['P11', 'P12', 'P21', 'P22']
+        elif isinstance(pol, str):
+            pol = [pol]
 
-        timestamps = NP.asarray(self.timestamps).astype(NP.float)
-        twts = {}
-        img_acc = {}
-        beam_acc = {}
-        grid_vis_acc = {}
-        grid_illumination_acc = {}
-        for p in pol:
-            img_acc[p] = None
-            beam_acc[p] = None
-            grid_vis_acc[p] = None
-            grid_illumination_acc[p] = None
-            twts[p] = []
+        ant_dict = self.antenna_array.antenna_positions(pol=None, flag=None, sort=True, centering=True)
+        ant_labels = ant_dict['labels']
+        ant_xy = ant_dict['positions'][:,:2]
 
-        if tbinsize is None:   # Average across all timestamps
-            for p in pol:
-                if self.img_stack[p] is not None:
-                    img_acc[p] = NP.nansum(self.img_stack[p], axis=0, keepdims=True)
-                    beam_acc[p] = NP.nansum(self.beam_stack[p], axis=0, keepdims=True)
-                    grid_vis_acc[p] = NP.nansum(self.grid_vis_stack[p], axis=0, keepdims=True)
-                    grid_illumination_acc[p] = NP.nansum(self.grid_illumination_stack[p], axis=0, keepdims=True)
-                twts[p] = NP.asarray(len(self.timestamps)).reshape(-1,1,1,1)
-            self.tbinsize = tbinsize
-        elif isinstance(tbinsize, (int, float)): # Apply same time bin size to all polarizations 
-            eps = 1e-10
-            tbins = NP.arange(timestamps.min(), timestamps.max(), tbinsize)
-            tbins = NP.append(tbins, timestamps.max()+eps)
-            for p in pol:
-                counts, tbin_edges, tbinnum, ri = OPS.binned_statistic(timestamps, statistic='count', bins=tbins)
-                for binnum in range(counts.size):
-                    ind = ri[ri[binnum]:ri[binnum+1]]
-                    twts[p] += [counts]
-                    if img_acc[p] is None:
-                        if self.img_stack[p] is not None:
-                            img_acc[p] = NP.nansum(self.img_stack[p][ind,:,:,:], axis=0, keepdims=True)
-                            beam_acc[p] = NP.nansum(self.beam_stack[p][ind,:,:,:], axis=0, keepdims=True)
-                            grid_vis_acc[p] = NP.nansum(self.grid_vis_stack[p][ind,:,:,:], axis=0, keepdims=True)
-                            grid_illumination_acc[p] = NP.nansum(self.grid_illumination_stack[p][ind,:,:,:], axis=0, keepdims=True)
-                    else:
-                        if self.img_stack[p] is not None:
-                            img_acc[p] = NP.vstack((img_acc[p], NP.nansum(self.img_stack[p][ind,:,:,:], axis=0, keepdims=True)))
-                            beam_acc[p] = NP.vstack((beam_acc[p], NP.nansum(self.beam_stack[p][ind,:,:,:], axis=0, keepdims=True)))
-                            grid_vis_acc[p] = NP.vstack((grid_vis_acc[p], NP.nansum(self.grid_vis_stack[p][ind,:,:,:], axis=0, keepdims=True)))
-                            grid_illumination_acc[p] = NP.vstack((grid_illumination_acc[p], NP.nansum(self.grid_illumination_stack[p][ind,:,:,:], axis=0, keepdims=True)))
-                twts[p] = NP.asarray(twts[p]).astype(NP.float).reshape(-1,1,1,1)
-            self.tbinsize = tbinsize
-        elif isinstance(tbinsize, dict): # Apply different time binsizes to corresponding polarizations
-            tbsize = {}
-            for p in pol:
-                if p not in tbinsize:
-                    if self.img_stack[p] is not None:
-                        img_acc[p] = NP.nansum(self.img_stack[p], axis=0, keepdims=True)
-                        beam_acc[p] = NP.nansum(self.beam_stack[p], axis=0, keepdims=True)
-                        grid_vis_acc[p] = NP.nansum(self.grid_vis_stack[p], axis=0, keepdims=True)
-                        grid_illumination_acc[p] = NP.nansum(self.grid_illumination_stack[p], axis=0, keepdims=True)
-                    twts[p] = NP.asarray(len(self.timestamps)).reshape(-1,1,1,1)
-                    tbsize[p] = None
-                elif isinstance(tbinsize[p], (int,float)):
-                    eps = 1e-10
-                    tbins = NP.arange(timestamps.min(), timestamps.max(), tbinsize[p])
-                    tbins = NP.append(tbins, timestamps.max()+eps)
-                    
-                    counts, tbin_edges, tbinnum, ri = OPS.binned_statistic(timestamps, statistic='count', bins=tbins)
-                    for binnum in range(counts.size):
-                        ind = ri[ri[binnum]:ri[binnum+1]]
-                        twts[p] += [counts]
-                        if img_acc[p] is None:
-                            if self.img_stack[p] is not None:
-                                img_acc[p] = NP.nansum(self.img_stack[p][ind,:,:,:], axis=0, keepdims=True)
-                                beam_acc[p] = NP.nansum(self.beam_stack[p][ind,:,:,:], axis=0, keepdims=True)
-                                grid_vis_acc[p] = NP.nansum(self.grid_vis_stack[p][ind,:,:,:], axis=0, keepdims=True)
-                                grid_illumination_acc[p] = NP.nansum(self.grid_illumination_stack[p][ind,:,:,:], axis=0, keepdims=True)
-                        else:
-                            if self.img_stack[p] is not None:
-                                img_acc[p] = NP.vstack((img_acc[p], NP.nansum(self.img_stack[p][ind,:,:,:], axis=0, keepdims=True)))
-                                beam_acc[p] = NP.vstack((beam_acc[p], NP.nansum(self.beam_stack[p][ind,:,:,:], axis=0, keepdims=True)))
-                                grid_vis_acc[p] = NP.vstack((grid_vis_acc[p], NP.nansum(self.grid_vis_stack[p][ind,:,:,:], axis=0, keepdims=True)))
-                                grid_illumination_acc[p] = NP.vstack((grid_illumination_acc[p], NP.nansum(self.grid_illumination_stack[p][ind,:,:,:], axis=0, keepdims=True)))
-                    twts[p] = NP.asarray(twts[p]).astype(NP.float).reshape(-1,1,1,1)
-                    tbsize[p] = tbinsize[p]
-                else:
-                    if self.img_stack[p] is not None:
-                        img_acc[p] = NP.nansum(self.img_stack[p], axis=0, keepdims=True)
-                        beam_acc[p] = NP.nansum(self.beam_stack[p], axis=0, keepdims=True)
-                        grid_vis_acc[p] = NP.nansum(self.grid_vis_stack[p], axis=0, keepdims=True)
-                        grid_illumination_acc[p] = NP.nansum(self.grid_illumination_stack[p], axis=0, keepdims=True)
-                    twts[p] = NP.asarray(len(self.timestamps)).reshape(-1,1,1,1)
-                    tbsize[p] = None
+        apertures = [self.antenna_array.antennas[label].aperture for label in ant_labels]
+        du = self.gridu[0,1] - self.gridu[0,0]
+        dv = self.gridv[1,0] - self.gridv[0,0]
 
-            self.tbinsize = tbsize
+        keyhash = hashlib.sha1()
+        keyhash.update(repr((ant_labels, bool(gridphase), self.dtype.str)))
+        for arr in [lm, ant_xy, self.f, self.gridu[0,:2], self.gridv[:2,0]]:
+            keyhash.update(NP.ascontiguousarray(arr, dtype=NP.float64))
+        for aprtr in apertures:
+            keyhash.update(repr(aprtr.signature()))
+        key = keyhash.hexdigest()
+
+        if self.pixel_dft_cache.get('key') != key:
+            phase = NP.exp(-1j * 2 * NP.pi * NP.dot(lm, ant_xy.T)[:,:,NP.newaxis] * (self.f/FCNST.c).reshape(1,1,-1))  # n_pix x n_ant x nchan
+            if gridphase:
+                phase *= NP.exp(1j * 2 * NP.pi * (self.gridu[0,0]*lm[:,0] + self.gridv[0,0]*lm[:,1])).reshape(-1,1,1)
+            self.pixel_dft_cache = {'key': key, 'phase': phase.astype(self.dtype), 'vpattern': {}}
+        phase = self.pixel_dft_cache['phase']
 
-        # Compute the averaged grid quantities from the accumulated versions
-        for p in pol:
-            if img_acc[p] is not None:
-                self.img_avg[p] = img_acc[p] / twts[p]
-                self.beam_avg[p] = beam_acc[p] / twts[p]
-                self.grid_vis_avg[p] = grid_vis_acc[p] / twts[p]
-                self.grid_illumination_avg[p] = grid_illumination_acc[p] / twts[p]
+        outdict = {}
+        for apol in pol:
+            if apol not in ['P1', 'P2']:
+                raise ValueError('Invalid specification for input parameter pol')
+            if apol not in self.holimg_norm:
+                raise ValueError('Normalization of the holographic image of polarization {0} not found. imagr() must have run at least once'.format(apol))
+            if self.holimg_norm[apol]['weighting'] != 'natural':
+                raise ValueError('Holographic images at pixel locations are applicable only if imagr() used natural weighting')
 
-        self.twts = twts
+            if cal_loop and (self.antenna_array.caldata.get(apol) is not None):
+                efinfo = self.antenna_array.caldata[apol]
+            else:
+                efinfo = self.antenna_array.get_E_fields(apol, flag=None, tselect=-1, fselect=None, aselect=None, datapool='current', sort=True)
+            if list(efinfo['labels']) != list(ant_labels):
+                raise ValueError('Antenna labels of electric fields and positions do not match')
+
+            Ef = NP.asarray(efinfo['E-fields'])[-1].astype(self.dtype)  # n_ant x nchan
+            wts = (NP.asarray(efinfo['twts'])[-1] > 0.0) & NP.logical_not(NP.isnan(Ef))  # n_ant x nchan
+            Ef[NP.logical_not(wts)] = 0.0
+
+            if apol not in self.pixel_dft_cache['vpattern']:
+                groups = {}
+                for ai, aprtr in enumerate(apertures):
+                    groups.setdefault(aprtr.signature(pol=apol), []).append(ai)
+                self.pixel_dft_cache['vpattern'][apol] = [(NP.asarray(ants), aperture_voltage_pattern(apertures[ants[0]], lm, du, dv, FCNST.c/self.f, apol).astype(self.dtype)) for ants in groups.itervalues()]
+
+            outdict[apol] = NP.zeros((lm.shape[0], self.f.size), dtype=self.dtype)
+            for ants, vpattern in self.pixel_dft_cache['vpattern'][apol]:
+                outdict[apol] += vpattern * NP.einsum('pac,ac->pc', phase[:,ants,:], Ef[ants,:])
+            outdict[apol] /= self.holimg_norm[apol]['sum_wts'].reshape(1,-1)
+
+        return outdict
 
     ############################################################################
 
-    def evalAutoCorr(self, lkpinfo=None, forceeval=False):
+    def occupiedGridBounds(self, pol):
 
         """
         ------------------------------------------------------------------------
-        Evaluate auto-correlation of single antenna weights with itself on the
-        UV-plane. 
+        Returns the bounding box of the grid cells occupied by the antenna or
+        interferometer array for the specified polarization. It is obtained 
+        from the grid mapping information of the antenna or interferometer 
+        array if available and from the grid weights of the current 
+        timestamp otherwise
 
         Inputs:
 
-        lkpinfo   [dictionary] consists of weights information for each of 
-                  the polarizations under polarization keys. Each of 
-                  the values under the keys is a string containing the full
-                  path to a filename that contains the positions and 
-                  weights for the aperture illumination in the form of 
-                  a lookup table as columns (x-loc [float], y-loc 
-                  [float], wts[real], wts[imag if any]). In this case, the 
-                  lookup is for auto-corrlation of antenna weights. It only 
-                  applies when the antenna aperture class is set to 
-                  lookup-based kernel estimation instead of a functional form
+        pol     [string] polarization. Allowed values are 'P1', 'P2' in case of
+                MOFF or 'P11', 'P12', 'P21', 'P22' in case of FX
 
-        forceeval [boolean] When set to False (default) the auto-correlation in
-                  the UV plane is not evaluated if it was already evaluated 
-                  earlier. If set to True, it will be forcibly evaluated 
-                  independent of whether they were already evaluated or not
+        Output:
+
+        Tuple ((vmin, vmax), (umin, umax)) of index ranges along the v- and 
+        u-axes of the grid (lower bound inclusive, upper bound exclusive) 
+        outside which the grid is empty. The ranges are empty if there are no
+        occupied grid cells
         ------------------------------------------------------------------------
         """
 
-        if forceeval or (not self.autocorr_set):
-            if self.measured_type == 'E-field':
-    
-                pol = ['P1', 'P2']
+        all2grid = {}
+        if self.measured_type == 'E-field':
+            if pol in self.antenna_array.grid_mapper:
+                all2grid = self.antenna_array.grid_mapper[pol]['all_ant2grid']
+        else:
+            if pol in self.interferometer_array.grid_mapper:
+                all2grid = self.interferometer_array.grid_mapper[pol]['all_bl2grid']
+
+        if ('v_gridind' in all2grid) and ('u_gridind' in all2grid):
+            v_gridind = all2grid['v_gridind']
+            u_gridind = all2grid['u_gridind']
+        else:
+            v_gridind, u_gridind = NP.nonzero(NP.any(self.grid_illumination[pol] != 0.0, axis=2))
+
+        if v_gridind.size == 0:
+            return ((0, 0), (0, 0))
+        return ((v_gridind.min(), v_gridind.max()+1), (u_gridind.min(), u_gridind.max()+1))
+
+    ############################################################################
+
+    def setCompactStorage(self, compact=True, radius=1.0, lbox=None,
+                          mbox=None):
+
+        """
+        ------------------------------------------------------------------------
+        Sets up (or removes) the compact storage of stacked, averaged and 
+        saved images and beams which keeps only the pixels inside a circle 
+        and/or box in the image plane in a layout of npix x nchan (with a 
+        preceding time axis for stacks and averages) instead of the full 
+        padded image plane. Must be set before images are stacked.
+
+        Inputs:
+
+        compact   [boolean] If True (default), the compact storage is set up.
+                  If False, the full image plane is stored
+
+        radius    [scalar] Pixels with l^2 + m^2 <= radius^2 are kept. 
+                  Default=1.0 keeps the pixels above the horizon. If set to 
+                  None, no radius based selection is applied
+
+        lbox      [list or tuple] If not None, only pixels with lbox[0] <= l
+                  <= lbox[1] are kept. Default=None
+
+        mbox      [list or tuple] If not None, only pixels with mbox[0] <= m
+                  <= mbox[1] are kept. Default=None
+        ------------------------------------------------------------------------
+        """
+
+        for p in self.img_stack:
+            if self.img_stack[p] is not None:
+                raise ValueError('Storage layout cannot be changed while images are stacked')
+
+        if not compact:
+            self.compact_pixels = None
+            return
+
+        if radius is not None:
+            if not isinstance(radius, (int, float)):
+                raise TypeError('Input radius must be a scalar')
+            if radius <= 0.0:
+                raise ValueError('Input radius must be positive')
+        for box in [lbox, mbox]:
+            if box is not None:
+                if not isinstance(box, (list, tuple)):
+                    raise TypeError('Inputs lbox and mbox must be a list or tuple')
+                if len(box) != 2:
+                    raise ValueError('Inputs lbox and mbox must contain two elements')
+        if (radius is None) and (lbox is None) and (mbox is None):
+            raise ValueError('At least one of inputs radius, lbox and mbox must be specified')
+
+        self.compact_pixels = {'radius': radius, 'lbox': lbox, 'mbox': mbox, 'ind': None, 'shape': None}
+        if isinstance(self.gridl, NP.ndarray):
+            self.evalCompactPixels()
+
+    ############################################################################
+
+    def evalCompactPixels(self):
+
+        """
+        ------------------------------------------------------------------------
+        Determines the indices (in the raveled image plane of attributes gridl
+        and gridm) of the pixels kept in the compact storage set up by 
+        setCompactStorage(). They are not changed if the image plane is 
+        unchanged. The image plane must not change while images are stacked
+        ------------------------------------------------------------------------
+        """
+
+        if self.compact_pixels is None:
+            return
+
+        if self.compact_pixels['shape'] == self.gridl.shape:
+            return
+
+        if self.compact_pixels['shape'] is not None:
+            for p in self.img_stack:
+                if self.img_stack[p] is not None:
+                    raise ValueError('Image plane changed while images are stacked in compact layout')
+
+        select = NP.ones(self.gridl.shape, dtype=NP.bool)
+        if self.compact_pixels['radius'] is not None:
+            select &= self.gridl**2 + self.gridm**2 <= self.compact_pixels['radius']**2
+        if self.compact_pixels['lbox'] is not None:
+            select &= (self.gridl >= self.compact_pixels['lbox'][0]) & (self.gridl <= self.compact_pixels['lbox'][1])
+        if self.compact_pixels['mbox'] is not None:
+            select &= (self.gridm >= self.compact_pixels['mbox'][0]) & (self.gridm <= self.compact_pixels['mbox'][1])
+        self.compact_pixels['ind'] = NP.flatnonzero(select)
+        self.compact_pixels['shape'] = self.gridl.shape
+
+    ############################################################################
+
+    def compactImage(self, qty):
+
+        """
+        ------------------------------------------------------------------------
+        Returns the image plane quantity in the compact layout set up by 
+        setCompactStorage() or the quantity itself if no compact storage is
+        set up.
+
+        Inputs:
+
+        qty       [numpy array] image plane quantity of shape 
+                  (...) x nm x nl x nchan
+
+        Output:
+
+        Numpy array of shape (...) x npix x nchan of the selected pixels
+        ------------------------------------------------------------------------
+        """
+
+        if (self.compact_pixels is None) or (self.compact_pixels['ind'] is None):
+            return qty
+        return qty.reshape(qty.shape[:-3]+(-1,qty.shape[-1]))[...,self.compact_pixels['ind'],:]
+
+    ############################################################################
+
+    def expandCompactImage(self, qty, fill_value=NP.nan):
+
+        """
+        ------------------------------------------------------------------------
+        Returns the image plane quantity in the compact layout (see 
+        setCompactStorage()) expanded to the full image plane or the quantity
+        itself if no compact storage is set up.
+
+        Inputs:
+
+        qty        [numpy array] image plane quantity of shape 
+                   (...) x npix x nchan in compact layout
+
+        fill_value [scalar] Value of the pixels not kept in the compact 
+                   layout. Default=NP.nan
+
+        Output:
+
+        Numpy array of shape (...) x nm x nl x nchan 
+        ------------------------------------------------------------------------
+        """
+
+        if (self.compact_pixels is None) or (self.compact_pixels['ind'] is None):
+            return qty
+        nm, nl = self.compact_pixels['shape']
+        out = NP.empty(qty.shape[:-2]+(nm*nl,qty.shape[-1]), dtype=qty.dtype)
+        out.fill(fill_value)
+        out[...,self.compact_pixels['ind'],:] = qty
+        return out.reshape(qty.shape[:-2]+(nm,nl,qty.shape[-1]))
+
+    ############################################################################
+
+    def evalImagingWeights(self, pol, weighting='natural'):
+
+        """
+        ------------------------------------------------------------------------
+        Computes the imaging weights on the grid and their sum from the grid 
+        illumination of the specified polarization
+
+        Inputs:
+
+        pol       [string] polarization. Allowed values are 'P1', 'P2' in case
+                  of MOFF or 'P11', 'P12', 'P21', 'P22' in case of FX
+
+        weighting [string] indicates weighting scheme. Default='natural'. 
+                  Accepted values are 'natural' and 'uniform'
+
+        Output:
+
+        Tuple (grid_wts, sum_wts) where grid_wts is the weights array of 
+        shape nv x nu x nchan and sum_wts is the sum of the weighted 
+        illumination magnitudes over the grid of shape 1 x 1 x nchan
+        ------------------------------------------------------------------------
+        """
+
+        return imaging_weights(self.grid_illumination[pol], weighting=weighting)
+
+    ############################################################################
+
+    def getCachedImagingWeights(self, pol, params):
+
+        """
+        ------------------------------------------------------------------------
+        Returns the cached imaging weights, their sum and the synthesized 
+        beams of the specified polarization from attribute wts_cache if the 
+        grid illumination state of the antenna or interferometer array and 
+        the imaging parameters are unchanged since they were cached
+
+        Inputs:
+
+        pol       [string] polarization. Allowed values are 'P1', 'P2' in case
+                  of MOFF or 'P11', 'P12', 'P21', 'P22' in case of FX
+
+        params    [tuple] imaging parameters the cached quantities depend on
+
+        Output:
+
+        Dictionary in attribute wts_cache under pol if the cached quantities 
+        are valid, None otherwise
+        ------------------------------------------------------------------------
+        """
+
+        if self.measured_type == 'E-field':
+            state = self.antenna_array.grid_illumination_state.get(pol)
+        else:
+            state = self.interferometer_array.grid_illumination_state.get(pol)
+        cached = self.wts_cache.get(pol)
+        if (state is None) or (cached is None):
+            return None
+        if (cached['mapper'] is not state['mapper']) or (cached['params'] != params):
+            return None
+        if not NP.array_equal(cached['wts'], state['wts']):
+            return None
+        return cached
+
+    ############################################################################
+
+    def updateImagingWeightsCache(self, pol, params, sum_wts):
+
+        """
+        ------------------------------------------------------------------------
+        Caches the current imaging weights, their sum and the synthesized 
+        beams of the specified polarization in attribute wts_cache along with
+        the grid illumination state of the antenna or interferometer array 
+        and the imaging parameters
+
+        Inputs:
+
+        pol       [string] polarization. Allowed values are 'P1', 'P2' in case
+                  of MOFF or 'P11', 'P12', 'P21', 'P22' in case of FX
+
+        params    [tuple] imaging parameters the cached quantities depend on
+
+        sum_wts   [numpy array] sum of the weighted illumination magnitudes 
+                  over the grid
+        ------------------------------------------------------------------------
+        """
+
+        if self.measured_type == 'E-field':
+            state = self.antenna_array.grid_illumination_state.get(pol)
+        else:
+            state = self.interferometer_array.grid_illumination_state.get(pol)
+        if state is None:
+            self.wts_cache.pop(pol, None)
+            return
+        self.wts_cache[pol] = {'mapper': state['mapper'], 'wts': NP.copy(state['wts']), 'params': params, 'grid_wts': self.grid_wts[pol], 'sum_wts': sum_wts, 'beam': self.beam[pol], 'holbeam': self.holbeam.get(pol)}
+
+    ############################################################################
+        
+    def setStackBuffers(self, capacity=None, window=None, stack_dir=None):
+
+        """
+        ------------------------------------------------------------------------
+        Sets the preallocated capacity or the sliding window of the stacks of
+        images, beams and uv-plane quantities filled by stack(). The stacks 
+        remain numpy arrays in the same attributes but are views into 
+        preallocated buffers which are not copied on every timestamp
+
+        Inputs:
+
+        capacity [integer] Number of timestamps for which the stack buffers 
+                 are preallocated (for instance the expected number of 
+                 timestamps in the run). The buffers double in size if more 
+                 timestamps are stacked. If set to None (default), the 
+                 buffers start small and double in size when full
+
+        window   [integer] If not None, only the latest window timestamps are
+                 kept in the stacks and in attribute timestamps, which is 
+                 suited for sliding window averages over a long run. The 
+                 memory is bounded by twice the window. If set to None 
+                 (default), all timestamps are kept
+
+        stack_dir
+                 [string] If not None, the stack buffers are stored in files 
+                 in this directory (which must exist and should not be shared
+                 with other objects, see class DiskStack) so that the stacked
+                 quantities are written to disk as they are appended rather 
+                 than held in memory, and accumulate() reads the stacks in 
+                 chunks of timestamps. If set to None (default), the stacks are held in
+                 memory. Takes effect for each stack with the next timestamp 
+                 stacked
+
+        The stacks are views into the buffers which are modified in place by
+        stack() and hence must be copied if they are to be kept unchanged
+        ------------------------------------------------------------------------
+        """
+
+        if capacity is not None:
+            if not isinstance(capacity, int):
+                raise TypeError('Input capacity must be an integer')
+            if capacity <= 0:
+                raise ValueError('Input capacity must be positive')
+
+        if window is not None:
+            if not isinstance(window, int):
+                raise TypeError('Input window must be an integer')
+            if window <= 0:
+                raise ValueError('Input window must be positive')
+
+        if stack_dir is not None:
+            if not isinstance(stack_dir, str):
+                raise TypeError('Input stack_dir must be a string')
+            if not os.path.isdir(stack_dir):
+                raise ValueError('Directory {0} specified in input stack_dir not found'.format(stack_dir))
+
+        self.stack_capacity = capacity
+        self.stack_window = window
+        self.stack_dir = stack_dir
+
+    ############################################################################
+
+    def appendToStack(self, qtyname, pol, qty):
+
+        """
+        ------------------------------------------------------------------------
+        Appends a quantity of the current timestamp to its stack which is a 
+        view into a preallocated buffer held in attribute stack_buffers (see 
+        member function setStackBuffers())
+
+        Inputs:
+
+        qtyname  [string] Name of the stack. Accepted values are 'img', 
+                 'beam', 'holimg', 'holbeam', 'grid_illumination' and 
+                 'grid_vis' denoting attributes img_stack, beam_stack, etc.
+
+        pol      [string] polarization of the stack
+
+        qty      [numpy array] Quantity of the current timestamp to be 
+                 appended
+        ------------------------------------------------------------------------
+        """
+
+        if qtyname not in ['img', 'beam', 'holimg', 'holbeam', 'grid_illumination', 'grid_vis']:
+            raise ValueError('Invalid specification for input qtyname')
+
+        stacks = getattr(self, qtyname+'_stack')
+        stackbuf = self.stack_buffers.setdefault((qtyname, pol), {})
+        filename = stack_file(self.stack_dir, 'image', qtyname, pol)
+        stacks[pol] = append_to_stack(stacks.get(pol), qty, stackbuf, capacity=self.stack_capacity, window=self.stack_window, filename=filename)
+
+    ############################################################################
+
+    def removeStackFiles(self):
+
+        """
+        ------------------------------------------------------------------------
+        Discards all stacks and stacked timestamps and removes the files of 
+        the stacks stored on disk (see discard_stacks())
+        ------------------------------------------------------------------------
+        """
+
+        discard_stacks(self)
+
+    ############################################################################
+
+    def setAccumulateOnTheFly(self, tbinsize=None, on=True):
+
+        """
+        ------------------------------------------------------------------------
+        Sets up (or turns off) the accumulation on the fly in which imagr() 
+        adds the images, beams and uv-plane quantities of each timestamp to 
+        running sums per time bin instead of stacking them. The memory used 
+        then does not grow with the number of timestamps. accumulate() 
+        obtains the averages from the running sums, which are identical to 
+        those obtained from the stacks
+
+        Inputs:
+
+        tbinsize [scalar or dictionary] Time bin size as in accumulate(). 
+                 Default = None means all timestamps are averaged. Time bins 
+                 start at the first accumulated timestamp and hence the 
+                 timestamps must be increasing if binned
+
+        on       [boolean] If True (default), the accumulation on the fly is
+                 set up afresh discarding running sums if any. If False, it 
+                 is turned off and the running sums are discarded
+        ------------------------------------------------------------------------
+        """
+
+        if tbinsize is not None:
+            if isinstance(tbinsize, (int, float)):
+                if tbinsize <= 0.0:
+                    raise ValueError('Input tbinsize must be positive')
+            elif not isinstance(tbinsize, dict):
+                raise TypeError('Input tbinsize must be a scalar or dictionary')
+
+        if not isinstance(on, bool):
+            raise TypeError('Input on must be a boolean')
+
+        if on:
+            self.accumulate_on_the_fly = {'tbinsize': tbinsize, 't0': None, 'tmax': None, 'acc': {}}
+        else:
+            self.accumulate_on_the_fly = None
+
+    ############################################################################
+
+    def accumulateOnTheFly(self, pol=None):
+
+        """
+        ------------------------------------------------------------------------
+        Adds the current images, beams and uv-plane quantities to the running
+        sums of their time bin set up by setAccumulateOnTheFly(). NaN values 
+        are excluded from the sums as in accumulate(). Called by imagr() in 
+        place of stack()
+
+        Inputs:
+
+        pol     [string] indicates which polarization information to be 
+                accumulated. Allowed values are as in stack(). Default=None 
+                means all polarizations appropriate for MOFF or FX
+        ------------------------------------------------------------------------
+        """
+
+        if self.accumulate_on_the_fly is None:
+            raise ValueError('Accumulation on the fly has not been set up. Run setAccumulateOnTheFly() first.')
+
+        if self.timestamp in self.timestamps:
+            return
+
+        if pol is None:
+            if self.measured_type == 'E-field':
+                pol = ['P1', 'P2'] + [p for p in ['P11', 'P12', 'P21', 'P22'] if self.img.get(p) is not None]
+            else:
+                pol = ['P11', 'P12', 'P21', 'P22']
+        elif isinstance(pol, str):
+            pol = [pol]
+        elif isinstance(pol, list):
+            pol = [item for item in pol if item in ['P1', 'P2', 'P11', 'P12', 'P21', 'P22']]
+        else:
+            raise TypeError('Input pol must be a string or list specifying polarization(s)')
+
+        otf = self.accumulate_on_the_fly
+        t = float(self.timestamp)
+        if otf['t0'] is None:
+            otf['t0'] = t
+        otf['tmax'] = t if otf['tmax'] is None else max(otf['tmax'], t)
+
+        for p in pol:
+            tbsize = otf['tbinsize']
+            if isinstance(tbsize, dict):
+                tbsize = tbsize.get(p)
+            if not isinstance(tbsize, (int, float)):
+                binnum = 0
+            else:
+                if t < otf['t0']:
+                    raise ValueError('Timestamps must be increasing for accumulation on the fly in time bins')
+                # Bin edges are obtained as in NP.arange() in accumulate()
+                binnum = int(NP.floor((t - otf['t0']) / tbsize))
+                while otf['t0'] + (binnum+1) * tbsize <= t:
+                    binnum += 1
+                while (binnum > 0) and (otf['t0'] + binnum * tbsize > t):
+                    binnum -= 1
+
+            acc = otf['acc'].setdefault(p, {'counts': [], 'uvcounts': [], 'img': [], 'beam': [], 'grid_vis': [], 'grid_illumination': []})
+            qtys = {'img': self.compactImage(self.img[p]), 'beam': self.compactImage(self.beam[p])}
+            if not self.uvgrid_pending.get(p, False):
+                qtys['grid_vis'] = self.vis_vuf[p]
+                qtys['grid_illumination'] = self.wts_vuf[p]
+            for qtyname, qty in qtys.iteritems():
+                qty = NP.array(qty, copy=True)
+                qty[NP.isnan(qty)] = 0.0
+                while len(acc[qtyname]) <= binnum:
+                    acc[qtyname] += [NP.zeros_like(qty)]
+                acc[qtyname][binnum] += qty
+            while len(acc['counts']) <= binnum:
+                acc['counts'] += [0]
+                acc['uvcounts'] += [0]
+            acc['counts'][binnum] += 1
+            if 'grid_vis' in qtys:
+                acc['uvcounts'][binnum] += 1
+
+        self.timestamps += [self.timestamp]
+
+    ############################################################################
+
+    def stack(self, pol=None):
+
+        """
+        ------------------------------------------------------------------------
+        Stacks current images and UV-grid information onto a stack
+
+        Inputs:
+
+        pol     [string] indicates which polarization information to be saved. 
+                Allowed values are 'P1', 'P2' in case of MOFF or 'P11', 'P12', 
+                'P21', 'P22' in case of FX or None (default). If None, 
+                information on all polarizations appropriate for MOFF or FX 
+                are stacked. In case of MOFF, this includes 'P11', 'P12', 
+                'P21', 'P22' if formed by evalFullPolImages()
+
+        Images and beams are stacked in the compact layout if set up by 
+        setCompactStorage()
+        ------------------------------------------------------------------------
+        """
+
+        if self.timestamp not in self.timestamps:
+            if pol is None:
+                if self.measured_type == 'E-field':
+                    pol = ['P1', 'P2'] + [p for p in ['P11', 'P12', 'P21', 'P22'] if self.img.get(p) is not None]
+                else:
+                    pol = ['P11', 'P12', 'P21', 'P22']
+            elif isinstance(pol, str):
+                pol = [pol]
+            elif isinstance(pol, list):
+                p = [item for item in pol if item in ['P1', 'P2', 'P11', 'P12', 'P21', 'P22']]
+                pol = p
+            else:
+                raise TypeError('Input pol must be a string or list specifying polarization(s)')
+    
+            for p in pol:
+                self.appendToStack('img', p, self.compactImage(self.img[p]))
+                self.appendToStack('beam', p, self.compactImage(self.beam[p]))
+
+                # Deferred uv-plane quantities are not stacked. They are 
+                # derived from the averaged beam and image in accumulate()
+                if not self.uvgrid_pending.get(p, False):
+                    self.appendToStack('grid_illumination', p, self.wts_vuf[p])
+                    self.appendToStack('grid_vis', p, self.vis_vuf[p])
+    
+                if (self.measured_type == 'E-field') and (p in ['P1', 'P2']):
+                    self.appendToStack('holimg', p, self.compactImage(self.holimg[p]))
+                    self.appendToStack('holbeam', p, self.compactImage(self.holbeam[p]))
+
+            self.timestamps += [self.timestamp]
+            if self.stack_window is not None:
+                self.timestamps = self.timestamps[-self.stack_window:]
+
+    ############################################################################
+
+    def accumulate(self, tbinsize=None, verbose=True):
+
+        """
+        ------------------------------------------------------------------------
+        Accumulates and averages gridded quantities that are statistically
+        stationary such as images and visibilities
+
+        Input:
+
+        tbinsize [scalar or dictionary] Contains bin size of timestamps while
+                 averaging. Default = None means gridded quantities over all
+                 timestamps are averaged. If scalar, the same (positive) value 
+                 applies to all polarizations. If dictionary, timestamp bin size
+                 (positive) is provided under each key 'P11', 'P12', 'P21', 
+                 'P22'. If any of the keys is missing the gridded quantities 
+                 for that polarization are averaged over all timestamps.
+
+        verbose  [boolean] If True (default), prints diagnostic and progress
+                 messages. If False, suppress printing such messages.
+
+        The averaged images and beams are in the same (full or compact, see 
+        setCompactStorage()) layout as the stacks. If the accumulation on the
+        fly is set up (see setAccumulateOnTheFly()), the averages are 
+        obtained from the running sums with its time bin size and input 
+        tbinsize must be None or the same
+        ------------------------------------------------------------------------
+        """
+        
+        if self.accumulate_on_the_fly is not None:
+            if (tbinsize is not None) and (tbinsize != self.accumulate_on_the_fly['tbinsize']):
+                raise ValueError('Input tbinsize differs from the time bin size set up for accumulation on the fly')
+            pol = sorted(self.accumulate_on_the_fly['acc'].keys())
+        elif self.measured_type == 'E-field':
+            pol = ['P1', 'P2'] + [p for p in ['P11', 'P12', 'P21', 'P22'] if self.img_stack.get(p) is not None]
+        else:
+            pol = ['P11', 'P12', 'P21', 'P22']
+
+        timestamps = NP.asarray(self.timestamps).astype(NP.float)
+        twts = {}
+        img_acc = {}
+        beam_acc = {}
+        grid_vis_acc = {}
+        grid_illumination_acc = {}
+        uv_stacked = {}
+        for p in pol:
+            img_acc[p] = None
+            beam_acc[p] = None
+            grid_vis_acc[p] = None
+            grid_illumination_acc[p] = None
+            twts[p] = []
+            # uv-plane quantities deferred by imagr() are not in the stack
+            uv_stacked[p] = (self.img_stack.get(p) is not None) and (self.grid_vis_stack.get(p) is not None) and (self.grid_vis_stack[p].shape[0] == self.img_stack[p].shape[0])
+
+        if self.accumulate_on_the_fly is not None: # Running sums per time bin
+            otf = self.accumulate_on_the_fly
+            tbsize = {}
+            for p in pol:
+                acc = otf['acc'][p]
+                tbsize[p] = otf['tbinsize']
+                if isinstance(tbsize[p], dict):
+                    tbsize[p] = tbsize[p].get(p)
+                if not isinstance(tbsize[p], (int, float)):
+                    tbsize[p] = None
+                sums = {}
+                for qtyname in ['img', 'beam', 'grid_vis', 'grid_illumination']:
+                    sums[qtyname] = list(acc[qtyname])
+                counts = list(acc['counts'])
+                uvcounts = list(acc['uvcounts'])
+                if tbsize[p] is not None:
+                    # The latest timestamp falls in the preceding bin if it 
+                    # lies on a bin edge since the last bin edge is placed 
+                    # just beyond it. The running sums are left unchanged
+                    nbins = max(NP.arange(otf['t0'], otf['tmax'], tbsize[p]).size, 1)
+                    while len(counts) > nbins:
+                        for qtyname in sums:
+                            if len(sums[qtyname]) == len(counts):
+                                lastsum = sums[qtyname].pop()
+                                sums[qtyname][-1] = sums[qtyname][-1] + lastsum
+                        lastcount = counts.pop()
+                        counts[-1] += lastcount
+                        lastcount = uvcounts.pop()
+                        uvcounts[-1] += lastcount
+                img_acc[p] = NP.asarray(sums['img'])
+                beam_acc[p] = NP.asarray(sums['beam'])
+                uv_stacked[p] = (len(sums['grid_vis']) == len(counts)) and (uvcounts == counts)
+                if uv_stacked[p]:
+                    grid_vis_acc[p] = NP.asarray(sums['grid_vis'])
+                    grid_illumination_acc[p] = NP.asarray(sums['grid_illumination'])
+                if tbsize[p] is None:
+                    twts[p] = NP.asarray(len(self.timestamps)).reshape(-1,1,1,1)
+                else:
+                    twts[p] = NP.asarray(counts).astype(NP.float).reshape(-1,1,1,1)
+            if isinstance(otf['tbinsize'], dict):
+                self.tbinsize = tbsize
+            else:
+                self.tbinsize = otf['tbinsize']
+        else: # All time bins are summed at once over the stacks
+            if (tbinsize is not None) and (not isinstance(tbinsize, (int, float, dict))):
+                raise TypeError('Input tbinsize must be a scalar or dictionary')
+            tbsize = {}
+            for p in pol:
+                if isinstance(tbinsize, dict):
+                    tbsize[p] = tbinsize.get(p)
+                    if not isinstance(tbsize[p], (int, float)):
+                        tbsize[p] = None
+                else:
+                    tbsize[p] = tbinsize
+                bininfo = time_bins(timestamps, tbinsize=tbsize[p])
+                if self.img_stack[p] is not None:
+                    img_acc[p] = binned_sum(self.img_stack[p], bininfo)
+                    beam_acc[p] = binned_sum(self.beam_stack[p], bininfo)
+                    if uv_stacked[p]:
+                        grid_vis_acc[p] = binned_sum(self.grid_vis_stack[p], bininfo)
+                        grid_illumination_acc[p] = binned_sum(self.grid_illumination_stack[p], bininfo)
+                twts[p] = bininfo['counts'].astype(NP.float).reshape(-1,1,1,1)
+
+            if isinstance(tbinsize, dict):
+                self.tbinsize = tbsize
+            else:
+                self.tbinsize = tbinsize
+
+        # Compute the averaged grid quantities from the accumulated versions
+        if self.measured_type == 'E-field':
+            halfsize = (self.gridv.shape[0], self.gridu.shape[1])
+        else:
+            halfsize = (self.gridv.shape[0]/2, self.gridu.shape[1]/2)
+        for p in pol:
+            # Weights in the working precision to not promote single precision
+            twts[p] = NP.asarray(twts[p]).astype(NP.finfo(self.dtype).dtype)
+            if img_acc[p] is not None:
+                # Images and beams may be in the compact layout with fewer axes
+                img_twts = twts[p].reshape((-1,)+(1,)*(img_acc[p].ndim-1))
+                self.img_avg[p] = img_acc[p] / img_twts
+                self.beam_avg[p] = beam_acc[p] / img_twts
+                if uv_stacked[p]:
+                    self.grid_vis_avg[p] = grid_vis_acc[p] / twts[p]
+                    self.grid_illumination_avg[p] = grid_illumination_acc[p] / twts[p]
+                    self.uvgrid_avg_cropped[p] = False
+                else:
+                    # The inverse transform is linear and hence the averaged
+                    # uv-plane quantities follow from the averaged image and 
+                    # beam. Pixels not kept in the compact layout are zero and
+                    # the uv-plane quantities are then only approximate
+                    self.grid_vis_avg[p] = image_to_uvgrid(self.expandCompactImage(self.img_avg[p], fill_value=0.0), halfsize, axes=(1,2), backend=self.fftbackend)
+                    self.grid_illumination_avg[p] = image_to_uvgrid(self.expandCompactImage(self.beam_avg[p], fill_value=0.0), halfsize, axes=(1,2), backend=self.fftbackend)
+                    self.uvgrid_avg_cropped[p] = self.compact_pixels is not None
+
+        self.twts = twts
+
+    ############################################################################
+
+    def evalAutoCorr(self, lkpinfo=None, forceeval=False):
+
+        """
+        ------------------------------------------------------------------------
+        Evaluate auto-correlation of single antenna weights with itself on the
+        UV-plane. 
+
+        Inputs:
+
+        lkpinfo   [dictionary] consists of weights information for each of 
+                  the polarizations under polarization keys. Each of 
+                  the values under the keys is a string containing the full
+                  path to a filename that contains the positions and 
+                  weights for the aperture illumination in the form of 
+                  a lookup table as columns (x-loc [float], y-loc 
+                  [float], wts[real], wts[imag if any]). In this case, the 
+                  lookup is for auto-corrlation of antenna weights. It only 
+                  applies when the antenna aperture class is set to 
+                  lookup-based kernel estimation instead of a functional form
+
+        forceeval [boolean] When set to False (default) the auto-correlation in
+                  the UV plane is not evaluated if it was already evaluated 
+                  earlier. If set to True, it will be forcibly evaluated 
+                  independent of whether they were already evaluated or not
+        ------------------------------------------------------------------------
+        """
+
+        if forceeval or (not self.autocorr_set):
+            if self.measured_type == 'E-field':
+    
+                pol = ['P1', 'P2']
     
                 # Assume all antenna apertures are identical and make a copy of the
                 # antenna aperture
@@ -7327,11 +9646,13 @@ class NewImage:
             self.pbeam = {p: None for p in pol}                
             for p in pol:
                 sum_wts = NP.sum(self.autocorr_wts_vuf[p], axis=(0,1), keepdims=True)
-                padded_wts_vuf = NP.pad(self.autocorr_wts_vuf[p], (((2**pad-1)*self.gridv.shape[0],(2**pad-1)*self.gridv.shape[0]),((2**pad-1)*self.gridu.shape[1],(2**pad-1)*self.gridu.shape[1]),(0,0)), mode='constant', constant_values=0)
-                padded_wts_vuf = NP.fft.ifftshift(padded_wts_vuf, axes=(0,1))
-                wts_lmf = NP.fft.fft2(padded_wts_vuf, axes=(0,1)) / sum_wts
+                padding = ((2**pad-1)*self.gridv.shape[0], (2**pad-1)*self.gridu.shape[1])
+                # The auto-correlated footprint is stored in single precision
+                # but the power pattern is transformed in double precision so
+                # that it passes the check on its imaginary part
+                wts_lmf = centered_fft2(self.autocorr_wts_vuf[p].astype(NP.complex128), padding, axes=(0,1), backend=self.fftbackend) / sum_wts
                 if NP.abs(wts_lmf.imag).max() < 1e-10:
-                    self.pbeam[p] = NP.fft.fftshift(wts_lmf.real, axes=(0,1))
+                    self.pbeam[p] = wts_lmf.real
                 else:
                     raise ValueError('Significant imaginary component found in the power pattern')
 
@@ -7367,7 +9688,9 @@ class NewImage:
                   auto-correlations from antennas (zero-spacing with a width) 
                   are removed from the averaged data set. If set to 'current',
                   the latest timestamp is used in subtracting the zero-spacing
-                  visibilities information
+                  visibilities information. 'avg' is not possible if the 
+                  averaged uv-plane quantities were obtained from images in 
+                  the compact layout (see attribute uvgrid_avg_cropped)
 
         pad       [integer] indicates the amount of padding before imaging.
                   Applicable only when attribute measured_type is set to 
@@ -7392,10 +9715,17 @@ class NewImage:
                     self.evalAutoCorr(lkpinfo=lkpinfo, forceeval=forceeval)
         
                 autocorr_wts_vuf = copy.deepcopy(self.autocorr_wts_vuf)
+                # The FFT (and the plan with pyFFTW) follows the input type. 
+                # The stored grids and the auto-correlated footprint may be 
+                # in single precision and are transformed at least in the 
+                # imaging precision
+                cdtype = NP.result_type(self.dtype, NP.complex64)
                 pol = ['P1', 'P2']
                 for p in pol:
                     if datapool == 'avg':
                         if self.grid_illumination_avg[p] is not None:
+                            if self.uvgrid_avg_cropped.get(p, False):
+                                raise ValueError('Averaged uv-plane quantities of polarization {0} were obtained from images in the compact layout and lack the zero spacing information required. Use imagr() with lazy_uv=False or the full image plane storage.'.format(p))
                             vis_vuf = NP.copy(self.grid_vis_avg[p])
                             wts_vuf = NP.copy(self.grid_illumination_avg[p])
     
@@ -7403,22 +9733,20 @@ class NewImage:
                             vis_vuf = vis_vuf - (vis_vuf[:,self.gridv.shape[0],self.gridu.shape[1],:].reshape(vis_vuf.shape[0],1,1,self.f.size) / autocorr_wts_vuf[p][0,self.gridv.shape[0],self.gridu.shape[1],:].reshape(1,1,1,self.f.size)) * autocorr_wts_vuf[p]
                             wts_vuf = wts_vuf - (wts_vuf[:,self.gridv.shape[0],self.gridu.shape[1],:].reshape(wts_vuf.shape[0],1,1,self.f.size) / autocorr_wts_vuf[p][0,self.gridv.shape[0],self.gridu.shape[1],:].reshape(1,1,1,self.f.size)) * autocorr_wts_vuf[p]
                             sum_wts = NP.sum(wts_vuf, axis=(1,2), keepdims=True)
-                            padded_wts_vuf = NP.pad(wts_vuf, ((0,0),((2**pad-1)*self.gridv.shape[0],(2**pad-1)*self.gridv.shape[0]),((2**pad-1)*self.gridu.shape[1],(2**pad-1)*self.gridu.shape[1]),(0,0)), mode='constant', constant_values=0)
-                            padded_wts_vuf = NP.fft.ifftshift(padded_wts_vuf, axes=(1,2))
-                            wts_lmf = NP.fft.fft2(padded_wts_vuf, axes=(1,2)) / sum_wts
-                            if NP.abs(wts_lmf.imag).max() > 1e-10:
+                            padding = ((2**pad-1)*self.gridv.shape[0], (2**pad-1)*self.gridu.shape[1])
+                            wts_lmf = centered_fft2(wts_vuf.astype(NP.result_type(wts_vuf.dtype, cdtype), copy=False), padding, axes=(1,2), backend=self.fftbackend) / sum_wts
+                            if NP.abs(wts_lmf.imag).max() > imag_tolerance(wts_lmf):
                                 raise ValueError('Significant imaginary component found in the synthesized beam.')
-                            self.nzsp_beam_avg[p] = NP.fft.fftshift(wts_lmf.real, axes=(1,2))
-                            padded_vis_vuf = NP.pad(vis_vuf, ((0,0),((2**pad-1)*self.gridv.shape[0],(2**pad-1)*self.gridv.shape[0]),((2**pad-1)*self.gridu.shape[1],(2**pad-1)*self.gridu.shape[1]),(0,0)), mode='constant', constant_values=0)
-                            padded_vis_vuf = NP.fft.ifftshift(padded_vis_vuf, axes=(1,2))
-                            vis_lmf = NP.fft.fft2(padded_vis_vuf, axes=(1,2)) / sum_wts
-                            if NP.abs(vis_lmf.imag).max() > 1e-10:
+                            self.nzsp_beam_avg[p] = wts_lmf.real
+                            vis_lmf = centered_fft2(vis_vuf.astype(NP.result_type(vis_vuf.dtype, cdtype), copy=False), padding, axes=(1,2), backend=self.fftbackend) / sum_wts
+                            if NP.abs(vis_lmf.imag).max() > imag_tolerance(vis_lmf):
                                 raise ValueError('Significant imaginary component found in the synthesized dirty image.')
 
-                            self.nzsp_img_avg[p] = NP.fft.fftshift(vis_lmf.real, axes=(1,2))
+                            self.nzsp_img_avg[p] = vis_lmf.real
                             self.nzsp_grid_vis_avg[p] = vis_vuf
                             self.nzsp_grid_illumination_avg[p] = wts_vuf
                     else:
+                        self.evalUVGrids(pol=p)
                         if self.wts_vuf[p] is not None:
                             vis_vuf = NP.copy(self.vis_vuf[p])
                             wts_vuf = NP.copy(self.wts_vuf[p])
@@ -7426,20 +9754,17 @@ class NewImage:
                             vis_vuf = vis_vuf - (vis_vuf[self.gridv.shape[0],self.gridu.shape[1],:].reshape(1,1,self.f.size) / autocorr_wts_vuf[p][self.gridv.shape[0],self.gridu.shape[1],:].reshape(1,1,self.f.size)) * autocorr_wts_vuf[p]
                             wts_vuf = wts_vuf - (wts_vuf[self.gridv.shape[0],self.gridu.shape[1],:].reshape(1,1,self.f.size) / autocorr_wts_vuf[p][self.gridv.shape[0],self.gridu.shape[1],:].reshape(1,1,self.f.size)) * autocorr_wts_vuf[p]
                             sum_wts = NP.sum(wts_vuf, axis=(0,1), keepdims=True)
-                            padded_wts_vuf = NP.pad(wts_vuf, (((2**pad-1)*self.gridv.shape[0],(2**pad-1)*self.gridv.shape[0]),((2**pad-1)*self.gridu.shape[1],(2**pad-1)*self.gridu.shape[1]),(0,0)), mode='constant', constant_values=0)
-                            padded_wts_vuf = NP.fft.ifftshift(padded_wts_vuf, axes=(0,1))
-                            wts_lmf = NP.fft.fft2(padded_wts_vuf, axes=(0,1)) / sum_wts
-                            if NP.abs(wts_lmf.imag).max() > 1e-10:
+                            padding = ((2**pad-1)*self.gridv.shape[0], (2**pad-1)*self.gridu.shape[1])
+                            wts_lmf = centered_fft2(wts_vuf.astype(NP.result_type(wts_vuf.dtype, cdtype), copy=False), padding, axes=(0,1), backend=self.fftbackend) / sum_wts
+                            if NP.abs(wts_lmf.imag).max() > imag_tolerance(wts_lmf):
                                 raise ValueError('Significant imaginary component found in the synthesized beam.')
 
-                            self.nzsp_beam[p] = NP.fft.fftshift(wts_lmf.real, axes=(0,1))
-                            padded_vis_vuf = NP.pad(vis_vuf, (((2**pad-1)*self.gridv.shape[0],(2**pad-1)*self.gridv.shape[0]),((2**pad-1)*self.gridu.shape[1],(2**pad-1)*self.gridu.shape[1]),(0,0)), mode='constant', constant_values=0)
-                            padded_vis_vuf = NP.fft.ifftshift(padded_vis_vuf, axes=(0,1))
-                            vis_lmf = NP.fft.fft2(padded_vis_vuf, axes=(0,1)) / sum_wts
-                            if NP.abs(vis_lmf.imag).max() > 1e-10:
+                            self.nzsp_beam[p] = wts_lmf.real
+                            vis_lmf = centered_fft2(vis_vuf.astype(NP.result_type(vis_vuf.dtype, cdtype), copy=False), padding, axes=(0,1), backend=self.fftbackend) / sum_wts
+                            if NP.abs(vis_lmf.imag).max() > imag_tolerance(vis_lmf):
                                 raise ValueError('Significant imaginary component found in the synthesized dirty image.')
 
-                            self.nzsp_img[p] = NP.fft.fftshift(vis_lmf.real, axes=(0,1))
+                            self.nzsp_img[p] = vis_lmf.real
                             self.nzsp_wts_vuf[p] = wts_vuf
                             self.nzsp_vis_vuf[p] = vis_vuf
 
@@ -7449,7 +9774,8 @@ class NewImage:
             
     ############################################################################
 
-    def save(self, imgfile, pol=None, overwrite=False, verbose=True):
+    def save(self, imgfile, pol=None, overwrite=False, images=None,
+             verbose=True):
 
         """
         ------------------------------------------------------------------------
@@ -7468,6 +9794,16 @@ class NewImage:
                      
         overwrite    [boolean] True indicates overwrite even if a file already 
                      exists. Default = False (does not overwrite)
+
+        images       [boolean] If True, the current and averaged images and 
+                     beams are saved for 'P1', 'P2', 'P11', 'P12', 'P21', 
+                     'P22' (or pol if specified) whichever are available. If 
+                     the compact storage is set up by setCompactStorage(), 
+                     they are saved in the compact layout along with the 
+                     pixel indices (extension 'PIXEL_INDEX'), and in the full
+                     image plane otherwise. If False, they are not saved. If
+                     set to None (default), they are saved only if the 
+                     compact storage is set up
                      
         verbose      [boolean] If True (default), prints diagnostic and progress
                      messages. If False, suppress printing such messages.
@@ -7521,6 +9857,36 @@ class NewImage:
                 if verbose:
                     print "\t\tCreated separate extension HDUs of grid's voltage holograph spectra of \n\t\t\tsize {0[0]}x{0[1]}x{0[2]} for real and imaginary parts.".format(self.holograph_P1.shape)
 
+        compact = (self.compact_pixels is not None) and (self.compact_pixels['ind'] is not None)
+        if images is None:
+            images = compact
+        if images and compact:
+            hdulst += [fits.ImageHDU(self.compact_pixels['ind'], name='PIXEL_INDEX')]
+            hdulst[-1].header['NM'] = (self.compact_pixels['shape'][0], 'Number of pixels along m-axis of image plane')
+            hdulst[-1].header['NL'] = (self.compact_pixels['shape'][1], 'Number of pixels along l-axis of image plane')
+            if verbose:
+                print '\tCreated an extension HDU of {0:0d} indices of pixels in compact layout'.format(self.compact_pixels['ind'].size)
+
+        if not images:
+            savepol = []
+        elif pol is None:
+            savepol = [p for p in ['P1', 'P2', 'P11', 'P12', 'P21', 'P22'] if (self.img.get(p) is not None) or (self.img_avg.get(p) is not None)]
+        else:
+            savepol = [pol]
+        for p in savepol:
+            for qtyname, qty in [('img', self.img.get(p)), ('beam', self.beam.get(p)), ('img_avg', self.img_avg.get(p)), ('beam_avg', self.beam_avg.get(p))]:
+                if qty is None:
+                    continue
+                if compact and (qtyname in ['img', 'beam']):
+                    qty = self.compactImage(qty)
+                if NP.iscomplexobj(qty):
+                    hdulst += [fits.ImageHDU(qty.real, name='{0}_{1}_real'.format(qtyname, p))]
+                    hdulst += [fits.ImageHDU(qty.imag, name='{0}_{1}_imag'.format(qtyname, p))]
+                else:
+                    hdulst += [fits.ImageHDU(qty, name='{0}_{1}'.format(qtyname, p))]
+                if verbose:
+                    print '\t\tCreated extension HDU(s) of {0} of polarization {1} of shape {2}'.format(qtyname, p, qty.shape)
+
         if (pol is None) or (pol == 'P2'):
             if verbose:
                 print '\tWorking on polarization P2...'
@@ -7947,6 +10313,24 @@ class Antenna:
                 time stamps as a numpy array under 2 polarizations which are 
                 stored under keys 'P1' and 'P2'
 
+    stack_buffers
+                [dictionary] holds under keys (quantity, polarization) the 
+                preallocated buffers of which Et_stack, Ef_stack and 
+                flag_stack are views. The buffers double in size when full so
+                that stacking a timestamp does not copy the stacks
+
+    max_timestamps
+                [integer] number of timestamps for which the stack buffers 
+                are preallocated. None (default) means the buffers start 
+                small and double in size when full. Set through update()
+
+    stack_dir   [string] if not None, directory of the files in which the 
+                buffers of Et_stack and Ef_stack are stored (see class 
+                DiskStack) so that the stacks are written to disk rather than
+                held in memory. None (default) means the stacks are held in 
+                memory. Set through update(). The files are removed by 
+                removeStackFiles()
+
     wts:        [dictionary] The gridding weights for antenna. Different 
                 polarizations 'P1' and 'P2' form the keys 
                 of this dictionary. These values are in general complex. Under 
@@ -8007,6 +10391,13 @@ class Antenna:
     update_flags()
                  Updates flags for polarizations provided as input parameters
 
+    stackFile()  Returns the name of the file in which a stack is stored if
+                 stored on disk
+
+    removeStackFiles()
+                 Discards all stacks and removes the files of those stored on
+                 disk
+
     update():    Updates the antenna instance with newer attribute values
                  Updates the electric field spectrum and timeseries. It also
                  applies Fourier transform if timeseries is updated
@@ -8038,7 +10429,7 @@ class Antenna:
         Class attributes initialized are:
         label, latitude, location, pol, t, timestamp, f0, f, wts, wtspos, 
         wtspos_scale, blc, trc, timestamps, antpol, Et_stack, Ef_stack, 
-        flag_stack, aperture
+        flag_stack, stack_buffers, max_timestamps, stack_dir, aperture
      
         Read docstring of class Antenna for details on these attributes.
         ------------------------------------------------------------------------
@@ -8094,6 +10485,9 @@ class Antenna:
         self.Et_stack = {}
         self.Ef_stack = {}
         self.flag_stack = {} 
+        self.stack_buffers = {}
+        self.max_timestamps = None
+        self.stack_dir = None
 
         self.wts = {}
         self.wtspos = {}
@@ -8103,7 +10497,7 @@ class Antenna:
         for pol in ['P1', 'P2']:
             self.Et_stack[pol] = None
             self.Ef_stack[pol] = None
-            self.flag_stack[pol] = NP.asarray([])
+            self.flag_stack[pol] = NP.asarray([], dtype=NP.bool)
 
             self.wtspos[pol] = []
             self.wts[pol] = []
@@ -8120,6 +10514,39 @@ class Antenna:
 
     ############################################################################
 
+    def __getstate__(self):
+
+        # The stacks are views into the buffers in attribute stack_buffers 
+        # which pickling (as when updating in parallel processes) or deep 
+        # copying would turn into standalone copies. Only the stacked rows of
+        # the buffers held in memory are kept and the views are rebuilt from
+        # them by __setstate__()
+
+        state = self.__dict__.copy()
+        state['stack_buffers'] = {}
+        for (qtyname, pol), stackbuf in self.stack_buffers.iteritems():
+            stackbuf = dict(stackbuf)
+            stacks = state.get(qtyname+'_stack')
+            if isinstance(stackbuf.get('buf'), NP.ndarray) and (stacks is not None) and (stackbuf.get('view') is not None) and (stacks[pol] is stackbuf['view']):
+                stackbuf['buf'] = stackbuf['buf'][stackbuf['start']:stackbuf['start']+stackbuf['view'].shape[0]]
+                stackbuf['start'] = 0
+                stackbuf['view'] = None
+                state[qtyname+'_stack'] = dict(stacks)
+                state[qtyname+'_stack'][pol] = None
+            state['stack_buffers'][(qtyname, pol)] = stackbuf
+        return state
+
+    ############################################################################
+
+    def __setstate__(self, state):
+        self.__dict__.update(state)
+        for (qtyname, pol), stackbuf in self.stack_buffers.iteritems():
+            if isinstance(stackbuf.get('buf'), NP.ndarray) and (stackbuf.get('view') is None):
+                stackbuf['view'] = stackbuf['buf'][stackbuf['start']:]
+                getattr(self, qtyname+'_stack')[pol] = stackbuf['view']
+
+    ############################################################################
+
     def channels(self):
 
         """
@@ -8228,13 +10655,40 @@ class Antenna:
         # Stack on to last value or update last value in stack
         for pol in ['P1', 'P2']: 
             if stack is True:
-                self.flag_stack[pol] = NP.append(self.flag_stack[pol], self.antpol.flag[pol])
+                self.flag_stack[pol] = append_to_stack(self.flag_stack[pol], NP.asarray(self.antpol.flag[pol], dtype=NP.bool), self.stack_buffers.setdefault(('flag', pol), {}), capacity=self.max_timestamps)
             else:
                 if self.flag_stack[pol].size == 0:
-                    self.flag_stack[pol] = NP.asarray(self.antpol.flag[pol]).reshape(-1)
+                    self.flag_stack[pol] = NP.asarray(self.antpol.flag[pol], dtype=NP.bool).reshape(-1)
                 else:
                     self.flag_stack[pol][-1] = self.antpol.flag[pol]
-            self.flag_stack[pol] = self.flag_stack[pol].astype(NP.bool)
+
+    ############################################################################
+
+    def stackFile(self, qtyname, pol):
+
+        """
+        ------------------------------------------------------------------------
+        Returns the name of the file of the stack of quantity qtyname ('Et' 
+        or 'Ef') and polarization pol if stored on disk (see stack_file())
+        ------------------------------------------------------------------------
+        """
+
+        return stack_file(self.stack_dir, 'antenna_{0}'.format(self.label), qtyname, pol)
+
+    ############################################################################
+
+    def removeStackFiles(self):
+
+        """
+        ------------------------------------------------------------------------
+        Discards all stacks, stacked timestamps and flags and removes the 
+        files of the stacks stored on disk (see discard_stacks())
+        ------------------------------------------------------------------------
+        """
+
+        discard_stacks(self)
+        for pol in self.flag_stack:
+            self.flag_stack[pol] = NP.asarray([], dtype=NP.bool)
 
     ############################################################################
 
@@ -8336,6 +10790,16 @@ class Antenna:
                        timestamp. If False, updates the last flag and data in 
                        the stack and does not append
 
+            max_timestamps
+                       [integer] number of timestamps for which the stacks 
+                       are preallocated (see attribute max_timestamps). The
+                       stacks grow beyond it if required
+
+            stack_dir  [string] directory (which must exist) of the files in
+                       which the electric field stacks are stored (see 
+                       attribute stack_dir). Takes effect with the next
+                       timestamp stacked
+
             verify     [boolean] If True, verify and update the flags, if 
                        necessary. Electric fields are checked for NaN values and 
                        if found, the flag in the corresponding polarization is 
@@ -8352,6 +10816,8 @@ class Antenna:
         t = None
         flags = None
         stack = False
+        max_timestamps = None
+        stack_dir = None
         verify_flags = True
         Et = None
         wtsinfo = None
@@ -8371,6 +10837,8 @@ class Antenna:
             if 'Et' in update_dict: Et = update_dict['Et']
             if 'flags' in update_dict: flags = update_dict['flags']
             if 'stack' in update_dict: stack = update_dict['stack']
+            if 'max_timestamps' in update_dict: max_timestamps = update_dict['max_timestamps']
+            if 'stack_dir' in update_dict: stack_dir = update_dict['stack_dir']
             if 'verify_flags' in update_dict: verify_flags = update_dict['verify_flags']            
             if 'wtsinfo' in update_dict: wtsinfo = update_dict['wtsinfo']
             if 'gridfunc_freq' in update_dict: gridfunc_freq = update_dict['gridfunc_freq']
@@ -8378,6 +10846,18 @@ class Antenna:
             if 'delaydict' in update_dict: delaydict = update_dict['delaydict']
             if 'aperture' in update_dict: aperture = update_dict['aperture']
 
+        if max_timestamps is not None:
+            if not isinstance(max_timestamps, int):
+                raise TypeError('max_timestamps must be an integer')
+            if max_timestamps <= 0:
+                raise ValueError('max_timestamps must be positive')
+            self.max_timestamps = max_timestamps
+
+        if stack_dir is not None:
+            if not os.path.isdir(stack_dir):
+                raise ValueError('Directory {0} specified in stack_dir not found'.format(stack_dir))
+            self.stack_dir = stack_dir
+
         if label is not None: self.label = label
         if location is not None: self.location = location
         if timestamp is not None:
@@ -8395,16 +10875,12 @@ class Antenna:
         # Stack flags and data
         self.update_flags(flags=None, stack=stack, verify=True)  
         for pol in ['P1', 'P2']:
-            if self.Et_stack[pol] is None:
-                self.Et_stack[pol] = copy.deepcopy(self.antpol.Et[pol].reshape(1,-1))
-                self.Ef_stack[pol] = copy.deepcopy(self.antpol.Ef[pol].reshape(1,-1))
+            if (self.Et_stack[pol] is None) or stack:
+                self.Et_stack[pol] = append_to_stack(self.Et_stack[pol], self.antpol.Et[pol].reshape(-1), self.stack_buffers.setdefault(('Et', pol), {}), capacity=self.max_timestamps, filename=self.stackFile('Et', pol))
+                self.Ef_stack[pol] = append_to_stack(self.Ef_stack[pol], self.antpol.Ef[pol].reshape(-1), self.stack_buffers.setdefault(('Ef', pol), {}), capacity=self.max_timestamps, filename=self.stackFile('Ef', pol))
             else:
-                if stack:
-                    self.Et_stack[pol] = NP.vstack((self.Et_stack[pol], self.antpol.Et[pol].reshape(1,-1)))
-                    self.Ef_stack[pol] = NP.vstack((self.Ef_stack[pol], self.antpol.Ef[pol].reshape(1,-1)))
-                else:
-                    self.Et_stack[pol][-1,:] = copy.deepcopy(self.antpol.Et[pol].reshape(1,-1))
-                    self.Ef_stack[pol][-1,:] = copy.deepcopy(self.antpol.Ef[pol].reshape(1,-1))
+                self.Et_stack[pol][-1,:] = self.antpol.Et[pol].reshape(-1)
+                self.Ef_stack[pol][-1,:] = self.antpol.Ef[pol].reshape(-1)
         
         blc_orig = NP.copy(self.blc)
         trc_orig = NP.copy(self.trc)
@@ -8855,6 +11331,17 @@ class AntennaArray:
                                            all antennas whose indices are given
                                            in key 'antind'. Must be of same size
                                            as the array under key 'antind'
+                            'vuf_gridind_raveled'
+                                           [numpy array] one-dimensional
+                                           indices into the flattened grid of
+                                           shape nv x nu x nchan obtained from
+                                           'v_gridind', 'u_gridind' and
+                                           'f_gridind'. It is determined once
+                                           when the mapping is built and is
+                                           used to accumulate contributions of
+                                           all antennas onto the grid in a
+                                           single pass. Must be of same size as
+                                           the array under key 'antind'
                             'indNN_list'   [list of lists] Each item in the top
                                            level list corresponds to an antenna
                                            in the same order as in the attribute
@@ -8903,6 +11390,38 @@ class AntennaArray:
                 weights will give the 3D cubes of gridded electric fields and 
                 antenna array illumination respectively
 
+    grid_illumination_state
+                [dictionary] contains under each polarization the state that
+                determines the gridded illumination in attribute 
+                grid_illumination, namely a dictionary with keys 'mapper' (the 
+                antenna-to-grid mapping object used) and 'wts' (boolean array 
+                of the antennas, or antennas and channels, contributing to the
+                grid). Set by make_grid_cube_new() and applyMappingMatrix(). 
+                Used by class NewImage to reuse the imaging weights and 
+                synthesized beam while the state is unchanged
+
+    ant2grid_flagged_mapper
+                [dictionary] contains the flag-masked version of the antenna 
+                array to grid mapping information under keys 'P1' and 'P2'. 
+                Under each key is None or a dictionary with the following keys
+                and values:
+                'mapper'       [sparse matrix] copy of ant2grid_mapper in CSC
+                               format in which the columns of flagged 
+                               antennas and channels are set to zero
+                'data'         [numpy array] values of the unmasked mapping 
+                               matrix in the same order as the data in the
+                               sparse matrix under key 'mapper'
+                'flags'        [numpy array] boolean flags of size n_ant x 
+                               nchan of the antennas (in the order of 
+                               attribute ordered_labels) and channels that 
+                               are currently masked
+                'illumination' [numpy array] flattened grid illumination of
+                               size nv x nu x nchan from the unflagged 
+                               antennas, updated incrementally as flags change
+                'ncontrib'     [numpy array] number of unflagged contributions
+                               to each cell of the flattened grid
+                It is updated by member function applyMappingMatrixFlags()
+
     Member Functions:
 
     __init__()        Initializes an instance of class AntennaArray which 
@@ -8941,12 +11460,37 @@ class AntennaArray:
                       fields from the array of antennas onto the grid. It has 
                       elements very common to grid_convolve_new()
 
+    mappingMatrixCacheKey()
+                      Determines the key (hash of antenna layout, grid,
+                      aperture parameters and frequencies) identifying the
+                      antenna-to-grid mapping in the on-disk cache
+
+    saveMappingMatrix()
+                      Saves the sparse antenna-to-grid mapping matrix and the
+                      combined mapping information to a .npz file
+
+    loadMappingMatrix()
+                      Loads the sparse antenna-to-grid mapping matrix and the
+                      combined mapping information from a .npz file
+
     applyMappingMatrix()
                       Constructs the grid of complex field illumination and 
                       electric fields using the sparse antenna-to-grid mapping 
                       matrix. Intended to serve as a "matrix" alternative to 
                       make_grid_cube_new() 
 
+    applyMappingMatrixFlags()
+                      Updates the flag-masked version of the sparse 
+                      antenna-to-grid mapping matrix and the grid illumination
+                      incrementally for antennas and channels whose flags 
+                      have changed
+
+    applyMappingMatrix_on_stack()
+                      Constructs the grids of complex field illumination and
+                      electric fields of a block of timestamps using a single
+                      sparse-dense product with the antenna-to-grid mapping 
+                      matrix per polarization
+
     grid_unconvolve() Routine to de-project the electric field illumination 
                       pattern and the electric fields on the grid. It can 
                       operate on the entire antenna array or incrementally 
@@ -9033,6 +11577,8 @@ class AntennaArray:
         self.ordered_labels = [] # Usually output from member function baseline_vectors() or get_visibilities()
         self.grid_mapper = {}
         self.ant2grid_mapper = {}  # contains the sparse mapping matrix
+        self.ant2grid_flagged_mapper = {}  # contains the flag-masked version of the sparse mapping matrix
+        self.grid_illumination_state = {}
 
         for pol in ['P1', 'P2']:
             self.grid_mapper[pol] = {}
@@ -9059,6 +11605,7 @@ class AntennaArray:
             self.caldata[pol] = None
 
             self.ant2grid_mapper[pol] = None
+            self.ant2grid_flagged_mapper[pol] = None
 
         if antenna_array is not None:
             self += antenna_array
@@ -10328,7 +12875,7 @@ class AntennaArray:
                           distNN=NP.inf, identical_antennas=True,
                           cal_loop=False, gridfunc_freq=None, wts_change=False,
                           parallel=False, nproc=None, pp_method='pool',
-                          verbose=True): 
+                          chunk_channels=None, verbose=True): 
 
         """
         ------------------------------------------------------------------------
@@ -10416,6 +12963,15 @@ class AntennaArray:
                    suited for memory bound processes but can be slower or 
                    inefficient in terms of CPU management.
 
+        chunk_channels
+                   [integer] number of frequency channels for which the grid 
+                   locations scaled by wavelength are constructed and searched 
+                   at a time while determining the antenna-to-grid mapping. 
+                   This bounds the peak memory used by the temporary arrays 
+                   (which otherwise scale as nchan x nv x nu) and the resulting
+                   mapping is the same irrespective of its value. If set to 
+                   None (default), all channels are processed at once.
+
         verbose    [boolean] If True, prints diagnostic and progress messages. 
                    If False (default), suppress printing such messages.
         ------------------------------------------------------------------------
@@ -10462,39 +13018,29 @@ class AntennaArray:
                 if verbose:
                     print 'Gathered antenna data for gridding convolution for timestamp {0}'.format(self.timestamp)
 
-                if wts_change or (not self.grid_mapper[apol]['all_ant2grid']):
-                    self.grid_mapper[apol]['per_ant2grid'] = []
-                    self.grid_mapper[apol]['all_ant2grid'] = {}
-                    gridlocs = NP.hstack((self.gridu.reshape(-1,1), self.gridv.reshape(-1,1)))
-                    if gridfunc_freq == 'scale':
-                        grid_xy = gridlocs[NP.newaxis,:,:] * wavelength.reshape(-1,1,1)   # nchan x nv x nu
-                        wl = NP.ones(gridlocs.shape[0])[NP.newaxis,:] * wavelength.reshape(-1,1)
-                        grid_xy = grid_xy.reshape(-1,2)
-                        wl = wl.reshape(-1)
-                        indNN_list, antind, fvu_gridind = LKP.find_NN(ant_xy, grid_xy, distance_ULIM=2.0*distNN, flatten=True, parallel=False)
-                        dxy = grid_xy[fvu_gridind,:] - ant_xy[antind,:]
-                        fvu_gridind_unraveled = NP.unravel_index(fvu_gridind, (self.f.size,)+self.gridu.shape)   # f-v-u order since temporary grid was created as nchan x nv x nu
+                if wts_change or (not self.grid_mapper[apol]['all_ant2grid']):
+                    self.grid_mapper[apol]['per_ant2grid'] = []
+                    self.grid_mapper[apol]['all_ant2grid'] = {}
+                    if gridfunc_freq == 'scale':
+                        indNN_list, antind, fvu_gridind = chunked_find_NN(ant_xy, self.gridu, self.gridv, wavelength, 2.0*distNN, chunk_channels=chunk_channels)
+                        fvu_gridind_unraveled = NP.unravel_index(fvu_gridind, (self.f.size,)+self.gridu.shape)   # f-v-u order
+                        wl_NN = wavelength[fvu_gridind_unraveled[0]]
+                        grid_xy_NN = NP.hstack((self.gridu[fvu_gridind_unraveled[1],fvu_gridind_unraveled[2]].reshape(-1,1), self.gridv[fvu_gridind_unraveled[1],fvu_gridind_unraveled[2]].reshape(-1,1))) * wl_NN.reshape(-1,1)
+                        dxy = grid_xy_NN - ant_xy[antind,:]
                         self.grid_mapper[apol]['all_ant2grid']['antind'] = NP.copy(antind)
                         self.grid_mapper[apol]['all_ant2grid']['u_gridind'] = NP.copy(fvu_gridind_unraveled[2])
                         self.grid_mapper[apol]['all_ant2grid']['v_gridind'] = NP.copy(fvu_gridind_unraveled[1])                            
                         self.grid_mapper[apol]['all_ant2grid']['f_gridind'] = NP.copy(fvu_gridind_unraveled[0])
+                        self.grid_mapper[apol]['all_ant2grid']['vuf_gridind_raveled'] = NP.ravel_multi_index((fvu_gridind_unraveled[1], fvu_gridind_unraveled[2], fvu_gridind_unraveled[0]), self.gridu.shape+(self.f.size,))
                         self.grid_mapper[apol]['all_ant2grid']['indNN_list'] = copy.deepcopy(indNN_list)
 
                         if identical_antennas:
                             arbitrary_antenna_aperture = self.antennas.itervalues().next().aperture
-                            krn = arbitrary_antenna_aperture.compute(dxy, wavelength=wl[fvu_gridind], pol=apol, rmaxNN=rmaxNN, load_lookup=False)
+                            krn = arbitrary_antenna_aperture.compute(dxy, wavelength=wl_NN, pol=apol, rmaxNN=rmaxNN, load_lookup=False)
                         else:
-                            # This block #1 is one way to go about per antenna
-                            for ai,gi in enumerate(indNN_list):
-                                if len(gi) > 0:
-                                    label = self.ordered_labels[ai]
-                                    ind = NP.asarray(gi)
-                                    diffxy = grid_xy[ind,:].reshape(-1,2) - ant_xy[ai,:].reshape(-1,2)
-                                    krndict = self.antennas[label].aperture.compute(diffxy, wavelength=wl[ind], pol=apol, rmaxNN=rmaxNN, load_lookup=False)
-                                    if krn[apol] is None:
-                                        krn[apol] = NP.copy(krndict[apol])
-                                    else:
-                                        krn[apol] = NP.append(krn[apol], krndict[apol])
+                            # This block #1 evaluates antennas with equivalent apertures together
+                            antbounds = NP.concatenate(([0], NP.cumsum(NP.bincount(antind, minlength=n_ant))))
+                            krn[apol] = grouped_aperture_kernel([self.antennas[label].aperture for label in self.ordered_labels], dxy, wl_NN, antbounds, apol, rmaxNN=rmaxNN)
                                     
                             # # This block #2 is another way equivalent to above block #1
                             # uniq_antind = NP.unique(antind)
@@ -10513,34 +13059,21 @@ class AntennaArray:
                         pass
                         
                     # Determine weights that can normalize sum of kernel per antenna per frequency to unity
-                    per_ant_per_freq_norm_wts = NP.zeros(antind.size, dtype=NP.complex64)
-                    # per_ant_per_freq_norm_wts = NP.ones(antind.size, dtype=NP.complex64)                    
-                    
-                    runsum = 0
-                    for ai,gi in enumerate(indNN_list):
-                        if len(gi) > 0:
-                            fvu_ind = NP.asarray(gi)
-                            unraveled_fvu_ind = NP.unravel_index(fvu_ind, (self.f.size,)+self.gridu.shape)
-                            f_ind = unraveled_fvu_ind[0]
-                            v_ind = unraveled_fvu_ind[1]
-                            u_ind = unraveled_fvu_ind[2]
-                            chanhist, chanbe, chanbn, chanri = OPS.binned_statistic(f_ind, statistic='count', bins=NP.arange(self.f.size+1))
-                            for ci in xrange(self.f.size):
-                                if chanhist[ci] > 0.0:
-                                    select_chan_ind = chanri[chanri[ci]:chanri[ci+1]]
-                                    per_ant_per_freq_kernel_sum = NP.sum(krn[apol][runsum:runsum+len(gi)][select_chan_ind])
-                                    per_ant_per_freq_norm_wts[runsum:runsum+len(gi)][select_chan_ind] = 1.0 / per_ant_per_freq_kernel_sum
+                    # as a single grouped reduction over the combined (antenna, channel) key
+                    antfreq_ind = antind * self.f.size + fvu_gridind_unraveled[0]
+                    per_ant_per_freq_kernel_sum = grid_scatter_add(antfreq_ind, krn[apol], n_ant*self.f.size)
+                    per_ant_per_freq_norm_wts = (1.0 / per_ant_per_freq_kernel_sum[antfreq_ind]).astype(NP.complex64)
 
+                    antbounds = NP.concatenate(([0], NP.cumsum(NP.bincount(antind, minlength=n_ant))))
+                    for ai in xrange(n_ant):
                         per_ant2grid_info = {}
                         per_ant2grid_info['label'] = self.ordered_labels[ai]
-                        per_ant2grid_info['f_gridind'] = NP.copy(f_ind)
-                        per_ant2grid_info['u_gridind'] = NP.copy(u_ind)
-                        per_ant2grid_info['v_gridind'] = NP.copy(v_ind)
-                        # per_ant2grid_info['fvu_gridind'] = NP.copy(gi)
-                        per_ant2grid_info['per_ant_per_freq_norm_wts'] = per_ant_per_freq_norm_wts[runsum:runsum+len(gi)]
-                        per_ant2grid_info['illumination'] = krn[apol][runsum:runsum+len(gi)]
+                        per_ant2grid_info['f_gridind'] = fvu_gridind_unraveled[0][antbounds[ai]:antbounds[ai+1]]
+                        per_ant2grid_info['u_gridind'] = fvu_gridind_unraveled[2][antbounds[ai]:antbounds[ai+1]]
+                        per_ant2grid_info['v_gridind'] = fvu_gridind_unraveled[1][antbounds[ai]:antbounds[ai+1]]
+                        per_ant2grid_info['per_ant_per_freq_norm_wts'] = per_ant_per_freq_norm_wts[antbounds[ai]:antbounds[ai+1]]
+                        per_ant2grid_info['illumination'] = krn[apol][antbounds[ai]:antbounds[ai+1]]
                         self.grid_mapper[apol]['per_ant2grid'] += [copy.deepcopy(per_ant2grid_info)]
-                        runsum += len(gi)
 
                     self.grid_mapper[apol]['all_ant2grid']['per_ant_per_freq_norm_wts'] = NP.copy(per_ant_per_freq_norm_wts)
 
@@ -10558,7 +13091,9 @@ class AntennaArray:
     def genMappingMatrix(self, pol=None, normalize=True, method='NN',
                          distNN=NP.inf, identical_antennas=True,
                          gridfunc_freq=None, wts_change=False, parallel=False,
-                         nproc=None, verbose=True):
+                         nproc=None, stencil=False, stencil_oversampling=None,
+                         chunk_channels=None, dualpol=False, cache_dir=None,
+                         verbose=True):
 
         """
         ------------------------------------------------------------------------
@@ -10619,9 +13154,15 @@ class AntennaArray:
                    be determined.
 
         parallel   [boolean] specifies if parallelization is to be invoked. 
-                   False (default) means only serial processing
-
-        nproc      [integer] specifies number of independent processes to spawn.
+                   False (default) means only serial processing. If True, the 
+                   grid indices, the kernel and its normalization are 
+                   determined by threads over blocks of antennas which also 
+                   convert their contributions to blocks of columns of the 
+                   sparse mapping matrix in CSR format. These are then 
+                   assembled by threads into blocks of rows which are 
+                   stacked into the mapping matrix
+
+        nproc      [integer] specifies number of threads to spawn.
                    Default = None, means automatically determines the number of 
                    process cores in the system and use one less than that to 
                    avoid locking the system for other processes. Applies only 
@@ -10631,13 +13172,70 @@ class AntennaArray:
                    cores in the system minus one to avoid locking the system out 
                    for other processes
 
+        stencil    [boolean] If True, the grid locations near each antenna are
+                   determined by translating a footprint of integer pixel 
+                   offsets (determined once around the origin) to the pixel 
+                   containing the antenna, instead of a nearest neighbour 
+                   search over all frequency channels and grid locations. 
+                   The grid locations are identical to those of the search.
+                   The kernel is evaluated exactly at the grid locations 
+                   unless stencil_oversampling is set. Applies only if 
+                   identical_antennas is set to True and requires distNN to 
+                   be finite. Default=False
+
+        stencil_oversampling
+                   [integer] If set and stencil is True, the kernel is 
+                   evaluated only once per channel on the footprint sampled 
+                   stencil_oversampling times finer than the grid and 
+                   interpolated bilinearly at the sub-pixel separations of 
+                   each antenna, instead of at every grid location near every
+                   antenna. The kernel values are then approximate. For 
+                   smooth kernels the error decreases as the square of 
+                   stencil_oversampling (for instance a maximum error of 
+                   about 1e-2 and rms of about 6e-4 relative to the peak for
+                   'auto_convolved_rect' at 8). Discontinuous kernels such as
+                   'rect', 'square' or 'circular' are wrong within a sample 
+                   of the aperture edge irrespective of its value. The cost
+                   of evaluating the kernel scales with its square. If set 
+                   to None (default), the kernel is evaluated exactly
+
+        chunk_channels
+                   [integer] number of frequency channels for which the grid 
+                   locations scaled by wavelength are constructed and searched 
+                   at a time while determining the antenna-to-grid mapping. 
+                   This bounds the peak memory used by the temporary arrays 
+                   (which otherwise scale as nchan x nv x nu) and the resulting
+                   mapping is the same irrespective of its value. If set to 
+                   None (default), all channels are processed at once.
+
+        dualpol    [boolean] If True and both polarizations are to be gridded,
+                   the search for grid locations near the antennas and (if 
+                   identical_antennas is True) the kernel evaluation are done 
+                   once and shared by both polarizations, as the antenna 
+                   locations and the grid are identical for both. If the 
+                   resulting kernels are identical too, both polarizations 
+                   share the same mapping matrix object, which lets member 
+                   functions applyMappingMatrix() and 
+                   applyMappingMatrix_on_stack() grid both polarizations in a
+                   single sparse matrix product. Otherwise (kernels differing
+                   between polarizations, for instance for non-identical or 
+                   polarization dependent apertures) the two mapping 
+                   matrices are distinct and each polarization is gridded 
+                   in its own sparse matrix product. If False (default), the
+                   polarizations are processed independently.
+
+        cache_dir  [string] directory in which the antenna-to-grid mapping is
+                   cached on disk. The mapping depends only on antenna
+                   layout, grid, aperture parameters and frequency channels
+                   and a hash of these (see member function 
+                   mappingMatrixCacheKey()) is used to name the cache file. If
+                   a cache file with matching key is found, the mapping is 
+                   loaded from it instead of being determined afresh, 
+                   otherwise the newly determined mapping is saved to it. If 
+                   set to None (default), no caching is performed.
+
         verbose    [boolean] If True, prints diagnostic and progress messages. 
                    If False (default), suppress printing such messages.
-
-        NOTE: Although certain portions are parallelizable, the overheads in 
-        these processes seem to make it worse than serial processing. It is 
-        advisable to stick to serialized version unless testing with larger
-        data sets clearly indicates otherwise.
         ------------------------------------------------------------------------
         """
 
@@ -10658,9 +13256,12 @@ class AntennaArray:
         krn = {}
         self.ant2grid_mapper = {}
         antpol = ['P1', 'P2']
+        jointpol = [apol for apol in antpol if apol in pol]
+        shared_NN = None
         for apol in antpol:
             krn[apol] = None
             self.ant2grid_mapper[apol] = None
+            self.ant2grid_flagged_mapper[apol] = None
             if apol in pol:
                 ant_dict = self.antenna_positions(pol=apol, flag=None, sort=True, centering=True)
                 self.ordered_labels = ant_dict['labels']
@@ -10671,139 +13272,314 @@ class AntennaArray:
                     print 'Gathered antenna data for gridding convolution for timestamp {0}'.format(self.timestamp)
 
                 if wts_change or (not self.grid_mapper[apol]['all_ant2grid']):
+                    cachefile = None
+                    if cache_dir is not None:
+                        cachekey = self.mappingMatrixCacheKey(apol, distNN=distNN, identical_antennas=identical_antennas, gridfunc_freq=gridfunc_freq, stencil_oversampling=(stencil_oversampling if (stencil and identical_antennas) else None))
+                        cachefile = os.path.join(cache_dir, 'ant2grid_{0}.npz'.format(cachekey))
+                        if os.path.isfile(cachefile):
+                            self.loadMappingMatrix(apol, cachefile)
+                            if verbose:
+                                print 'Loaded antenna-to-grid mapping for polarization {0} from cache file {1}'.format(apol, cachefile)
+                            continue
+
                     self.grid_mapper[apol]['per_ant2grid'] = []
                     self.grid_mapper[apol]['all_ant2grid'] = {}
-                    gridlocs = NP.hstack((self.gridu.reshape(-1,1), self.gridv.reshape(-1,1)))
+                    share_NN = False
+                    stencil_krn = None
                     if gridfunc_freq == 'scale':
-                        grid_xy = gridlocs[NP.newaxis,:,:] * wavelength.reshape(-1,1,1)   # nchan x nv x nu
-                        wl = NP.ones(gridlocs.shape[0])[NP.newaxis,:] * wavelength.reshape(-1,1)
-                        grid_xy = grid_xy.reshape(-1,2)
-                        wl = wl.reshape(-1)
-                        indNN_list, antind, fvu_gridind = LKP.find_NN(ant_xy, grid_xy, distance_ULIM=2.0*distNN, flatten=True, parallel=False)
-                        dxy = grid_xy[fvu_gridind,:] - ant_xy[antind,:]
-                        fvu_gridind_unraveled = NP.unravel_index(fvu_gridind, (self.f.size,)+self.gridu.shape)   # f-v-u order since temporary grid was created as nchan x nv x nu
+                        share_NN = dualpol and (shared_NN is not None) and NP.array_equal(shared_NN['ant_xy'], ant_xy)
+                        if share_NN:
+                            indNN_list = shared_NN['indNN_list']
+                            antind = shared_NN['antind']
+                            fvu_gridind = shared_NN['fvu_gridind']
+                        elif stencil and identical_antennas:
+                            if not NP.isfinite(distNN):
+                                raise ValueError('Input distNN must be finite for stencil based mapping')
+                            indNN_list = None
+                            antind, fvu_gridind, stencil_sep = stencil_find_NN(ant_xy, self.gridu, self.gridv, wavelength, 2.0*distNN, chunk_channels=chunk_channels)
+                            arbitrary_antenna_aperture = self.antennas.itervalues().next().aperture
+                            stencil_krn = stencil_kernel(arbitrary_antenna_aperture, stencil_sep, fvu_gridind // self.gridu.size, du, dv, wavelength, 2.0*distNN, jointpol if dualpol else apol, rmaxNN=rmaxNN, oversampling=stencil_oversampling)
+                        else:
+                            indNN_list, antind, fvu_gridind = chunked_find_NN(ant_xy, self.gridu, self.gridv, wavelength, 2.0*distNN, chunk_channels=chunk_channels)
+                        antbounds = NP.concatenate(([0], NP.cumsum(NP.bincount(antind, minlength=n_ant))))
+                        threaded = parallel or (nproc is not None)
+                        if threaded:
+                            # Grid indices, kernel, its normalization and the
+                            # sparse mapping matrix are all determined by 
+                            # threads over blocks of antennas
+                            if nproc is None:
+                                nproc = max(MP.cpu_count()-1, 1) 
+                            else:
+                                nproc = min(nproc, max(MP.cpu_count()-1, 1))
+                            if share_NN and (apol in shared_NN['krn']):
+                                shared_krn = shared_NN['krn'][apol]
+                                krnfunc = lambda dxy, wl, eltbeg, eltend: {apol: shared_krn[antbounds[eltbeg]:antbounds[eltend]]}
+                            elif stencil_krn is not None:
+                                krnfunc = lambda dxy, wl, eltbeg, eltend: dict([(p, stencil_krn[p][antbounds[eltbeg]:antbounds[eltend]]) for p in stencil_krn])
+                            elif identical_antennas:
+                                arbitrary_antenna_aperture = self.antennas.itervalues().next().aperture
+                                krnfunc = lambda dxy, wl, eltbeg, eltend: arbitrary_antenna_aperture.compute(dxy, wavelength=wl, pol=jointpol if dualpol else apol, rmaxNN=rmaxNN, load_lookup=False)
+                            else:
+                                apertures = [self.antennas[label].aperture for label in self.ordered_labels]
+                                krnfunc = lambda dxy, wl, eltbeg, eltend: {apol: grouped_aperture_kernel(apertures[eltbeg:eltend], dxy, wl, antbounds[eltbeg:eltend+1]-antbounds[eltbeg], apol, rmaxNN=rmaxNN)}
+                            mapping = threaded_mapping_matrix(krnfunc, ant_xy, antind, fvu_gridind, antbounds, self.gridu, self.gridv, wavelength, apol, nproc)
+                            fvu_gridind_unraveled = (mapping['f_gridind'], mapping['v_gridind'], mapping['u_gridind'])
+                            krn.update(mapping['krn'])
+                            vuf_gridind_raveled = mapping['gridind_raveled']
+                        else:
+                            fvu_gridind_unraveled = NP.unravel_index(fvu_gridind, (self.f.size,)+self.gridu.shape)   # f-v-u order
+                            vuf_gridind_raveled = NP.ravel_multi_index((fvu_gridind_unraveled[1], fvu_gridind_unraveled[2], fvu_gridind_unraveled[0]), self.gridu.shape+(self.f.size,))
                         self.grid_mapper[apol]['all_ant2grid']['antind'] = NP.copy(antind)
                         self.grid_mapper[apol]['all_ant2grid']['u_gridind'] = NP.copy(fvu_gridind_unraveled[2])
                         self.grid_mapper[apol]['all_ant2grid']['v_gridind'] = NP.copy(fvu_gridind_unraveled[1])                            
                         self.grid_mapper[apol]['all_ant2grid']['f_gridind'] = NP.copy(fvu_gridind_unraveled[0])
+                        self.grid_mapper[apol]['all_ant2grid']['vuf_gridind_raveled'] = vuf_gridind_raveled
                         # self.grid_mapper[apol]['all_ant2grid']['indNN_list'] = copy.deepcopy(indNN_list)
 
-                        if identical_antennas:
-                            arbitrary_antenna_aperture = self.antennas.itervalues().next().aperture
-                            krn = arbitrary_antenna_aperture.compute(dxy, wavelength=wl[fvu_gridind], pol=apol, rmaxNN=rmaxNN, load_lookup=False)
-                        else:
-                            # This block #1 is one way to go about per antenna
-                            for ai,gi in enumerate(indNN_list):
-                                if len(gi) > 0:
-                                    label = self.ordered_labels[ai]
-                                    ind = NP.asarray(gi)
-                                    diffxy = grid_xy[ind,:].reshape(-1,2) - ant_xy[ai,:].reshape(-1,2)
-                                    krndict = self.antennas[label].aperture.compute(diffxy, wavelength=wl[ind], pol=apol, rmaxNN=rmaxNN, load_lookup=False)
-                                    if krn[apol] is None:
-                                        krn[apol] = NP.copy(krndict[apol])
-                                    else:
-                                        krn[apol] = NP.append(krn[apol], krndict[apol])
+                        if not threaded:
+                            if stencil_krn is None:
+                                wl_NN = wavelength[fvu_gridind_unraveled[0]]
+                                grid_xy_NN = NP.hstack((self.gridu[fvu_gridind_unraveled[1],fvu_gridind_unraveled[2]].reshape(-1,1), self.gridv[fvu_gridind_unraveled[1],fvu_gridind_unraveled[2]].reshape(-1,1))) * wl_NN.reshape(-1,1)
+                                dxy = grid_xy_NN - ant_xy[antind,:]
+                            if identical_antennas:
+                                if share_NN and (apol in shared_NN['krn']):
+                                    krn[apol] = shared_NN['krn'][apol]
+                                elif stencil_krn is not None:
+                                    krn = stencil_krn
+                                else:
+                                    arbitrary_antenna_aperture = self.antennas.itervalues().next().aperture
+                                    krn = arbitrary_antenna_aperture.compute(dxy, wavelength=wl_NN, pol=jointpol if dualpol else apol, rmaxNN=rmaxNN, load_lookup=False)
+                            else:
+                                # This block #1 evaluates antennas with equivalent apertures together
+                                krn[apol] = grouped_aperture_kernel([self.antennas[label].aperture for label in self.ordered_labels], dxy, wl_NN, antbounds, apol, rmaxNN=rmaxNN)
                                     
-                            # # This block #2 is another way equivalent to above block #1
-                            # uniq_antind = NP.unique(antind)
-                            # anthist, antbe, antbn, antri = OPS.binned_statistic(antind, statistic='count', bins=NP.append(uniq_antind, uniq_antind.max()+1))
-                            # for i,uantind in enumerate(uniq_antind):
-                            #     label = self.ordered_labels[uantind]
-                            #     ind = antri[antri[i]:antri[i+1]]
-                            #     krndict = self.antennas[label].aperture.compute(dxy[ind,:], wavelength=wl[ind], pol=apol, rmaxNN=rmaxNN, load_lookup=False)
-                            #     if krn[apol] is None:
-                            #         krn[apol] = NP.copy(krndict[apol])
-                            #     else:
-                            #         krn[apol] = NP.append(krn[apol], krndict[apol])
+                                # # This block #2 is another way equivalent to above block #1
+                                # uniq_antind = NP.unique(antind)
+                                # anthist, antbe, antbn, antri = OPS.binned_statistic(antind, statistic='count', bins=NP.append(uniq_antind, uniq_antind.max()+1))
+                                # for i,uantind in enumerate(uniq_antind):
+                                #     label = self.ordered_labels[uantind]
+                                #     ind = antri[antri[i]:antri[i+1]]
+                                #     krndict = self.antennas[label].aperture.compute(dxy[ind,:], wavelength=wl[ind], pol=apol, rmaxNN=rmaxNN, load_lookup=False)
+                                #     if krn[apol] is None:
+                                #         krn[apol] = NP.copy(krndict[apol])
+                                #     else:
+                                #         krn[apol] = NP.append(krn[apol], krndict[apol])
 
                         self.grid_mapper[apol]['all_ant2grid']['illumination'] = NP.copy(krn[apol])
+
+                        if dualpol and (not share_NN):
+                            shared_NN = {'ant_xy': ant_xy, 'indNN_list': indNN_list, 'antind': antind, 'fvu_gridind': fvu_gridind, 'krn': dict(krn), 'pol': apol}
                     else: # Weights do not scale with frequency (needs serious development)
                         pass
                         
                     # Determine weights that can normalize sum of kernel per antenna per frequency to unity
-                    per_ant_per_freq_norm_wts = NP.zeros(antind.size, dtype=NP.complex64)
-                    # per_ant_per_freq_norm_wts = NP.ones(antind.size, dtype=NP.complex64)                    
-                    
-                    if parallel or (nproc is not None):
-                        list_of_val = []
-                        list_of_rowcol_tuple = []
+                    # as a single grouped reduction over the combined (antenna, channel) key
+                    if threaded:
+                        per_ant_per_freq_norm_wts = mapping['norm_wts']
                     else:
-                        spval = []
-                        sprow = []
-                        spcol = []
-                        
-                    runsum = 0
+                        antfreq_ind = antind * self.f.size + fvu_gridind_unraveled[0]
+                        per_ant_per_freq_kernel_sum = grid_scatter_add(antfreq_ind, krn[apol], n_ant*self.f.size)
+                        per_ant_per_freq_norm_wts = (1.0 / per_ant_per_freq_kernel_sum[antfreq_ind]).astype(NP.complex64)
+
                     if verbose:
                         progress = PGB.ProgressBar(widgets=[PGB.Percentage(), PGB.Bar(marker='-', left=' |', right='| '), PGB.Counter(), '/{0:0d} Antennas '.format(n_ant), PGB.ETA()], maxval=n_ant).start()
-                    for ai,gi in enumerate(indNN_list):
-                        if len(gi) > 0:
-                            fvu_ind = NP.asarray(gi)
-                            unraveled_fvu_ind = NP.unravel_index(fvu_ind, (self.f.size,)+self.gridu.shape)
-                            f_ind = unraveled_fvu_ind[0]
-                            v_ind = unraveled_fvu_ind[1]
-                            u_ind = unraveled_fvu_ind[2]
-                            chanhist, chanbe, chanbn, chanri = OPS.binned_statistic(f_ind, statistic='count', bins=NP.arange(self.f.size+1))
-                            for ci in xrange(self.f.size):
-                                if chanhist[ci] > 0.0:
-                                    select_chan_ind = chanri[chanri[ci]:chanri[ci+1]]
-                                    per_ant_per_freq_kernel_sum = NP.sum(krn[apol][runsum:runsum+len(gi)][select_chan_ind])
-                                    per_ant_per_freq_norm_wts[runsum:runsum+len(gi)][select_chan_ind] = 1.0 / per_ant_per_freq_kernel_sum
-
+                    for ai in xrange(n_ant):
                         per_ant2grid_info = {}
                         per_ant2grid_info['label'] = self.ordered_labels[ai]
-                        per_ant2grid_info['f_gridind'] = NP.copy(f_ind)
-                        per_ant2grid_info['u_gridind'] = NP.copy(u_ind)
-                        per_ant2grid_info['v_gridind'] = NP.copy(v_ind)
-                        # per_ant2grid_info['fvu_gridind'] = NP.copy(gi)
-                        per_ant2grid_info['per_ant_per_freq_norm_wts'] = per_ant_per_freq_norm_wts[runsum:runsum+len(gi)]
-                        per_ant2grid_info['illumination'] = krn[apol][runsum:runsum+len(gi)]
+                        per_ant2grid_info['f_gridind'] = fvu_gridind_unraveled[0][antbounds[ai]:antbounds[ai+1]]
+                        per_ant2grid_info['u_gridind'] = fvu_gridind_unraveled[2][antbounds[ai]:antbounds[ai+1]]
+                        per_ant2grid_info['v_gridind'] = fvu_gridind_unraveled[1][antbounds[ai]:antbounds[ai+1]]
+                        per_ant2grid_info['per_ant_per_freq_norm_wts'] = per_ant_per_freq_norm_wts[antbounds[ai]:antbounds[ai+1]]
+                        per_ant2grid_info['illumination'] = krn[apol][antbounds[ai]:antbounds[ai+1]]
                         self.grid_mapper[apol]['per_ant2grid'] += [copy.deepcopy(per_ant2grid_info)]
-                        runsum += len(gi)
 
-                        # determine the sparse interferometer-to-grid mapping matrix pre-requisites
-                        val = per_ant2grid_info['per_ant_per_freq_norm_wts']*per_ant2grid_info['illumination']
-                        vuf_gridind_unraveled = (per_ant2grid_info['v_gridind'],per_ant2grid_info['u_gridind'],per_ant2grid_info['f_gridind'])
-                        vuf_gridind_raveled = NP.ravel_multi_index(vuf_gridind_unraveled, (self.gridu.shape+(self.f.size,)))
-                        
-                        if (not parallel) and (nproc is None):
-                            spval += val.tolist()
-                            sprow += vuf_gridind_raveled.tolist()
-                            spcol += (per_ant2grid_info['f_gridind'] + ai*self.f.size).tolist()
-                        else:
-                            list_of_val += [per_ant2grid_info['per_ant_per_freq_norm_wts']*per_ant2grid_info['illumination']]
-                            list_of_rowcol_tuple += [(vuf_gridind_raveled, per_ant2grid_info['f_gridind'])]
                         if verbose:
                             progress.update(ai+1)
 
                     if verbose:
                         progress.finish()
 
-                    # determine the sparse interferometer-to-grid mapping matrix
-                    if parallel or (nproc is not None):
-                        list_of_shapes = [(self.gridu.size*self.f.size, self.f.size)] * n_ant
-                        if nproc is None:
-                            nproc = max(MP.cpu_count()-1, 1) 
-                        else:
-                            nproc = min(nproc, max(MP.cpu_count()-1, 1))
-                        pool = MP.Pool(processes=nproc)
-                        list_of_spmat = pool.map(genMatrixMapper_arg_splitter, IT.izip(list_of_val, list_of_rowcol_tuple, list_of_shapes))
-                        self.ant2grid_mapper[apol] = SM.hstack(list_of_spmat, format='csr')
+                    # determine the sparse antenna-to-grid mapping matrix
+                    if share_NN and NP.array_equal(krn[apol], shared_NN['krn'][shared_NN['pol']]):
+                        self.ant2grid_mapper[apol] = self.ant2grid_mapper[shared_NN['pol']]
+                    elif threaded:
+                        self.ant2grid_mapper[apol] = mapping['spmat']
                     else:
-                        spval = NP.asarray(spval)
-                        sprowcol = (NP.asarray(sprow), NP.asarray(spcol))
+                        spval = per_ant_per_freq_norm_wts * krn[apol]
+                        sprowcol = (vuf_gridind_raveled, fvu_gridind_unraveled[0] + antind*self.f.size)
                         self.ant2grid_mapper[apol] = SM.csr_matrix((spval, sprowcol), shape=(self.gridu.size*self.f.size, n_ant*self.f.size))
 
                     self.grid_mapper[apol]['all_ant2grid']['per_ant_per_freq_norm_wts'] = NP.copy(per_ant_per_freq_norm_wts)
 
+                    if cachefile is not None:
+                        self.saveMappingMatrix(apol, cachefile)
+                        if verbose:
+                            print 'Saved antenna-to-grid mapping for polarization {0} to cache file {1}'.format(apol, cachefile)
+
+    ############################################################################
+
+    def mappingMatrixCacheKey(self, pol, distNN=NP.inf, identical_antennas=True,
+                              gridfunc_freq=None, stencil_oversampling=None):
+
+        """
+        ------------------------------------------------------------------------
+        Determines the key identifying the antenna-to-grid mapping in the
+        on-disk cache used by member function genMappingMatrix(). The key is a
+        hash of all the inputs the mapping depends on, namely, the antenna
+        labels and positions, the grid, the frequency channels, the aperture
+        parameters of the antennas and the gridding parameters.
+
+        Inputs:
+
+        pol        [String] The polarization of the mapping. Can be set to 'P1'
+                   or 'P2'. Must be specified.
+
+        distNN     [scalar] Upper bound on distance to the nearest neighbour in
+                   the gridding process. Same as in genMappingMatrix(). 
+                   Default=NP.inf
+
+        identical_antennas
+                   [boolean] indicates if all antenna elements are to be
+                   treated as identical. Same as in genMappingMatrix(). 
+                   Default=True
+
+        gridfunc_freq
+                   [String scalar] Same as in genMappingMatrix(). Default=None
+
+        stencil_oversampling
+                   [integer] Oversampling factor of the kernel footprint if 
+                   the kernel is interpolated (see inputs stencil and 
+                   stencil_oversampling of genMappingMatrix()). Default=None
+                   means the kernel is evaluated exactly
+
+        Output:
+
+        Hexadecimal string which is the hash of the inputs to the mapping
+        ------------------------------------------------------------------------
+        """
+
+        if pol not in ['P1', 'P2']:
+            raise ValueError('Invalid specification for input parameter pol')
+
+        if not self.grid_ready:
+            self.grid()
+
+        ant_dict = self.antenna_positions(pol=pol, flag=None, sort=True, centering=True)
+        ant_labels = ant_dict['labels']
+        ant_xy = ant_dict['positions'][:,:2]
+
+        keyhash = hashlib.sha1()
+        keyhash.update(repr((pol, ant_labels, float(distNN), bool(identical_antennas), gridfunc_freq, self.gridu.shape)))
+        if stencil_oversampling is not None:
+            keyhash.update(repr(('stencil', int(stencil_oversampling))))
+        for arr in [ant_xy, self.gridu, self.gridv, self.f]:
+            keyhash.update(NP.ascontiguousarray(arr, dtype=NP.float64))
+        if identical_antennas:
+            keyhash.update(repr(self.antennas.itervalues().next().aperture.signature(pol=pol)))
+        else:
+            for label in ant_labels:
+                keyhash.update(repr(self.antennas[label].aperture.signature(pol=pol)))
+
+        return keyhash.hexdigest()
+
+    ############################################################################
+
+    def saveMappingMatrix(self, pol, cachefile):
+
+        """
+        ------------------------------------------------------------------------
+        Saves the sparse antenna-to-grid mapping matrix and the combined
+        antenna-to-grid mapping information of the specified polarization to
+        a numpy .npz file
+
+        Inputs:
+
+        pol        [String] The polarization of the mapping. Can be set to 'P1'
+                   or 'P2'. Must be specified.
+
+        cachefile  [string] Full path to the .npz file to save the mapping to.
+                   The file is first written under a temporary name and then
+                   renamed so that concurrent readers never see a partially 
+                   written file
+        ------------------------------------------------------------------------
+        """
+
+        if pol not in ['P1', 'P2']:
+            raise ValueError('Invalid specification for input parameter pol')
+
+        if self.ant2grid_mapper[pol] is None:
+            raise ValueError('Antenna-to-grid mapping matrix not found for polarization {0}'.format(pol))
+
+        cache_dir = os.path.dirname(cachefile)
+        if cache_dir and (not os.path.isdir(cache_dir)):
+            os.makedirs(cache_dir)
+
+        spmat = self.ant2grid_mapper[pol].tocsr()
+        all_ant2grid = self.grid_mapper[pol]['all_ant2grid']
+        tmpfile = '{0}.{1:0d}.tmp.npz'.format(cachefile, os.getpid())
+        NP.savez(tmpfile, labels=NP.asarray(self.ordered_labels), data=spmat.data, indices=spmat.indices, indptr=spmat.indptr, shape=NP.asarray(spmat.shape), antind=all_ant2grid['antind'], u_gridind=all_ant2grid['u_gridind'], v_gridind=all_ant2grid['v_gridind'], f_gridind=all_ant2grid['f_gridind'], vuf_gridind_raveled=all_ant2grid['vuf_gridind_raveled'], illumination=all_ant2grid['illumination'], per_ant_per_freq_norm_wts=all_ant2grid['per_ant_per_freq_norm_wts'])
+        os.rename(tmpfile, cachefile)
+
+    ############################################################################
+
+    def loadMappingMatrix(self, pol, cachefile):
+
+        """
+        ------------------------------------------------------------------------
+        Loads the sparse antenna-to-grid mapping matrix and the combined
+        antenna-to-grid mapping information of the specified polarization from
+        a numpy .npz file written by member function saveMappingMatrix(). The
+        attributes ant2grid_mapper, ordered_labels and keys 'all_ant2grid' and
+        'per_ant2grid' of attribute grid_mapper are updated.
+
+        Inputs:
+
+        pol        [String] The polarization of the mapping. Can be set to 'P1'
+                   or 'P2'. Must be specified.
+
+        cachefile  [string] Full path to the .npz file to load the mapping from
+        ------------------------------------------------------------------------
+        """
+
+        if pol not in ['P1', 'P2']:
+            raise ValueError('Invalid specification for input parameter pol')
+
+        cachedata = NP.load(cachefile)
+        try:
+            self.ordered_labels = cachedata['labels'].tolist()
+            self.ant2grid_mapper[pol] = SM.csr_matrix((cachedata['data'], cachedata['indices'], cachedata['indptr']), shape=tuple(cachedata['shape']))
+            self.ant2grid_flagged_mapper[pol] = None
+            all_ant2grid = {}
+            for key in ['antind', 'u_gridind', 'v_gridind', 'f_gridind', 'vuf_gridind_raveled', 'illumination', 'per_ant_per_freq_norm_wts']:
+                all_ant2grid[key] = cachedata[key]
+        finally:
+            cachedata.close()
+
+        self.grid_mapper[pol]['all_ant2grid'] = all_ant2grid
+        n_ant = len(self.ordered_labels)
+        bounds = NP.concatenate(([0], NP.cumsum(NP.bincount(all_ant2grid['antind'], minlength=n_ant))))
+        self.grid_mapper[pol]['per_ant2grid'] = []
+        for ai,label in enumerate(self.ordered_labels):
+            per_ant2grid_info = {}
+            per_ant2grid_info['label'] = label
+            for key in ['f_gridind', 'u_gridind', 'v_gridind', 'per_ant_per_freq_norm_wts', 'illumination']:
+                per_ant2grid_info[key] = all_ant2grid[key][bounds[ai]:bounds[ai+1]]
+            self.grid_mapper[pol]['per_ant2grid'] += [per_ant2grid_info]
+
     ############################################################################
 
-    def applyMappingMatrix(self, pol=None, cal_loop=False, verbose=True):
+    def applyMappingMatrix(self, pol=None, cal_loop=False, flag_mask=False,
+                           dtype='complex128', verbose=True):
 
         """
         ------------------------------------------------------------------------
         Constructs the grid of complex field illumination and electric fields 
         using the sparse antenna-to-grid mapping matrix. Intended to serve as a 
-        "matrix" alternative to make_grid_cube_new() 
+        "matrix" alternative to make_grid_cube_new(). The grids are stored as
+        dense arrays of shape nv x nu x nchan in attributes grid_illumination
+        and grid_Ef. Both polarizations are gridded in a single sparse matrix
+        product only if they share the same mapping matrix object (see input
+        dualpol of genMappingMatrix()) and in one product each otherwise
 
         Inputs:
 
@@ -10819,6 +13595,21 @@ class AntennaArray:
                 to be the calibrated data to be mapped to the grid 
                 via gridding convolution.
 
+        flag_mask
+                [boolean] If True, the flag-masked mapping matrix in attribute
+                ant2grid_flagged_mapper is updated incrementally for antennas
+                and channels whose flags have changed (see 
+                applyMappingMatrixFlags()) and used for gridding. Channels
+                with NaN electric fields are flagged as in the unmasked 
+                gridding. The grid illumination is then not 
+                recomputed unless the flags change. If False (default), the 
+                unmasked mapping matrix is applied to the flag-weighted 
+                electric fields and weights.
+
+        dtype   [string or numpy dtype] Complex data type of the gridded 
+                illumination and electric fields. Accepted values are 
+                'complex128' (default) and 'complex64' (single precision)
+
         verbose [boolean] If True, prints diagnostic and progress messages. 
                 If False (default), suppress printing such messages.
         ------------------------------------------------------------------------
@@ -10829,6 +13620,8 @@ class AntennaArray:
 
         pol = NP.unique(NP.asarray(pol))
         
+        Ef = {}
+        twts = {}
         for apol in pol:
 
             if verbose:
@@ -10843,34 +13636,283 @@ class AntennaArray:
                 if self.caldata[apol] is None:
                     self.caldata[apol] = self.get_E_fields(apol, flag=None, tselect=-1, fselect=None, aselect=None, datapool='current', sort=True)
 
-            Ef = self.caldata[apol]['E-fields'].astype(NP.complex64)  #  (n_ts=1) x n_ant x nchan
-            Ef = NP.squeeze(Ef, axis=0)  # n_ant x nchan
+            Ef[apol] = self.caldata[apol]['E-fields'].astype(NP.complex64)  #  (n_ts=1) x n_ant x nchan
+            twts[apol] = self.caldata[apol]['twts']  # (n_ts=1) x n_ant x 1
 
-            twts = self.caldata[apol]['twts']  # (n_ts=1) x n_ant x 1
-            twts = NP.squeeze(twts, axis=0)  # n_ant x 1
+        # Polarizations sharing the mapping matrix object are gridded 
+        # together, others in separate products
+        if not flag_mask:
+            gridded = self.applyMappingMatrix_on_stack(pol=pol.tolist(), Ef=Ef, twts=twts, dtype=dtype, verbose=False)
 
-            Ef = Ef * twts    # applies antenna flagging, n_ant x nchan
-            wts = twts * NP.ones(self.f.size).reshape(1,-1)  # n_ant x nchan
+        for apol in pol:
 
-            wts[NP.isnan(Ef)] = 0.0
-            Ef[NP.isnan(Ef)] = 0.0
+            # Store as dense matrices
+            if flag_mask:
+                # Antennas with zero weights and channels with NaN electric 
+                # fields are masked as their weights are zeroed in the 
+                # unmasked gridding
+                unflagged = (NP.asarray(twts[apol]) > 0.0) & NP.logical_not(NP.isnan(Ef[apol]))  # (n_ts=1) x n_ant x nchan
+                self.applyMappingMatrixFlags(pol=apol, flags={apol: NP.logical_not(unflagged).reshape(-1,self.f.size)}, verbose=False)
+                pEf = Ef[apol].ravel()
+                pEf[NP.isnan(pEf)] = 0.0
+                self.grid_illumination[apol] = self.ant2grid_flagged_mapper[apol]['illumination'].astype(dtype).reshape(self.gridu.shape+(self.f.size,))
+                self.grid_Ef[apol] = self.ant2grid_flagged_mapper[apol]['mapper'].dot(pEf).astype(dtype, copy=False).reshape(self.gridu.shape+(self.f.size,))
+                self.grid_illumination_state[apol] = {'mapper': self.ant2grid_flagged_mapper[apol]['mapper'], 'wts': unflagged}
+            else:
+                self.grid_illumination[apol] = gridded[apol]['illumination'][0]
+                self.grid_Ef[apol] = gridded[apol]['Ef'][0]
+                self.grid_illumination_state[apol] = {'mapper': self.ant2grid_mapper[apol], 'wts': (NP.asarray(twts[apol]) > 0.0) & NP.logical_not(NP.isnan(Ef[apol]))}
 
-            Ef = Ef.ravel()
-            wts = wts.ravel()
+            if verbose:
+                print 'Gridded aperture illumination and electric fields for polarization {0} from {1:0d} unflagged contributing antennas'.format(apol, NP.sum(twts[apol]).astype(int))
 
-            sparse_Ef = SM.csr_matrix(Ef)
-            sparse_wts = SM.csr_matrix(wts)
+    ############################################################################
 
-            # Store as sparse matrices
-            self.grid_illumination[apol] = self.ant2grid_mapper[apol].dot(sparse_wts.T)
-            self.grid_Ef[apol] = self.ant2grid_mapper[apol].dot(sparse_Ef.T)
+    def applyMappingMatrixFlags(self, pol=None, flags=None, verbose=True):
+
+        """
+        ------------------------------------------------------------------------
+        Updates the flag-masked version of the sparse antenna-to-grid mapping
+        matrix held in attribute ant2grid_flagged_mapper. Columns of antennas 
+        and channels whose flags have changed since the previous update are 
+        set to zero (if flagged) or restored (if unflagged) and their 
+        contribution is 
+        subtracted from or added to the grid illumination. The cost is 
+        proportional to the number of non-zero elements in the affected 
+        columns and the mapping does not have to be determined again.
+
+        Inputs:
+
+        pol     [String] The polarization to be updated. Can be set to 'P1' or 
+                'P2'. If set to None, all the polarizations are updated. 
+                Default=None
+
+        flags   [dictionary] boolean flags of antennas under polarization keys
+                'P1' and/or 'P2'. Under each key is a numpy array of size n_ant
+                (flags applying to all channels) or of shape n_ant x nchan 
+                (flags per channel) where the antennas are ordered as in 
+                attribute ordered_labels. True denotes a flagged antenna or
+                channel. If set to None (default) or if a polarization key is
+                not found, the current flags of the antennas are used
+
+        verbose [boolean] If True, prints diagnostic and progress messages. 
+                If False (default), suppress printing such messages.
+        ------------------------------------------------------------------------
+        """
+
+        if pol is None:
+            pol = ['P1', 'P2']
+
+        pol = NP.unique(NP.asarray(pol))
+
+        if flags is not None:
+            if not isinstance(flags, dict):
+                raise TypeError('Input parameter flags must be a dictionary')
+
+        nchan = self.f.size
+        for apol in pol:
+
+            if apol not in ['P1', 'P2']:
+                raise ValueError('Invalid specification for input parameter pol')
+
+            if self.ant2grid_mapper[apol] is None:
+                raise ValueError('Antenna-to-grid mapping matrix not found for polarization {0}. Run genMappingMatrix() first.'.format(apol))
+
+            if (flags is not None) and (apol in flags):
+                newflags = NP.asarray(flags[apol]).astype(NP.bool)
+            else:
+                newflags = NP.asarray([self.antennas[label].antpol.flag[apol] for label in self.ordered_labels], dtype=NP.bool)
+
+            if self.ant2grid_flagged_mapper[apol] is None:
+                mapper = self.ant2grid_mapper[apol].tocsc()
+                mapper.sum_duplicates()
+                self.ant2grid_flagged_mapper[apol] = {}
+                self.ant2grid_flagged_mapper[apol]['mapper'] = mapper
+                self.ant2grid_flagged_mapper[apol]['data'] = NP.copy(mapper.data)
+                self.ant2grid_flagged_mapper[apol]['flags'] = NP.zeros((mapper.shape[1]/nchan, nchan), dtype=NP.bool)
+                self.ant2grid_flagged_mapper[apol]['illumination'] = NP.asarray(mapper.sum(axis=1)).ravel()
+                self.ant2grid_flagged_mapper[apol]['ncontrib'] = NP.bincount(mapper.indices, minlength=mapper.shape[0])
+
+            fmapper = self.ant2grid_flagged_mapper[apol]
+            if newflags.size == fmapper['flags'].shape[0]:
+                newflags = NP.repeat(newflags.reshape(-1,1), nchan, axis=1)
+            elif newflags.size != fmapper['flags'].size:
+                raise ValueError('Number of antenna flags incompatible with the antenna-to-grid mapping matrix')
+            newflags = newflags.reshape(fmapper['flags'].shape)
+
+            # Columns (antenna x nchan + channel) whose flags have changed
+            changed_ind = NP.flatnonzero(newflags != fmapper['flags'])
+            if changed_ind.size > 0:
+                mapper = fmapper['mapper']
+
+                # Indices into the sparse data of all the columns whose flags
+                # have changed
+                colstart = mapper.indptr[changed_ind]
+                colstop = mapper.indptr[changed_ind+1]
+                nnz = colstop - colstart
+                offsets = NP.concatenate(([0], NP.cumsum(nnz)[:-1]))
+                dataind = NP.repeat(colstart - offsets, nnz) + NP.arange(NP.sum(nnz))
+                rowind = mapper.indices[dataind]
+                sign = NP.repeat(NP.where(newflags.ravel()[changed_ind], -1, 1), nnz)
+
+                NP.add.at(fmapper['illumination'], rowind, sign * fmapper['data'][dataind])
+                NP.add.at(fmapper['ncontrib'], rowind, sign)
+                # Grid cells without any unflagged contribution are set to
+                # exactly zero to avoid residuals from the incremental updates
+                fmapper['illumination'][rowind[fmapper['ncontrib'][rowind] == 0]] = 0.0
+                mapper.data[dataind] = NP.where(sign > 0, fmapper['data'][dataind], 0.0)
+                fmapper['flags'] = newflags
+
+            if verbose:
+                print 'Updated flag-masked antenna-to-grid mapping for polarization {0} for {1:0d} antennas with changed flags in {2:0d} channels'.format(apol, NP.unique(changed_ind/nchan).size, changed_ind.size)
+
+    ############################################################################
+
+    def applyMappingMatrix_on_stack(self, pol=None, Ef=None, twts=None,
+                                    tselect=None, dtype='complex128',
+                                    verbose=True):
+
+        """
+        ------------------------------------------------------------------------
+        Constructs the grids of complex field illumination and electric fields
+        of a block of timestamps using the sparse antenna-to-grid mapping 
+        matrix. The electric fields of all the timestamps are mapped to the 
+        grid with a single sparse-dense matrix product per polarization and
+        the results are returned as dense arrays. Polarizations sharing the
+        same mapping matrix object are gridded together in the same product.
+        This is the case only if the mapping matrices were determined with 
+        genMappingMatrix(dualpol=True) and the kernels of both polarizations
+        are identical. Otherwise each polarization is gridded in its own 
+        product. Intended to serve as a batched version of 
+        applyMappingMatrix()
+
+        Inputs:
+
+        pol     [String] The polarization to be gridded. Can be set to 'P1' or 
+                'P2'. If set to None, gridding for all the polarizations is 
+                performed. Default=None
+
+        Ef      [dictionary] Electric fields to be gridded under polarization 
+                keys 'P1' and/or 'P2'. Under each key is a numpy array of shape
+                n_ts x n_ant x nchan where the antennas are ordered as in 
+                attribute ordered_labels. If set to None (default), the 
+                stacked electric fields of the antennas in the timestamps 
+                selected by tselect are used
+
+        twts    [dictionary] Weights along the time axis under polarization 
+                keys 'P1' and/or 'P2'. Under each key is a numpy array of shape
+                n_ts x n_ant x 1. A zero weight flags the antenna in that 
+                timestamp. Applicable only if Ef is specified. If set to None
+                (default), all weights are set to unity.
+
+        tselect [scalar, list, numpy array] timestamp indices into the stacked
+                electric fields of the antennas. Applicable only if Ef is set
+                to None. If set to None (default), all timestamps in the stack
+                are selected
+
+        dtype   [string or numpy dtype] Complex data type of the gridded 
+                illumination and electric fields. Accepted values are 
+                'complex128' (default) and 'complex64' (single precision)
+
+        verbose [boolean] If True, prints diagnostic and progress messages. 
+                If False (default), suppress printing such messages.
+
+        Output:
+
+        Dictionary with keys 'P1' and/or 'P2'. Under each key is another 
+        dictionary with the following keys and values:
+        'illumination'  [numpy array] complex grid illumination of shape
+                        n_ts x nv x nu x nchan
+        'Ef'            [numpy array] complex gridded electric fields of shape
+                        n_ts x nv x nu x nchan
+        ------------------------------------------------------------------------
+        """
+
+        if pol is None:
+            pol = ['P1', 'P2']
+
+        pol = NP.unique(NP.asarray(pol))
+
+        dtype = NP.dtype(dtype)
+        if dtype not in (NP.complex64, NP.complex128):
+            raise ValueError('Input dtype must be complex64 or complex128')
+
+        if Ef is not None:
+            if not isinstance(Ef, dict):
+                raise TypeError('Input parameter Ef must be a dictionary')
+            if twts is not None:
+                if not isinstance(twts, dict):
+                    raise TypeError('Input parameter twts must be a dictionary')
+        else:
+            if tselect is None:
+                tselect = NP.arange(len(self.antennas.itervalues().next().timestamps))
+
+        inpdict = {}
+        for apol in pol:
+
+            if apol not in ['P1', 'P2']:
+                raise ValueError('Invalid specification for input parameter pol')
+
+            if self.ant2grid_mapper[apol] is None:
+                raise ValueError('Antenna-to-grid mapping matrix not found for polarization {0}. Run genMappingMatrix() first.'.format(apol))
 
-            # # Store as dense matrices
-            # self.grid_illumination[apol] = self.ant2grid_mapper[apol].dot(wts).reshape(self.gridu.shape+(self.f.size,))
-            # self.grid_Ef[apol] = self.ant2grid_mapper[apol].dot(Ef).reshape(self.gridu.shape+(self.f.size,))   
-            
             if verbose:
-                print 'Gridded aperture illumination and electric fields for polarization {0} from {1:0d} unflagged contributing antennas'.format(apol, NP.sum(twts).astype(int))
+                print 'Gridding aperture illumination and electric fields for polarization {0} ...'.format(apol)
+
+            if Ef is None:
+                efinfo = self.get_E_fields(apol, flag=None, tselect=tselect, fselect=None, aselect=None, datapool='stack', sort=True)
+                pEf = efinfo['E-fields'].astype(NP.complex64)  # n_ts x n_ant x nchan
+                ptwts = efinfo['twts']  # n_ts x n_ant x 1
+            else:
+                if apol not in Ef:
+                    raise KeyError('Key {0} not found in input parameter Ef'.format(apol))
+                pEf = NP.asarray(Ef[apol])
+                if pEf.ndim != 3:
+                    raise ValueError('Electric fields must be of shape n_ts x n_ant x nchan')
+                if twts is None:
+                    ptwts = NP.ones(pEf.shape[:2]+(1,))
+                elif apol not in twts:
+                    raise KeyError('Key {0} not found in input parameter twts'.format(apol))
+                else:
+                    ptwts = NP.asarray(twts[apol]).reshape(pEf.shape[:2]+(1,))
+
+            n_ts = pEf.shape[0]
+            if pEf.shape[1]*pEf.shape[2] != self.ant2grid_mapper[apol].shape[1]:
+                raise ValueError('Shape of electric fields incompatible with the antenna-to-grid mapping matrix')
+
+            pEf = pEf * ptwts    # applies antenna flagging, n_ts x n_ant x nchan
+            wts = ptwts * NP.ones(pEf.shape[2]).reshape(1,1,-1)  # n_ts x n_ant x nchan
+
+            nan_ind = NP.isnan(pEf)
+            wts[nan_ind] = 0.0
+            pEf[nan_ind] = 0.0
+
+            inpdict[apol] = {'wts': wts.reshape(n_ts,-1).T, 'Ef': pEf.reshape(n_ts,-1).T, 'n_ts': n_ts}
+
+        # A single sparse-dense product maps the weights and electric fields 
+        # of all timestamps and of all polarizations that share the same 
+        # mapping matrix (see input dualpol in genMappingMatrix()). The 
+        # result of shape (nv x nu x nchan) x ncols is split and rearranged 
+        # to n_ts x nv x nu x nchan for each polarization
+        outdict = {}
+        remaining_pol = pol.tolist()
+        while len(remaining_pol) > 0:
+            mapper = self.ant2grid_mapper[remaining_pol[0]]
+            jointpol = [apol for apol in remaining_pol if self.ant2grid_mapper[apol] is mapper]
+            remaining_pol = [apol for apol in remaining_pol if apol not in jointpol]
+            gridded = mapper.dot(NP.hstack([NP.hstack((inpdict[apol]['wts'], inpdict[apol]['Ef'])) for apol in jointpol])).astype(dtype, copy=False)
+            colind = 0
+            for apol in jointpol:
+                n_ts = inpdict[apol]['n_ts']
+                outdict[apol] = {}
+                outdict[apol]['illumination'] = gridded[:,colind:colind+n_ts].T.reshape((n_ts,)+self.gridu.shape+(self.f.size,))
+                outdict[apol]['Ef'] = gridded[:,colind+n_ts:colind+2*n_ts].T.reshape((n_ts,)+self.gridu.shape+(self.f.size,))
+                colind += 2 * n_ts
+
+                if verbose:
+                    print 'Gridded aperture illumination and electric fields for polarization {0} over {1:0d} timestamps'.format(apol, n_ts)
+
+        return outdict
 
     ############################################################################
 
@@ -10937,21 +13979,31 @@ class AntennaArray:
 
     ############################################################################ 
 
-    def make_grid_cube_new(self, pol=None, verbose=True):
+    def make_grid_cube_new(self, pol=None, dtype='complex128', verbose=True):
 
         """
         ------------------------------------------------------------------------
-        Constructs the grid of complex field illumination and electric fields 
-        using the gridding information determined for every antenna. Flags are 
-        taken into account while constructing this grid.
+        Constructs the grid of complex field illumination and electric fields
+        using the gridding information determined for every antenna. Flags are
+        taken into account while constructing this grid. Contributions from
+        all unflagged antennas are accumulated in a single pass over the
+        flattened (v,u,f) grid indices stored in key 'vuf_gridind_raveled' of
+        attribute grid_mapper[pol]['all_ant2grid'], so that contributions
+        falling on the same grid cell are all summed.
 
         Inputs:
 
-        pol     [String] The polarization to be gridded. Can be set to 'P1' or 
-                'P2'. If set to None, gridding for all the polarizations is 
+        pol     [String] The polarization to be gridded. Can be set to 'P1' or
+                'P2'. If set to None, gridding for all the polarizations is
                 performed. Default=None
-        
-        verbose [boolean] If True, prints diagnostic and progress messages. 
+
+        dtype   [string or numpy dtype] Complex data type of the gridded 
+                illumination and electric fields. Accepted values are 
+                'complex128' (default) and 'complex64' (single precision). 
+                Contributions are accumulated in double precision in either 
+                case
+
+        verbose [boolean] If True, prints diagnostic and progress messages.
                 If False (default), suppress printing such messages.
         ------------------------------------------------------------------------
         """
@@ -10960,7 +14012,11 @@ class AntennaArray:
             pol = ['P1', 'P2']
 
         pol = NP.unique(NP.asarray(pol))
-        
+
+        dtype = NP.dtype(dtype)
+        if dtype not in (NP.complex64, NP.complex128):
+            raise ValueError('Input dtype must be complex64 or complex128')
+
         for apol in pol:
 
             if verbose:
@@ -10971,29 +14027,26 @@ class AntennaArray:
 
             if apol not in self._ant_contribution:
                 raise KeyError('Key {0} not found in attribute _ant_contribution'.format(apol))
-    
-            self.grid_illumination[apol] = NP.zeros((self.gridu.shape + (self.f.size,)), dtype=NP.complex_)
-            self.grid_Ef[apol] = NP.zeros((self.gridu.shape + (self.f.size,)), dtype=NP.complex_)
-    
-            nlabels = len(self.grid_mapper[apol]['per_ant2grid'])
-            loopcount = 0
-            num_unflagged = 0
-            if verbose:
-                progress = PGB.ProgressBar(widgets=[PGB.Percentage(), PGB.Bar(marker='-', left=' |', right='| '), PGB.Counter(), '/{0:0d} Antennas '.format(nlabels), PGB.ETA()], maxval=nlabels).start()
-            for ai,per_ant2grid_info in enumerate(self.grid_mapper[apol]['per_ant2grid']):
-                antlabel = per_ant2grid_info['label']
-                if not self.antennas[antlabel].antpol.flag[apol]:
-                    num_unflagged += 1
-                    vuf_gridind_unraveled = (per_ant2grid_info['v_gridind'],per_ant2grid_info['u_gridind'],per_ant2grid_info['f_gridind'])
-                    self.grid_illumination[apol][vuf_gridind_unraveled] += per_ant2grid_info['per_ant_per_freq_norm_wts'] * per_ant2grid_info['illumination']
-                    self.grid_Ef[apol][vuf_gridind_unraveled] += per_ant2grid_info['per_ant_per_freq_norm_wts'] * per_ant2grid_info['Ef'] * per_ant2grid_info['illumination']
 
-                if verbose:
-                    progress.update(loopcount+1)
-                    loopcount += 1
-            if verbose:
-                progress.finish()
-                
+            all_ant2grid = self.grid_mapper[apol]['all_ant2grid']
+            if not all_ant2grid:
+                raise KeyError('Antenna-to-grid mapping not found for polarization {0}. Run grid_convolve_new() first.'.format(apol))
+            if 'vuf_gridind_raveled' not in all_ant2grid:
+                all_ant2grid['vuf_gridind_raveled'] = NP.ravel_multi_index((all_ant2grid['v_gridind'], all_ant2grid['u_gridind'], all_ant2grid['f_gridind']), self.gridu.shape+(self.f.size,))
+
+            ant_labels = [per_ant2grid_info['label'] for per_ant2grid_info in self.grid_mapper[apol]['per_ant2grid']]
+            ant_unflagged = NP.asarray([not self.antennas[antlabel].antpol.flag[apol] for antlabel in ant_labels], dtype=NP.bool)
+            num_unflagged = NP.sum(ant_unflagged)
+
+            select_ind = ant_unflagged[all_ant2grid['antind']]
+            vuf_gridind_raveled = all_ant2grid['vuf_gridind_raveled'][select_ind]
+            wtd_illumination = all_ant2grid['per_ant_per_freq_norm_wts'][select_ind] * all_ant2grid['illumination'][select_ind]
+            wtd_Ef = wtd_illumination * all_ant2grid['Ef'][select_ind]
+
+            self.grid_illumination[apol] = grid_scatter_add(vuf_gridind_raveled, wtd_illumination, self.gridu.size*self.f.size).astype(dtype).reshape(self.gridu.shape+(self.f.size,))
+            self.grid_Ef[apol] = grid_scatter_add(vuf_gridind_raveled, wtd_Ef, self.gridu.size*self.f.size).astype(dtype).reshape(self.gridu.shape+(self.f.size,))
+            self.grid_illumination_state[apol] = {'mapper': all_ant2grid, 'wts': ant_unflagged}
+
             if verbose:
                 print 'Gridded aperture illumination and electric fields for polarization {0} from {1:0d} unflagged contributing antennas'.format(apol, num_unflagged)
 
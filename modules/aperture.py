@@ -752,9 +752,13 @@ class Aperture(object):
     __init__()  Initializes an instance of class Aperture which manages
                 information about an antenna or interferometer aperture
 
-    compute()   Estimates the kernel for given locations based on the aperture 
+    compute()   Estimates the kernel for given locations based on the aperture
                 attributes
 
+    signature() Returns a hashable summary of the aperture parameters that
+                determine the kernel. Apertures with identical signatures
+                produce identical kernels
+
     Read the member function docstrings for details.
     ----------------------------------------------------------------------------
     """
@@ -1061,6 +1065,47 @@ class Aperture(object):
             
     ############################################################################
 
+    def signature(self, pol=None):
+
+        """
+        ------------------------------------------------------------------------
+        Returns a hashable summary of the aperture parameters that determine
+        the kernel estimated by member function compute(). Two apertures with
+        equal signatures produce identical kernels for identical inputs.
+
+        Inputs:
+
+        pol     [string or list] The polarization(s) for which the signature is
+                to be determined. If set to None (default), all polarizations
+                in attribute pol are included
+
+        Outputs:
+
+        Tuple containing one tuple per polarization with the polarization,
+        kernel type, shape, xmax, ymax, rmin, rmax, rotangle and lookup table
+        information
+        ------------------------------------------------------------------------
+        """
+
+        if pol is None:
+            pol = self.pol
+        elif not isinstance(pol, list):
+            pol = [pol]
+
+        sig = []
+        for p in pol:
+            if p not in self.pol:
+                raise ValueError('Invalid value specified for pol')
+            if p in self.lkpinfo:
+                lkp = repr(self.lkpinfo[p])
+            else:
+                lkp = None
+            sig += [(p, self.kernel_type[p], self.shape[p], self.xmax[p], self.ymax[p], self.rmin[p], self.rmax[p], self.rotangle[p], lkp)]
+
+        return tuple(sig)
+
+    ############################################################################
+
         
         
             